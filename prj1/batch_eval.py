@@ -1,138 +1,198 @@
 '''
 a program for evaluating the quality of search algorithms using the vector model
 
-it runs over all queries in query.text and get the top 10 results,
-and then qrels.text is used to compute the NDCG metric
+it runs over all queries in query.text and get the top k results,
+and then qrels.text is used to compute the NDCG@k, P@k, recall and MAP metrics
 
 usage:
-    python batch_eval.py index_file query.text qrels.text n
+    python batch_eval.py index_file query.text qrels.text n [--workers N] [--k K] [--seed S]
+        [--resamples R] [--confidence C]
 
     output is the average NDCG over all the queries for boolean model and vector model respectively.
-	also compute the p-value of the two ranking results. 
+	also compute the p-value of the two ranking results, and permutation test p-values and
+	bootstrap confidence intervals of every metric.
 '''
-import metrics
 import time
 import query as q
 import sys
 import index as inverted_ind
+import diskindex
 import cranqry
 import random
+import argparse
 from scipy import stats as stats
 import numpy as np
 import cran
+import instrument
+import evaluation
+import significance
+import doc as d
 from index import IndexItem
 from index import Posting
 
 
-def eval(index_filename, query_filename, relevant_filename, n):
-    '''Evaluates performance of boolean and vector query models by determining 
-    whether returned relevant documents match expected results as defined in
-    qrels.text. The results are scored using NDCG and the scores are compared
-    statistically using T-Tests and Wilcoxon Tests.'''
+def eval(index_filename, query_filename, relevant_filename, n, workers=1, query_stats=None, profiler=None, k=10,
+         seed=None, n_resamples=10000, confidence=0.95):
+    '''Evaluates performance of boolean and vector query models by comparing
+    their first k results with the relevant documents listed in qrels.text.
+    The whole runs are scored at once with evaluation.evaluate (NDCG@k, P@k,
+    recall and MAP) and the NDCG of each query is compared statistically
+    using T-Tests and Wilcoxon Tests. Every metric is also compared with a
+    paired permutation test, and given bootstrap confidence intervals, from
+    n_resamples resamples of the queries. Boolean queries and resamples are
+    run in the given number of worker processes; seed makes the sample of
+    queries and the resamples reproducible. The query stats are added to
+    query_stats, an instrument.StatsAggregator, and slow queries are
+    reported to profiler, an instrument.SlowQueryProfiler, if given.'''
     
     # Load necessary files
-    filename = 'cran.all'
-    collection = cran.CranFile(filename)
+    collection = d.openCollection(index_filename, 'cran.all')
     
-    inverted_index = inverted_ind.InvertedIndex()
-    inverted_index.load(index_filename)
+    inverted_index = diskindex.openIndex(index_filename)
     
     queries = cranqry.loadCranQry(query_filename)
-    n_queries = random.sample(list(queries.values()), n)
+    n_queries = random.Random(seed).sample(list(queries.values()), n)
     
-    f = open(relevant_filename, 'r')
-    data = f.readlines()
-    f.close()
-    
-    # Puts the qrels data into a dictionary such that there is easy access
-    # to a complete list of relevant documents for a given query. This
-    # makes scoring easier
-    qrels = {}
-    qrels_list = []
-    i = 0
-    for line in data:
-        line = line.split()
-        if int(line[0]) not in qrels.keys():
-            i = int(line[0])
-            if qrels == {}:
-                qrels_list.append(int(line[1]))
-                qrels.update({i : qrels_list})
-            
-            else:
-                qrels_list = []
-                qrels_list.append(int(line[1]))
-                qrels.update({i : qrels_list})
-                
-        else:
-            qrels_list.append(int(line[1]))
+    qrels = evaluation.loadQrels(relevant_filename)
+    qids = [int(query.qid) for query in n_queries]
+    docIDs, grades = evaluation.qrelsArrays(qrels, qids)
             
     # Evaluate models
-    avg_score_boolean = 0
-    avg_score_vector = 0
-    boolean_scores = []
-    vector_scores = []
-    for query in n_queries:
-        query_processor = q.QueryProcessor(query.text, inverted_index, collection)
-        results_boolean = query_processor.booleanQuery()
-        
-        # For instances where there are less than 3 relevant docs recorded in
-        # qrels, we will adjust the number of returned relevant documents
-        # to match the number in qrels. Otherwise an indexing error occurs
-        if len(qrels[int(query.qid)]) >= 3:
-            results = query_processor.vectorQuery(3)
-        else:
-            results = query_processor.vectorQuery(len(qrels[int(query.qid)]))
-        
-        # Pull the doc IDs from the vector results
-        results_vector = []
-        for result in results:
-            results_vector.append(result[0])
-            
-        # Score results using NDCG scoring
-        score_boolean = metrics.ndcg_score(qrels[int(query.qid)], results_boolean)       
-        score_vector = metrics.ndcg_score(qrels[int(query.qid)], results_vector)
-            
-        boolean_scores.append(score_boolean)
-        vector_scores.append(score_vector)
-        
-        avg_score_boolean += score_boolean
-        avg_score_vector += score_vector
-        
-    # Take the average of the scores
-    boolean_score = avg_score_boolean / n
-    vector_score = avg_score_vector / n
+    query_processor = q.QueryProcessor('', inverted_index, collection, instrumented=query_stats is not None,
+                                       profiler=profiler)
+    
+    # Score all vector queries at once
+    results_vectors = query_processor.batchVectorQuery([query.text for query in n_queries], k)
+    if query_stats is not None:
+        query_stats.add(query_processor.stats)
+    results_booleans = q.run_batch(inverted_index, [query.text for query in n_queries], 0, workers=workers,
+                                   stats=query_stats, profiler=profiler)
+    
+    # Score both runs, keeping the first k boolean results
+    scores_boolean = evaluation.evaluate(evaluation.runArray(results_booleans, k), docIDs, grades, k)
+    scores_vector = evaluation.evaluate(evaluation.runArray(results_vectors, k), docIDs, grades, k)
+    boolean_scores = scores_boolean['ndcg@%d' % k]
+    vector_scores = scores_vector['ndcg@%d' % k]
     
     # Run T-Tests and Wilcoxon Tests on the results
     t_stat, t_p = stats.ttest_ind(boolean_scores, vector_scores)
     w_stat, w_p = stats.wilcoxon(boolean_scores, vector_scores)
     
-    print("Boolean Score: %4.4f Vector Score: %4.4f T-Test p: %4.4f, Wilcoxon p: %4.4f" % (boolean_score, vector_score, t_p, w_p))
+    for name, scores in [('Boolean', scores_boolean), ('Vector', scores_vector)]:
+        summary = evaluation.summarize(scores)
+        print("%s NDCG@%d: %4.4f P@%d: %4.4f Recall: %4.4f MAP: %4.4f" %
+              (name, k, summary['ndcg@%d' % k], k, summary['p@%d' % k], summary['recall'], summary['map']))
+    print("Boolean Score: %4.4f Vector Score: %4.4f T-Test p: %4.4f, Wilcoxon p: %4.4f" %
+          (boolean_scores.mean(), vector_scores.mean(), t_p, w_p))
+    
+    # Paired permutation tests and bootstrap confidence intervals of every
+    # metric, resampling the same queries for both models
+    print("%d resamples, %d%% confidence intervals" % (n_resamples, round(confidence * 100)))
+    for metric in scores_boolean:
+        boolean_metric = scores_boolean[metric]
+        vector_metric = scores_vector[metric]
+        means, lows, highs = significance.bootstrapCI(
+            np.vstack([boolean_metric, vector_metric, vector_metric - boolean_metric]), n_resamples, confidence,
+            seed, workers=workers)
+        difference, p = significance.permutationTest(vector_metric, boolean_metric, n_resamples, seed,
+                                                     workers=workers)
+        print("%-8s Boolean: %4.4f [%4.4f, %4.4f] Vector: %4.4f [%4.4f, %4.4f] "
+              "Difference: %+4.4f [%+4.4f, %+4.4f] Permutation p: %4.4f" %
+              (metric, means[0], lows[0], highs[0], means[1], lows[1], highs[1],
+               difference, lows[2], highs[2], p))
     
-def time_evaluation(queries, query_processor):
-    ''' Used to evaluate the processing time of both boolean and vector models.'''
+def time_evaluation(queries, query_processor, workers=1, k=3, query_stats=None, profiler=None):
+    ''' Used to evaluate the processing time of both boolean and vector models.
+    Returns the total time in seconds of the boolean queries and of the
+    vector queries returning k results. With more than one worker, the time
+    is that of running all queries of a model with query.run_batch. Either
+    way no result or preprocessing cache is used, so that both models pay
+    for spell checking and scoring every query. See benchmark.py for
+    latency percentiles. The stats of every query are added to
+    query_stats, an instrument.StatsAggregator, and slow queries are
+    reported to profiler, an instrument.SlowQueryProfiler, if given.'''
+
+    if workers > 1:
+        texts = [query.text for query in queries]
+        time_start_boolean = time.perf_counter_ns()
+        q.run_batch(query_processor.index, texts, 0, workers=workers, speller=query_processor.speller,
+                    stats=query_stats, profiler=profiler, cached=False)
+        time_start_vector = time.perf_counter_ns()
+        q.run_batch(query_processor.index, texts, 1, k, workers=workers, speller=query_processor.speller,
+                    stats=query_stats, profiler=profiler, cached=False)
+        time_stop_vector = time.perf_counter_ns()
+        return ((time_start_vector - time_start_boolean) / 1e9, (time_stop_vector - time_start_vector) / 1e9)
 
     total_time_boolean = 0
     total_time_vector = 0
-        
-    for query in queries:
-        query_processor.raw_query = query.text
+    
+    # Instrument the timed queries only, bypass the caches, and leave the
+    # processor as it was
+    saved = (query_processor.instrumented, query_processor.profiler, query_processor.result_cache,
+             query_processor.preprocess_cache)
+    query_processor.instrumented = query_stats is not None
+    query_processor.profiler = profiler
+    query_processor.result_cache = None
+    query_processor.preprocess_cache = None
+    try:
+        for query in queries:
+            query_processor.raw_query = query.text
+                
+            # Time boolean model
+            time_start_boolean = time.perf_counter_ns()
+            query_processor.booleanQuery()
+            time_stop_boolean = time.perf_counter_ns()
+            time_boolean = time_stop_boolean - time_start_boolean
+            total_time_boolean += time_boolean
+            if query_stats is not None:
+                query_stats.add(query_processor.stats)
             
-        # Time boolean model
-        time_start_boolean = time.clock()
-        query_processor.booleanQuery()
-        time_stop_boolean = time.clock()
-        time_boolean = time_stop_boolean - time_start_boolean
-        total_time_boolean += time_boolean
+            # Time vector model
+            time_start_vector = time.perf_counter_ns()
+            query_processor.vectorQuery(k)
+            time_stop_vector = time.perf_counter_ns()
+            time_vector = time_stop_vector - time_start_vector
+            total_time_vector += time_vector
+            if query_stats is not None:
+                query_stats.add(query_processor.stats)
+    finally:
+        (query_processor.instrumented, query_processor.profiler, query_processor.result_cache,
+         query_processor.preprocess_cache) = saved
         
-        # Time vector model
-        time_start_vector = time.clock()
-        query_processor.vectorQuery(3)
-        time_stop_vector = time.clock()
-        time_vector = time_stop_vector - time_start_vector
-        total_time_vector += time_vector
-        
-    return (total_time_boolean, total_time_vector)
+    return (total_time_boolean / 1e9, total_time_vector / 1e9)
 
 if __name__ == '__main__':
 #    eval('output.p', 'query.text', 'corrected_qrels.text', 50)
-    eval(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    parser = argparse.ArgumentParser(description='evaluate the boolean and vector models')
+    parser.add_argument('index_filename')
+    parser.add_argument('query_filename')
+    parser.add_argument('relevant_filename')
+    parser.add_argument('n', type=int, help='number of queries to evaluate')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes for boolean queries and resamples')
+    parser.add_argument('--k', type=int, default=10,
+                        help='number of results of each query to score')
+    parser.add_argument('--seed', type=int,
+                        help='seed of the sample of queries and of the resamples, for reproducible runs')
+    parser.add_argument('--resamples', type=int, default=10000,
+                        help='number of resamples of the permutation tests and bootstrap intervals')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='confidence level of the bootstrap intervals')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='write the per-stage timings and counters of the queries to this JSON file')
+    parser.add_argument('--profile-ms', type=float, metavar='MS',
+                        help='profile the queries and add those slower than MS milliseconds to the --stats file')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='also trace the memory allocations of profiled queries')
+    args = parser.parse_args()
+
+    query_stats = None
+    profiler = None
+    if args.stats is not None:
+        query_stats = instrument.StatsAggregator()
+        if args.profile_ms is not None:
+            profiler = instrument.SlowQueryProfiler(args.profile_ms, args.profile_memory)
+    eval(args.index_filename, args.query_filename, args.relevant_filename, args.n, args.workers,
+         query_stats, profiler, args.k, args.seed, args.resamples, args.confidence)
+    if args.stats is not None:
+        instrument.dump(args.stats, query_stats, profiler)
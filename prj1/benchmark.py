@@ -0,0 +1,491 @@
+'''
+
+Benchmark suite
+
+Times the main operations of the search engine on the Cranfield collection
+and on synthetic collections scaled up from it, and writes the results as
+JSON so that two runs can be compared:
+
+    index_build     indexDoc throughput, and the latency of each call
+    index_pipeline  indexingCranfield on the collection file, end to end
+    save, load      saving and loading the in-memory index
+    disk_write, disk_open   writing and opening the on-disk index
+    find            dictionary lookups, half of them for unknown terms
+    boolean         boolean queries from query.text
+    vector_k<k>     top k vector queries from query.text
+    impact_write    writing the impact-ordered index of impact.py
+    impact_k<k>     top k impact queries, exhaustive and with posting budgets,
+                    and the fraction of the vector query results they return
+    spelling        norvig and symspell corrections of misspelled query words
+
+Synthetic collections draw document lengths and words from the empirical
+distributions of cran.all. Words that occur once in cran.all are replaced
+by new words, so the vocabulary keeps growing with the collection as in
+real text. They are written in the Cranfield format and indexed from the
+file like cran.all.
+
+Times are measured with time.perf_counter_ns. Latencies are reported as
+percentiles in microseconds. Queries are timed with the result cache
+disabled and their preprocessing already cached, so they measure query
+processing itself; spelling correction is measured separately.
+
+usage:
+    python benchmark.py [--scales 10 100] [--queries 100] [--output results.json]
+    python benchmark.py --compare baseline.json results.json
+
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import unittest
+from collections import Counter
+import numpy as np
+
+import util
+import cran
+import cranqry
+import doc as d
+import index as inverted_ind
+import diskindex
+import impact
+import query as q
+import norvig_spell
+import symspell
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FORMAT = 'benchmark-1'
+IMPACT_BUDGETS = (None, 1000, 10000) # posting budgets of the impact queries, None for no budget
+
+
+def summarize(samples_ns):
+    ''' return the count, mean and percentiles in microseconds of a list of
+    durations in nanoseconds'''
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1000
+    if len(samples) == 0:
+        return {'count': 0}
+    return {'count': len(samples),
+            'mean_us': float(samples.mean()),
+            'p50_us': float(np.percentile(samples, 50)),
+            'p90_us': float(np.percentile(samples, 90)),
+            'p99_us': float(np.percentile(samples, 99)),
+            'max_us': float(samples.max())}
+
+
+def timeEach(function, items):
+    ''' call function on each item and return the duration of each call in
+    nanoseconds'''
+    samples = []
+    for item in items:
+        start = time.perf_counter_ns()
+        function(item)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def timeOnce(function, *args):
+    ''' return the result of function(*args) and its duration in nanoseconds'''
+    start = time.perf_counter_ns()
+    result = function(*args)
+    return result, time.perf_counter_ns() - start
+
+
+class CorpusModel:
+    ''' the document length and word distributions of a collection, from
+    which synthetic collections are generated'''
+
+    def __init__(self, words, counts, lengths):
+        ''' words are the distinct words, counts their number of occurrences
+        and lengths the number of words of each document'''
+        self.words = words
+        self.probabilities = np.asarray(counts, dtype=np.float64) / sum(counts)
+        self.rare = np.asarray(counts) == 1 # words replaced by new words
+        self.lengths = np.asarray(lengths)
+
+    @classmethod
+    def fromDocs(cls, docs):
+        counts = Counter()
+        lengths = []
+        for doc in docs:
+            words = doc.body.split()
+            counts.update(words)
+            lengths.append(len(words))
+        words = sorted(counts)
+        return cls(words, [counts[word] for word in words], lengths)
+
+    def generate(self, n_docs, seed=0, chunk_size=1000):
+        ''' yield n_docs synthetic Documents, with docIDs from 1'''
+        rng = np.random.default_rng(seed)
+        n_new = 0
+        docID = 0
+        while docID < n_docs:
+            lengths = rng.choice(self.lengths, size=min(chunk_size, n_docs - docID))
+            sample = rng.choice(len(self.words), size=int(lengths.sum()), p=self.probabilities)
+            start = 0
+            for length in lengths:
+                words = []
+                for word_id in sample[start:start + length]:
+                    if self.rare[word_id]:
+                        n_new += 1
+                        words.append('syn%x' % n_new)
+                    else:
+                        words.append(self.words[word_id])
+                start += length
+                docID += 1
+                yield d.Document(str(docID), ' '.join(words[:8]), 'synthetic', ' '.join(words))
+
+
+def writeCorpus(docs, filename, words_per_line=10):
+    ''' write Documents to filename in the Cranfield format'''
+    f = open(filename, 'w', buffering=cran.BUFFER_SIZE, encoding=cran.ENCODING)
+    for doc in docs:
+        words = doc.body.split()
+        f.write('.I %s\n.T\n%s\n.A\n%s\n.B\n\n.W\n' % (doc.docID, doc.title, doc.author))
+        for i in range(0, len(words), words_per_line):
+            f.write(' '.join(words[i:i + words_per_line]))
+            f.write('\n')
+    f.close()
+
+
+def misspell(words, seed=0):
+    ''' return each word with one random deletion, transposition,
+    replacement or insertion'''
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    misspelled = []
+    for word in words:
+        i = rng.randrange(len(word) - 1)
+        edit = rng.randrange(4)
+        if edit == 0:
+            word = word[:i] + word[i + 1:]
+        elif edit == 1:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        elif edit == 2:
+            word = word[:i] + rng.choice(letters) + word[i + 1:]
+        else:
+            word = word[:i] + rng.choice(letters) + word[i:]
+        misspelled.append(word)
+    return misspelled
+
+
+def environment():
+    ''' describe the machine and the code being measured'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'commit': commit}
+
+
+class Benchmark:
+    ''' runs the benchmarks and collects one result record per benchmark'''
+
+    def __init__(self, queries, ks=(10,), n_finds=10000, skip=(), seed=0):
+        ''' queries are the query texts; ks the numbers of results of the
+        vector queries; skip the names of benchmarks not to run'''
+        self.queries = queries
+        self.ks = ks
+        self.n_finds = n_finds
+        self.skip = set(skip)
+        self.seed = seed
+        self.results = []
+
+    def record(self, corpus, benchmark, variant=None, **values):
+        name = '%s/%s' % (corpus, benchmark)
+        if variant is not None:
+            name += '/' + variant
+        result = {'name': name, 'corpus': corpus, 'benchmark': benchmark}
+        if variant is not None:
+            result['variant'] = variant
+        result.update(values)
+        self.results.append(result)
+        return result
+
+    def runCorpus(self, corpus, doc_filename, tmp_dir):
+        ''' run the indexing, storage, find and query benchmarks on a
+        collection file'''
+        corpus_bytes = os.path.getsize(doc_filename)
+
+        # Index the documents one at a time, streamed from the file
+        inverted_index = inverted_ind.InvertedIndex()
+        n_tokens = [0]
+        def indexDoc(doc):
+            n_tokens[0] += inverted_index.indexDoc(doc)
+        samples = timeEach(indexDoc, cran.iter_docs(doc_filename))
+        _, sort_ns = timeOnce(inverted_index.sort)
+        n_docs = len(samples)
+        seconds = (sum(samples) + sort_ns) / 1e9
+        self.record(corpus, 'index_build', n_docs=n_docs, n_tokens=n_tokens[0],
+                    n_terms=len(inverted_index.items), seconds=seconds,
+                    docs_per_s=n_docs / seconds, tokens_per_s=n_tokens[0] / seconds,
+                    **summarize(samples))
+        _, norms_ns = timeOnce(lambda: (inverted_index.norms(), inverted_index.maxWeights()))
+        self.record(corpus, 'norms', seconds=norms_ns / 1e9)
+
+        if 'index_pipeline' not in self.skip:
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                _, ns = timeOnce(inverted_ind.indexingCranfield, doc_filename, os.path.join(tmp_dir, 'pipeline.p'))
+            self.record(corpus, 'index_pipeline', seconds=ns / 1e9, docs_per_s=n_docs / (ns / 1e9),
+                        mb_per_s=corpus_bytes / 2**20 / (ns / 1e9))
+
+        # Save and load
+        index_filename = os.path.join(tmp_dir, 'index.p')
+        _, ns = timeOnce(inverted_index.save, index_filename)
+        self.record(corpus, 'save', seconds=ns / 1e9, bytes=os.path.getsize(index_filename))
+        loaded_index = inverted_ind.InvertedIndex()
+        _, ns = timeOnce(loaded_index.load, index_filename)
+        self.record(corpus, 'load', seconds=ns / 1e9)
+        del loaded_index
+
+        disk_filename = os.path.join(tmp_dir, 'index.idx')
+        _, ns = timeOnce(diskindex.writeDiskIndex, inverted_index, disk_filename)
+        self.record(corpus, 'disk_write', seconds=ns / 1e9, bytes=os.path.getsize(disk_filename))
+        disk_index, ns = timeOnce(diskindex.openIndex, disk_filename)
+        self.record(corpus, 'disk_open', seconds=ns / 1e9)
+
+        indexes = [('memory', inverted_index), ('disk', disk_index)]
+
+        # Dictionary lookups, timed in batches as a single lookup takes
+        # about as long as reading the clock; the latencies are per lookup
+        rng = random.Random(self.seed)
+        terms = [item.term for item in inverted_index.items]
+        terms = [rng.choice(terms) for _ in range(self.n_finds // 2)]
+        terms += ['%s#%d' % (term, i) for i, term in enumerate(terms)]
+        rng.shuffle(terms)
+        batch = 100
+        for variant, ind in indexes:
+            samples = timeEach(lambda start: [ind.find(term) for term in terms[start:start + batch]],
+                               range(0, len(terms), batch))
+            self.record(corpus, 'find', variant, batch_size=batch,
+                        **summarize(np.asarray(samples) / batch))
+
+        # Queries, with their preprocessing cached by a first untimed run
+        for variant, ind in indexes:
+            query_processor = q.QueryProcessor('', ind, None, result_cache=None)
+            for text in self.queries:
+                query_processor.preprocessText(text)
+
+            def booleanQuery(text):
+                query_processor.raw_query = text
+                query_processor.booleanQuery()
+            if 'boolean' not in self.skip:
+                self.record(corpus, 'boolean', variant, **summarize(timeEach(booleanQuery, self.queries)))
+
+            for k in self.ks:
+                def vectorQuery(text):
+                    query_processor.raw_query = text
+                    query_processor.vectorQuery(k)
+                if 'vector' not in self.skip:
+                    self.record(corpus, 'vector_k%d' % k, variant,
+                                **summarize(timeEach(vectorQuery, self.queries)))
+
+        if 'impact' not in self.skip:
+            self.runImpact(corpus, inverted_index, tmp_dir)
+        disk_index.close()
+
+        for result in self.results:
+            if result['corpus'] == corpus:
+                result.setdefault('n_docs', n_docs)
+                result['corpus_bytes'] = corpus_bytes
+
+    def runImpact(self, corpus, inverted_index, tmp_dir):
+        ''' time impact queries, exhaustive and with each posting budget'''
+        impact_filename = os.path.join(tmp_dir, 'index.impact')
+        _, ns = timeOnce(impact.writeImpactIndex, inverted_index, impact_filename)
+        self.record(corpus, 'impact_write', seconds=ns / 1e9, bytes=os.path.getsize(impact_filename))
+        impact_index = impact.ImpactIndex(impact_filename)
+        query_processor = q.QueryProcessor('', inverted_index, None, result_cache=None, impact_index=impact_index)
+        for k in self.ks:
+            expected = []
+            for text in self.queries:
+                query_processor.raw_query = text
+                expected.append(set(doc for doc, score in query_processor.vectorQuery(k)))
+            for budget in IMPACT_BUDGETS:
+                results = []
+                def impactQuery(text):
+                    query_processor.raw_query = text
+                    results.append(set(doc for doc, score in query_processor.impactQuery(k, budget)))
+                samples = timeEach(impactQuery, self.queries)
+                overlap = [len(found & wanted) / len(wanted) for found, wanted in zip(results, expected) if wanted]
+                self.record(corpus, 'impact_k%d' % k, 'all' if budget is None else 'budget%d' % budget,
+                            overlap=float(np.mean(overlap)) if overlap else 1.0, **summarize(samples))
+        impact_index.close()
+
+    def runSpelling(self, words):
+        ''' time the spelling correctors on misspelled words'''
+        _, ns = timeOnce(norvig_spell.getWords)
+        self.record('spelling', 'load', 'norvig', seconds=ns / 1e9)
+        _, ns = timeOnce(symspell.getSymSpell)
+        self.record('spelling', 'load', 'symspell', seconds=ns / 1e9)
+        self.record('spelling', 'correction', 'norvig',
+                    **summarize(timeEach(norvig_spell.correction, words)))
+        self.record('spelling', 'correction', 'symspell',
+                    **summarize(timeEach(symspell.correction, words)))
+
+
+def runBenchmarks(doc_filename='cran.all', query_filename='query.text', scales=(10,), n_queries=100,
+                  ks=(10,), skip=(), seed=0, tmp_dir=None):
+    ''' run the benchmarks on doc_filename and on synthetic collections
+    scaled from it, and return the results'''
+    queries = [query.text for query in cranqry.iter_queries(query_filename)]
+    queries = random.Random(seed).sample(queries, min(n_queries, len(queries)))
+    benchmark = Benchmark(queries, ks, skip=skip, seed=seed)
+
+    # First, as the queries load the spelling dictionary
+    if 'spelling' not in skip:
+        words = [word for text in queries for word in util.tokenize(text) if len(word) >= 5 and word.isalpha()]
+        benchmark.runSpelling(misspell(words, seed))
+
+    model = None
+    tmp_dir = tempfile.mkdtemp(prefix='benchmark', dir=tmp_dir)
+    try:
+        corpora = [('cranfield', doc_filename, None)]
+        corpora += [('synthetic-x%d' % scale, os.path.join(tmp_dir, 'synthetic.all'), scale) for scale in scales]
+        for corpus, filename, scale in corpora:
+            if scale is not None:
+                if model is None:
+                    model = CorpusModel.fromDocs(cran.iter_docs(doc_filename))
+                writeCorpus(model.generate(scale * len(model.lengths), seed), filename)
+            benchmark.runCorpus(corpus, filename, tmp_dir)
+            for name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, name))
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {'format': FORMAT, 'environment': environment(),
+            'settings': {'scales': list(scales), 'queries': len(queries), 'ks': list(ks), 'seed': seed},
+            'results': benchmark.results}
+
+
+# The main measure of each result, the first of these it has; lower is better
+MEASURES = ('seconds', 'p50_us')
+
+def compare(old, new, threshold=0.1):
+    ''' compare two runs and return (name, measure, old value, new value,
+    relative change, regressed) for each result found in both; a result
+    regressed if its measure grew by more than threshold'''
+    old_results = {result['name']: result for result in old['results']}
+    changes = []
+    for result in new['results']:
+        previous = old_results.get(result['name'])
+        if previous is None:
+            continue
+        for measure in MEASURES:
+            if measure in result and measure in previous and previous[measure] > 0:
+                change = result[measure] / previous[measure] - 1
+                changes.append((result['name'], measure, previous[measure], result[measure], change,
+                                change > threshold))
+                break
+    return changes
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_summarize(self):
+        summary = summarize([1000, 2000, 3000, 4000])
+        assert summary['count'] == 4
+        assert summary['mean_us'] == 2.5
+        assert summary['p50_us'] == 2.5
+        assert summary['max_us'] == 4.0
+
+    def test_synthetic_corpus(self):
+        docs = [d.Document('1', 'a', 'me', 'wing flow wing shock'),
+                d.Document('2', 'b', 'me', 'flow over the wing')]
+        model = CorpusModel.fromDocs(docs)
+        generated = list(model.generate(5, seed=1, chunk_size=2))
+        assert [doc.docID for doc in generated] == ['1', '2', '3', '4', '5']
+        assert all(len(doc.body.split()) == 4 for doc in generated)
+        assert [doc.body for doc in model.generate(5, seed=1, chunk_size=2)] == [doc.body for doc in generated]
+        words = Counter(word for doc in generated for word in doc.body.split())
+        assert set(words) - {'wing', 'flow'} == {word for word in words if word.startswith('syn')}
+
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            writeCorpus(generated, filename, words_per_line=3)
+            parsed = list(cran.iter_docs(filename))
+        finally:
+            os.remove(filename)
+        assert [doc.body.split() for doc in parsed] == [doc.body.split() for doc in generated]
+
+    def test_compare(self):
+        old = {'results': [{'name': 'a', 'p50_us': 10.0}, {'name': 'b', 'seconds': 2.0}]}
+        new = {'results': [{'name': 'a', 'p50_us': 12.0}, {'name': 'b', 'seconds': 2.1}, {'name': 'c'}]}
+        changes = compare(old, new)
+        assert [(name, regressed) for name, _, _, _, _, regressed in changes] == [('a', True), ('b', False)]
+
+    def test_run(self):
+        tmp_dir = tempfile.mkdtemp()
+        doc_filename = os.path.join(tmp_dir, 'docs.all')
+        query_filename = os.path.join(tmp_dir, 'query.text')
+        writeCorpus([d.Document('1', 'a', 'me', 'the wing flow past a body'),
+                     d.Document('2', 'b', 'me', 'shock waves in the flow')], doc_filename)
+        with open(query_filename, 'w') as f:
+            f.write('.I 001\n.W\nwing flow\n.I 002\n.W\nshock waves\n')
+        try:
+            run = runBenchmarks(doc_filename, query_filename, scales=(2,), ks=(1,),
+                                skip=('index_pipeline', 'spelling'), tmp_dir=tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir)
+        results = {result['name']: result for result in run['results']}
+        assert results['cranfield/index_build']['n_docs'] == 2
+        assert results['synthetic-x2/index_build']['n_docs'] == 4
+        assert results['synthetic-x2/vector_k1/disk']['count'] == 2
+        assert results['cranfield/impact_k1/all']['overlap'] == 1.0
+        assert results['cranfield/find/memory']['count'] > 0
+        json.dumps(run)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark indexing and query processing')
+    parser.add_argument('--docs', default=os.path.join(BASE_DIR, 'cran.all'))
+    parser.add_argument('--queries-file', default=os.path.join(BASE_DIR, 'query.text'))
+    parser.add_argument('--scales', type=int, nargs='*', default=[10],
+                        help='sizes of the synthetic collections, in multiples of the collection')
+    parser.add_argument('--queries', type=int, default=100, help='number of queries to time')
+    parser.add_argument('--k', type=int, nargs='+', default=[10], help='numbers of vector query results')
+    parser.add_argument('--skip', nargs='*', default=[],
+                        choices=['index_pipeline', 'boolean', 'vector', 'impact', 'spelling'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        runs = []
+        for filename in args.compare:
+            with open(filename) as f:
+                runs.append(json.load(f))
+        regressions = 0
+        for name, measure, old_value, new_value, change, regressed in compare(runs[0], runs[1], args.threshold):
+            regressions += regressed
+            print('%-45s %-8s %12.3f %12.3f %+7.1f%%%s' % (name, measure, old_value, new_value, 100 * change,
+                                                         '  REGRESSION' if regressed else ''))
+        sys.exit(1 if regressions > 0 else 0)
+
+    run = runBenchmarks(args.docs, args.queries_file, args.scales, args.queries, args.k, args.skip, args.seed)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    else:
+        json.dump(run, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,427 @@
+'''
+
+Boolean query parsing and evaluation over sorted posting lists
+
+A query is a sequence of terms, parentheses, phrases between double quotes
+and the operators AND, OR, NOT and NEAR/k, with NEAR/k binding tighter than
+NOT, NOT tighter than AND and AND tighter than OR. Terms next to each other
+are joined by an implicit AND, so "A B C" is "A AND B AND C". "A NEAR/k B"
+matches documents where A and B (terms or phrases) occur at most k positions
+apart, in either order.
+
+Queries are parsed into nested tuples:
+    ('term', term)
+    ('phrase', [terms])
+    ('near', left, right, k)
+    ('not', node)
+    ('and', [nodes])
+    ('or', [nodes])
+
+and evaluated with merges of sorted docID lists. The lists of an AND are
+intersected starting from the shortest, using galloping search in the
+longer list, and evaluation stops as soon as the intersection is empty.
+Phrases and NEAR first intersect the docIDs of their terms, and only read
+the positions of the documents left.
+
+'''
+
+import bisect
+import re
+import unittest
+
+OPERATORS = ('AND', 'OR', 'NOT', '(', ')', '"')
+NEAR_OPERATOR = re.compile(r'NEAR/(\d+)$')
+POSITIONAL = ('term', 'phrase', 'near')
+
+
+def nearDistance(token):
+    ''' return k for a NEAR/k operator, or None for any other token'''
+    match = NEAR_OPERATOR.match(token)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def intersect(short, long):
+    ''' return the sorted docIDs in both sorted lists. For each docID of the
+    shorter list, the longer list is searched with exponentially growing
+    steps from the last match, then by bisection'''
+    if len(short) > len(long):
+        short, long = long, short
+    result = []
+    lo = 0
+    n = len(long)
+    for docID in short:
+        # Gallop until long[hi] >= docID
+        step = 1
+        hi = lo
+        while hi < n and long[hi] < docID:
+            lo = hi + 1
+            hi += step
+            step *= 2
+        lo = bisect.bisect_left(long, docID, lo, min(hi, n))
+        if lo == n:
+            break
+        if long[lo] == docID:
+            result.append(docID)
+            lo += 1
+    return result
+
+def union(a, b):
+    ''' return the sorted docIDs in either sorted list'''
+    result = []
+    i = 0
+    j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            result.append(a[i])
+            i += 1
+        elif a[i] > b[j]:
+            result.append(b[j])
+            j += 1
+        else:
+            result.append(a[i])
+            i += 1
+            j += 1
+    result.extend(a[i:])
+    result.extend(b[j:])
+    return result
+
+def difference(a, b):
+    ''' return the sorted docIDs of the sorted list a that are not in b'''
+    result = []
+    j = 0
+    for docID in a:
+        j = bisect.bisect_left(b, docID, j)
+        if j == len(b) or b[j] != docID:
+            result.append(docID)
+    return result
+
+
+def parse(tokens):
+    ''' parse a list of terms and operators into a query tree, or None for
+    an empty query. Operators missing an operand are ignored'''
+    position = [0]
+
+    def peek():
+        if position[0] < len(tokens):
+            return tokens[position[0]]
+        return None
+
+    def advance():
+        position[0] += 1
+
+    def parseOr():
+        nodes = []
+        while True:
+            node = parseAnd()
+            if node is not None:
+                nodes.append(node)
+            if peek() == 'OR':
+                advance()
+            else:
+                break
+        return combine('or', nodes)
+
+    def parseAnd():
+        nodes = []
+        while peek() is not None and peek() not in ('OR', ')'):
+            if peek() == 'AND':
+                advance()
+                continue
+            node = parseNot()
+            if node is not None:
+                nodes.append(node)
+        return combine('and', nodes)
+
+    def parseNot():
+        if peek() == 'NOT':
+            advance()
+            node = parseNot()
+            if node is None:
+                return None
+            return ('not', node)
+        return parseNear()
+
+    def parseNear():
+        node = parsePrimary()
+        while peek() is not None and nearDistance(peek()) is not None:
+            k = nearDistance(peek())
+            advance()
+            right = parsePrimary()
+            if node is None or right is None:
+                node = node or right
+            elif node[0] in POSITIONAL and right[0] in POSITIONAL:
+                node = ('near', node, right, k)
+            else:
+                # Groups have no positions, NEAR falls back to AND
+                node = ('and', [node, right])
+        return node
+
+    def parsePrimary():
+        token = peek()
+        if token == '(':
+            advance()
+            node = parseOr()
+            if peek() == ')':
+                advance()
+            return node
+        if token == '"':
+            advance()
+            terms = []
+            while peek() is not None and peek() != '"':
+                if peek() not in OPERATORS and nearDistance(peek()) is None:
+                    terms.append(peek())
+                advance()
+            advance()
+            if len(terms) == 0:
+                return None
+            if len(terms) == 1:
+                return ('term', terms[0])
+            return ('phrase', terms)
+        if token is not None and nearDistance(token) is not None:
+            # NEAR/k without a left operand
+            advance()
+            return None
+        if token is None or token in OPERATORS:
+            return None
+        advance()
+        return ('term', token)
+
+    node = None
+    while position[0] < len(tokens):
+        # Unbalanced closing parentheses are skipped
+        node = combine('and', [n for n in [node, parseOr()] if n is not None])
+        if peek() == ')':
+            advance()
+    return node
+
+def combine(operator, nodes):
+    if len(nodes) == 0:
+        return None
+    if len(nodes) == 1:
+        return nodes[0]
+    return (operator, nodes)
+
+
+def evaluate(node, lookup, universe, positions=None):
+    ''' evaluate a query tree. lookup(term) returns the sorted docIDs of a
+    term, universe() the sorted docIDs of all documents, which is only
+    needed for a NOT that is not part of an AND. positions(term, docIDs)
+    returns the sorted positions of a term in each of the given documents,
+    and is only needed for phrases and NEAR'''
+    if node is None:
+        return []
+    kind = node[0]
+    if kind == 'term':
+        return list(lookup(node[1]))
+    if kind in POSITIONAL:
+        return evaluatePositional(node, lookup, positions)
+    if kind == 'not':
+        return difference(universe(), evaluate(node[1], lookup, universe, positions))
+    if kind == 'or':
+        result = []
+        for child in node[1]:
+            result = union(result, evaluate(child, lookup, universe, positions))
+        return result
+
+    # AND: look up the terms first and intersect from the rarest, then the
+    # other positive operands, then match the positions of phrases and NEAR
+    # in the documents left, then remove the negated operands
+    terms = [child for child in node[1] if child[0] == 'term']
+    positional = [child for child in node[1] if child[0] in ('phrase', 'near')]
+    others = [child for child in node[1] if child[0] not in POSITIONAL + ('not',)]
+    negated = [child[1] for child in node[1] if child[0] == 'not']
+
+    result = None
+    for docIDs in sorted((lookup(child[1]) for child in terms), key=len):
+        result = docIDs if result is None else intersect(result, docIDs)
+        if len(result) == 0:
+            return []
+    for child in others:
+        docIDs = evaluate(child, lookup, universe, positions)
+        result = docIDs if result is None else intersect(result, docIDs)
+        if len(result) == 0:
+            return []
+    for child in positional:
+        result = evaluatePositional(child, lookup, positions, result)
+        if len(result) == 0:
+            return []
+    if result is None:
+        result = universe()
+    for child in negated:
+        result = difference(result, evaluate(child, lookup, universe, positions))
+        if len(result) == 0:
+            return []
+    return list(result)
+
+
+def positionalTerms(node):
+    ''' the terms of a term, phrase or NEAR node'''
+    if node[0] == 'term':
+        return [node[1]]
+    if node[0] == 'phrase':
+        return list(node[1])
+    return positionalTerms(node[1]) + positionalTerms(node[2])
+
+def evaluatePositional(node, lookup, positions, candidates=None):
+    ''' return the sorted docIDs matching a term, phrase or NEAR node. Only
+    the documents containing every term of the node (and in candidates, if
+    given) have their positions read'''
+    if positions is None:
+        raise ValueError('phrase and NEAR queries need term positions')
+    result = candidates
+    for docIDs in sorted((lookup(term) for term in set(positionalTerms(node))), key=len):
+        result = docIDs if result is None else intersect(result, docIDs)
+        if len(result) == 0:
+            return []
+    if node[0] == 'term':
+        return list(result)
+    if node[0] == 'near' and node[1][0] == 'term' and node[2][0] == 'term' and node[1][1] != node[2][1]:
+        # Two distinct terms never share a position
+        left = positions(node[1][1], result)
+        right = positions(node[2][1], result)
+        return [docID for docID, a, b in zip(result, left, right) if isNear(a, b, node[3])]
+    if node[0] == 'near':
+        # Only whether the operands are near at least once is needed here
+        left = spans(node[1], result, positions)
+        right = spans(node[2], result, positions)
+        return [docID for docID, a, b in zip(result, left, right) if len(nearSpans(a, b, node[3], 1)) > 0]
+    matches = spans(node, result, positions)
+    return [docID for docID, match in zip(result, matches) if len(match) > 0]
+
+def spans(node, docIDs, positions):
+    ''' return, for each of docIDs, the sorted (start, end) positions where
+    a term, phrase or NEAR node matches'''
+    if node[0] == 'term':
+        return [[(p, p) for p in term_positions] for term_positions in positions(node[1], docIDs)]
+    if node[0] == 'phrase':
+        return phraseSpans(node[1], docIDs, positions)
+    left = spans(node[1], docIDs, positions)
+    right = spans(node[2], docIDs, positions)
+    return [nearSpans(a, b, node[3]) for a, b in zip(left, right)]
+
+def phraseSpans(terms, docIDs, positions):
+    ''' the phrase starts where the i-th term is at start + i. Positions
+    within a document are few, so they are checked against a set rather
+    than merged'''
+    starts = None
+    for offset, term in enumerate(terms):
+        term_positions = positions(term, docIDs)
+        if starts is None:
+            starts = term_positions
+        else:
+            starts = [matchOffset(a, b, offset) for a, b in zip(starts, term_positions)]
+    n = len(terms) - 1
+    return [[(start, start + n) for start in doc_starts] for doc_starts in starts]
+
+def matchOffset(starts, term_positions, offset):
+    ''' the starts with a term position offset after them'''
+    if len(starts) == 0:
+        return starts
+    term_positions = set(term_positions)
+    return [p for p in starts if p + offset in term_positions]
+
+def isNear(a, b, k):
+    ''' whether two sorted position lists have positions at most k apart'''
+    if len(a) == 0 or len(b) == 0:
+        return False
+    for p in a:
+        i = bisect.bisect_left(b, p - k)
+        if i < len(b) and b[i] <= p + k:
+            return True
+    return False
+
+def nearSpans(a, b, k, limit=None):
+    ''' the spans covering a span of a and a span of b that do not overlap
+    and are at most k positions apart, or the first limit such spans found'''
+    if len(a) == 0 or len(b) == 0:
+        return []
+    b_starts = [start for start, end in b]
+    longest = max(end - start for start, end in b)
+    result = set()
+    for start, end in a:
+        i = bisect.bisect_left(b_starts, start - k - longest)
+        while i < len(b) and b[i][0] <= end + k:
+            other_start, other_end = b[i]
+            if 0 < other_start - end <= k or 0 < start - other_end <= k:
+                result.add((min(start, other_start), max(end, other_end)))
+                if len(result) == limit:
+                    return sorted(result)
+            i += 1
+    return sorted(result)
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_merges(self):
+        a = [1, 3, 5, 7, 9, 11, 13]
+        b = [2, 3, 4, 9, 13, 20]
+        assert intersect(a, b) == [3, 9, 13]
+        assert intersect(b, a) == [3, 9, 13]
+        assert intersect([], a) == []
+        assert intersect([100], list(range(0, 200, 2))) == [100]
+        assert intersect([101], list(range(0, 200, 2))) == []
+        assert union(a, b) == [1, 2, 3, 4, 5, 7, 9, 11, 13, 20]
+        assert difference(a, b) == [1, 5, 7, 11]
+        assert difference(b, []) == b
+
+    def test_parse(self):
+        assert parse(['a', 'b', 'c']) == ('and', [('term', 'a'), ('term', 'b'), ('term', 'c')])
+        assert parse(['a', 'OR', 'b', 'c']) == ('or', [('term', 'a'), ('and', [('term', 'b'), ('term', 'c')])])
+        assert parse(['a', 'AND', 'NOT', 'b']) == ('and', [('term', 'a'), ('not', ('term', 'b'))])
+        assert parse(['(', 'a', 'OR', 'b', ')', 'c']) == ('and', [('or', [('term', 'a'), ('term', 'b')]), ('term', 'c')])
+        assert parse(['a', 'AND']) == ('term', 'a')
+        assert parse(['NOT']) is None
+        assert parse(['a', 'NOT', 'OR', 'b']) == ('or', [('term', 'a'), ('term', 'b')])
+        assert parse(['a', ')', 'b']) == ('and', [('term', 'a'), ('term', 'b')])
+        assert parse([]) is None
+
+    def test_evaluate(self):
+        postings = {'a': [1, 2, 3, 4], 'b': [2, 4, 6], 'c': [4, 5, 6]}
+        lookup = lambda term: postings.get(term, [])
+        universe = lambda: [1, 2, 3, 4, 5, 6, 7]
+
+        assert evaluate(parse(['a', 'b']), lookup, universe) == [2, 4]
+        assert evaluate(parse(['a', 'b', 'c']), lookup, universe) == [4]
+        assert evaluate(parse(['a', 'd']), lookup, universe) == []
+        assert evaluate(parse(['a', 'OR', 'c']), lookup, universe) == [1, 2, 3, 4, 5, 6]
+        assert evaluate(parse(['a', 'NOT', 'b']), lookup, universe) == [1, 3]
+        assert evaluate(parse(['NOT', 'a']), lookup, universe) == [5, 6, 7]
+        assert evaluate(parse(['(', 'a', 'OR', 'c', ')', 'AND', 'NOT', 'b']), lookup, universe) == [1, 3, 5]
+        assert evaluate(parse(['b', 'OR', 'NOT', 'a']), lookup, universe) == [2, 4, 5, 6, 7]
+
+    def test_parse_positional(self):
+        assert parse(['"', 'a', 'b', '"']) == ('phrase', ['a', 'b'])
+        assert parse(['"', 'a', '"', 'c']) == ('and', [('term', 'a'), ('term', 'c')])
+        assert parse(['"', '"']) is None
+        assert parse(['a', 'NEAR/3', 'b']) == ('near', ('term', 'a'), ('term', 'b'), 3)
+        assert parse(['NOT', 'a', 'NEAR/1', '"', 'b', 'c', '"']) == ('not', ('near', ('term', 'a'), ('phrase', ['b', 'c']), 1))
+        assert parse(['(', 'a', 'OR', 'b', ')', 'NEAR/2', 'c']) == ('and', [('or', [('term', 'a'), ('term', 'b')]), ('term', 'c')])
+        assert parse(['NEAR/2', 'a']) == ('term', 'a')
+        assert parse(['"', 'a', 'b']) == ('phrase', ['a', 'b'])
+
+    def test_evaluate_positional(self):
+        # docID -> positions of each term
+        documents = {1: {'a': [0, 5], 'b': [1, 9], 'c': [2]},
+                     2: {'a': [3], 'b': [0, 7], 'c': [8]},
+                     3: {'a': [4], 'c': [5]}}
+        lookup = lambda term: sorted(docID for docID in documents if term in documents[docID])
+        universe = lambda: sorted(documents)
+        positions = lambda term, docIDs: [documents[docID][term] for docID in docIDs]
+
+        def run(tokens):
+            return evaluate(parse(tokens), lookup, universe, positions)
+
+        assert run(['"', 'a', 'b', '"']) == [1]
+        assert run(['"', 'a', 'b', 'c', '"']) == [1]
+        assert run(['"', 'b', 'c', '"']) == [1, 2]
+        assert run(['"', 'b', 'a', '"']) == []
+        assert run(['a', 'NEAR/1', 'c']) == [3]
+        assert run(['a', 'NEAR/2', 'c']) == [1, 3]
+        assert run(['b', 'NEAR/3', 'a']) == [1, 2]
+        assert run(['a', 'NEAR/1', '"', 'b', 'c', '"']) == [1]
+        assert run(['c', '"', 'a', 'b', '"', 'OR', 'a', 'NEAR/1', 'c']) == [1, 3]
+        assert run(['c', 'NOT', '"', 'b', 'c', '"']) == [3]
+        self.assertRaises(ValueError, evaluate, parse(['"', 'a', 'b', '"']), lookup, universe)
@@ -0,0 +1,131 @@
+'''
+
+LRU cache for query results
+
+Entries are evicted least recently used first once the cache holds maxsize
+entries, and expire ttl seconds after they were stored (if ttl is set).
+
+Results depend on the index they were computed from, so they are stored
+together with the index's generation, which changes whenever the index is
+modified or loaded (see index.nextGeneration). Looking up or storing an
+entry for a different generation empties the cache.
+
+'''
+
+import time
+import threading
+import unittest
+from collections import OrderedDict
+
+
+class QueryCache:
+    ''' a bounded mapping from query keys to results, counting hits and
+    misses'''
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        ''' maxsize is the number of entries kept, ttl the number of seconds
+        an entry stays valid (None for no limit)'''
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict() # key -> (time stored, value), oldest use first
+        self.generation = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def checkGeneration(self, generation):
+        # Called with the lock held
+        if generation is not None and generation != self.generation:
+            if len(self.entries) > 0:
+                self.invalidations += 1
+            self.entries.clear()
+            self.generation = generation
+
+    def get(self, key, generation=None):
+        ''' return the value stored for key, or None if there is none or it
+        has expired'''
+        with self.lock:
+            self.checkGeneration(generation)
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and self.clock() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=None):
+        ''' store value for key, evicting the least recently used entries
+        if the cache is full'''
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.checkGeneration(generation)
+            self.entries[key] = (self.clock(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        ''' remove every entry; the counters are kept'''
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        ''' return the counters and the current size as a dict'''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self.entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_lru(self):
+        cache = QueryCache(maxsize=2)
+        cache.put('a', [1])
+        cache.put('b', [2])
+        assert cache.get('a') == [1]
+        cache.put('c', [3])
+        assert cache.get('b') is None
+        assert cache.get('a') == [1]
+        assert cache.get('c') == [3]
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (3, 1, 1, 2)
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = QueryCache(ttl=10, clock=lambda: now[0])
+        cache.put('a', [1])
+        now[0] = 5.0
+        assert cache.get('a') == [1]
+        now[0] = 11.0
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_generation(self):
+        cache = QueryCache()
+        cache.put('a', [1], generation=1)
+        assert cache.get('a', generation=1) == [1]
+        assert cache.get('a', generation=2) is None
+        assert cache.stats()['invalidations'] == 1
+        cache.put('a', [2], generation=2)
+        assert cache.get('a', generation=2) == [2]
+
+    def test_disabled(self):
+        cache = QueryCache(maxsize=0)
+        cache.put('a', [1])
+        assert cache.get('a') is None
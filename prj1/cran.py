@@ -2,48 +2,130 @@
 
 processing the special format used by the Cranfield Dataset
 
+Each document starts with a line ".I <docid>" followed by the fields .T
+(title), .A (author), .B (bibliography, skipped) and .W (body), each marker
+alone on its own line. Markers are only recognised at the start of a line, so
+text such as "U.I.T." in a body is left alone.
+
+iter_docs reads the file through a large buffer and yields the documents one
+at a time, so a collection of any size is parsed in constant memory;
+CranFile keeps the old interface of a list of all the documents.
+iter_offsets locates each document in the file without parsing it, and
+parseDoc parses one document from its bytes; doc.Collection uses them to read
+documents on demand.
 
 '''
 
+import io
+import os
+import tempfile
+import unittest
+
 from doc import Document
 
+BUFFER_SIZE = 2**20 # bytes read from the file at a time
+ENCODING = 'utf-8'
+
+
+def parseLines(lines):
+    ''' yield the Documents in an iterable of lines of a collection file'''
+    docid = None
+    title = ''
+    author = ''
+    fields = [] # lines of the current field, joined once the field ends
+
+    for line in lines:
+        if line.startswith('.'):
+            marker = line.rstrip()
+            if line.startswith('.I ') or marker == '.I':
+                if docid is not None:
+                    yield Document(docid, title, author, ''.join(fields))
+                # start a new document
+                ids = marker.split()
+                docid = ids[1] if len(ids) > 1 else ''
+                title = ''
+                author = ''
+                fields = []
+                continue
+            if marker == '.T':
+                continue
+            if marker == '.A':
+                title = ''.join(fields) # got title
+                fields = []
+                continue
+            if marker == '.B':
+                author = ''.join(fields) # got author
+                fields = []
+                continue
+            if marker == '.W':
+                fields = [] # skip bibliography
+                continue
+        fields.append(line)
+
+    if docid is not None:
+        yield Document(docid, title, author, ''.join(fields)) # the last one
+
+
+def iter_docs(path, buffer_size=BUFFER_SIZE):
+    ''' yield the Documents of a Cranfield collection file in order'''
+    with open(path, buffering=buffer_size, encoding=ENCODING) as cf:
+        yield from parseLines(cf)
+
+
+def iter_offsets(path, buffer_size=BUFFER_SIZE):
+    ''' yield the docID, byte offset and byte length of each document of a
+    collection file in order, without parsing the documents'''
+    with open(path, 'rb', buffering=buffer_size) as cf:
+        docid = None
+        start = 0
+        offset = 0
+        for line in cf:
+            if line.startswith(b'.I ') or line.rstrip() == b'.I':
+                if docid is not None:
+                    yield docid, start, offset - start
+                ids = line.split()
+                docid = ids[1].decode(ENCODING) if len(ids) > 1 else ''
+                start = offset
+            offset += len(line)
+        if docid is not None:
+            yield docid, start, offset - start
+
+
+def parseDoc(data):
+    ''' parse a single document from the bytes of its record, as located
+    by iter_offsets'''
+    return next(parseLines(io.StringIO(data.decode(ENCODING), newline=None)))
+
 
 class CranFile:
     def __init__(self, filename):
-        self.docs = []
+        self.docs = list(iter_docs(filename))
 
-        cf = open(filename)
-        docid = ''
-        title = ''
-        author = ''
-        body = ''
 
-        for line in cf:
-            if '.I' in line:
-                if docid != '':
-                    body = buf
-                    self.docs.append(Document(docid, title, author, body))
-                # start a new document
-                docid = line.strip().split()[1]
-                buf = ''
-            elif '.T' in line:
-                None
-            elif '.A' in line:
-                title = buf # got title
-                buf = ''
-            elif '.B' in line:
-                author = buf # got author
-                buf = ''
-            elif '.W' in line:
-                buf = '' # skip affiliation
-            else:
-                buf += line
-        self.docs.append(Document(docid, title, author, buf)) # the last one
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_iter_docs(self):
+        text = ('.I 1\n.T\ncase of the u.s.a.\n.A\nsmith,j.\n.B\nj. ae. scs.\n.W\n'
+                'flow past a .I section\n.Iota is not a marker\n'
+                '.I 2\n.T\nsecond\n.A\n.B\n.W\nbody\n')
+        fd, path = tempfile.mkstemp()
+        with io.open(fd, 'w') as f:
+            f.write(text)
+        try:
+            docs = list(iter_docs(path, buffer_size=16))
+        finally:
+            os.remove(path)
+
+        assert [doc.docID for doc in docs] == ['1', '2']
+        assert docs[0].title == 'case of the u.s.a.\n'
+        assert docs[0].author == 'smith,j.\n'
+        assert docs[0].body == 'flow past a .I section\n.Iota is not a marker\n'
+        assert (docs[1].title, docs[1].author, docs[1].body) == ('second\n', '', 'body\n')
+
 
 if __name__ == '__main__':
     ''' testing '''
 
-    cf = CranFile ('cran.all')
-    for doc in cf.docs:
+    for doc in iter_docs('cran.all'):
         print(doc.docID, doc.title, doc.body)
-    print(len(cf.docs))
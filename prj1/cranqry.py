@@ -1,32 +1,51 @@
 '''
 
   handling the specific input format of the query.text for the Cranfield data
+
+  Each query starts with a line ".I <qid>" followed by ".W" and the query
+  text; markers are only recognised alone at the start of a line.
+  iter_queries streams the file and yields the queries one at a time.
   
 '''
 
+import io
+import os
+import tempfile
+import unittest
+
+BUFFER_SIZE = 2**20 # bytes read from the file at a time
+
 
 class CranQry:
     def __init__(self, qid, text):
         self.qid = qid
         self.text = text
 
+def iter_queries(path, buffer_size=BUFFER_SIZE):
+    ''' yield the CranQry objects of a query file in order'''
+    with open(path, buffering=buffer_size) as f:
+        qid = None
+        lines = []
+        for line in f:
+            if line.startswith('.'):
+                marker = line.rstrip()
+                if line.startswith('.I ') or marker == '.I':
+                    if qid is not None:
+                        yield CranQry(qid, ''.join(lines))
+                    fields = marker.split()
+                    qid = fields[1] if len(fields) > 1 else ''
+                    lines = []
+                    continue
+                if marker == '.W':
+                    continue
+            lines.append(line)
+        if qid is not None:
+            yield CranQry(qid, ''.join(lines))
+
 def loadCranQry(qfile):
     queries = {}
-    f = open(qfile)
-    text = ''
-    qid = ''
-    for line in f:
-        if '.I' in line:
-            if qid !='':
-                queries[qid] = CranQry(qid, text)
-                #print 'qid:', qid, text
-            qid = line.strip().split()[1]
-            text = ''
-        elif '.W' in line:
-            None
-        else:
-            text += line
-    queries[qid] = CranQry(qid, text)
+    for query in iter_queries(qfile):
+        queries[query.qid] = query
     return queries
 
 def test():
@@ -36,5 +55,20 @@ def test():
         print(q, qrys[q].text)
     print(len(qrys))
 
+class testQueries(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_iter_queries(self):
+        fd, path = tempfile.mkstemp()
+        with io.open(fd, 'w') as f:
+            f.write('.I 001\n.W\nwhat is the .I marker\n.W.\n.I 002\n.W\nshock waves .\n')
+        try:
+            queries = list(iter_queries(path, buffer_size=16))
+        finally:
+            os.remove(path)
+        assert [query.qid for query in queries] == ['001', '002']
+        assert queries[0].text == 'what is the .I marker\n.W.\n'
+        assert queries[1].text == 'shock waves .\n'
+
 if __name__ == '__main__':
     test()
@@ -0,0 +1,249 @@
+'''
+
+Memory-mapped on-disk index
+
+File layout (all integers little endian):
+    header      magic, version, nDocs, nTerms, number of document lengths and
+                the file offset of each of the following sections
+    terms       the terms in term ID order, utf-8 encoded and separated by newlines
+    docLength   (key, length) pairs of unsigned 32 bit integers
+    norms       the length of each document's tf-idf vector, 64 bit floats indexed by docID
+    df          the document frequency of each term, unsigned 32 bit integers
+    maxWeight   the highest normalized weight of each term, 64 bit floats
+    offsets     nTerms + 1 unsigned 64 bit file offsets, one per posting list
+                and one marking the end of the postings region
+    postings    one entry per term: the byte lengths of the varint compressed
+                docID gaps and term frequencies, followed by the compressed
+                docID gaps, term frequencies and position gaps (see postings.py)
+
+The postings region is read through mmap, so posting lists are decoded only
+when a query looks up their term, and processes opening the same file share
+its pages.
+
+usage:
+    python diskindex.py output.p output.idx
+
+    converts an index saved by index.py to the on-disk format
+
+'''
+
+import mmap
+import math
+import struct
+import sys
+import os
+import unittest
+from array import array
+import numpy as np
+
+import index as inverted_ind
+import doc as d
+from postings import FrozenIndexItem
+
+MAGIC = b'IRIX'
+VERSION = 3
+HEADER = struct.Struct('<4sIIIIIQQQQQQQ')
+ENTRY = struct.Struct('<II')
+
+
+def writeDiskIndex(inverted_index, filename):
+    ''' write an InvertedIndex to filename in the on-disk format'''
+    terms = '\n'.join(item.term for item in inverted_index.items).encode('utf-8')
+
+    doc_lengths = array('I')
+    for key, length in inverted_index.docLength.items():
+        doc_lengths.append(key)
+        doc_lengths.append(length)
+
+    f = open(filename, 'wb')
+    f.write(b'\0' * HEADER.size)
+
+    terms_offset = f.tell()
+    f.write(terms)
+    doc_length_offset = f.tell()
+    doc_lengths.tofile(f)
+    norms = np.asarray(inverted_index.norms(), dtype='<f8')
+    norms_offset = f.tell()
+    f.write(norms.tobytes())
+
+    # Posting lists are written before the df and offsets tables, which are
+    # only known once every posting list has been encoded
+    df = array('I')
+    offsets = array('Q')
+    postings_offset = f.tell()
+    for item in inverted_index.items:
+        if not isinstance(item, FrozenIndexItem) or not item.compressed:
+            item = FrozenIndexItem.fromIndexItem(item, compressed=True)
+        offsets.append(f.tell())
+        df.append(len(item.docIDs()))
+        f.write(ENTRY.pack(len(item.doc_gaps), len(item.freqs)))
+        f.write(item.doc_gaps)
+        f.write(item.freqs)
+        f.write(item.position_gaps)
+    offsets.append(f.tell())
+
+    df_offset = f.tell()
+    df.tofile(f)
+    max_weight_offset = f.tell()
+    f.write(np.asarray(inverted_index.maxWeights(), dtype='<f8').tobytes())
+    offsets_offset = f.tell()
+    offsets.tofile(f)
+
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, VERSION, inverted_index.nDocs, len(inverted_index.items),
+                        len(inverted_index.docLength), len(norms), terms_offset, doc_length_offset,
+                        norms_offset, df_offset, max_weight_offset, offsets_offset, postings_offset))
+    f.close()
+
+
+def isDiskIndex(filename):
+    ''' check whether filename holds an index in the on-disk format'''
+    f = open(filename, 'rb')
+    magic = f.read(len(MAGIC))
+    f.close()
+    return magic == MAGIC
+
+
+def openIndex(filename):
+    ''' open an index file written either by InvertedIndex.save or by
+    writeDiskIndex, or the directory of a segments.SegmentedIndex'''
+    if os.path.isdir(filename):
+        import segments
+        return segments.SegmentedIndex(filename)
+    if isDiskIndex(filename):
+        return DiskIndex(filename)
+
+    inverted_index = inverted_ind.InvertedIndex()
+    inverted_index.load(filename)
+    return inverted_index
+
+
+class DiskIndex:
+    ''' read-only index backed by a memory-mapped file, offering the lookup
+    methods of InvertedIndex used by query processing'''
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.generation = inverted_ind.nextGeneration() # the index is never modified
+
+        magic, version = struct.unpack_from('<4sI', self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not an index file of version %d, convert it again' % (filename, VERSION))
+        (magic, version, self.nDocs, nTerms, nDocLengths, nNorms, terms_offset, doc_length_offset,
+         norms_offset, df_offset, max_weight_offset, offsets_offset, postings_offset) = HEADER.unpack_from(self.mm, 0)
+
+        # The term dictionary and the small tables are read eagerly, the
+        # posting lists are left in the mapped file
+        self.terms = []
+        if nTerms > 0:
+            self.terms = self.mm[terms_offset:doc_length_offset].decode('utf-8').split('\n')
+        self.dictionary = {}
+        for term_id, term in enumerate(self.terms):
+            self.dictionary[term] = term_id
+
+        doc_lengths = array('I')
+        doc_lengths.frombytes(self.mm[doc_length_offset:doc_length_offset + 8 * nDocLengths])
+        self.docLength = dict(zip(doc_lengths[0::2], doc_lengths[1::2]))
+        self.docNorm = np.frombuffer(self.mm[norms_offset:norms_offset + 8 * nNorms], dtype='<f8')
+
+        self.df = array('I')
+        self.df.frombytes(self.mm[df_offset:max_weight_offset])
+        self.maxWeight = np.frombuffer(self.mm[max_weight_offset:offsets_offset], dtype='<f8')
+        self.offsets = array('Q')
+        self.offsets.frombytes(self.mm[offsets_offset:offsets_offset + 8 * (nTerms + 1)])
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def item(self, term_id):
+        ''' decode the posting list of a term ID into a FrozenIndexItem'''
+        start = self.offsets[term_id]
+        end = self.offsets[term_id + 1]
+        doc_bytes, freq_bytes = ENTRY.unpack_from(self.mm, start)
+        start += ENTRY.size
+        doc_gaps = self.mm[start:start + doc_bytes]
+        start += doc_bytes
+        freqs = self.mm[start:start + freq_bytes]
+        start += freq_bytes
+        position_gaps = self.mm[start:end]
+        return FrozenIndexItem.fromBuffers(self.terms[term_id], doc_gaps, freqs, position_gaps)
+
+    def find(self, term):
+        term_id = self.dictionary.get(term)
+        if term_id is not None:
+            return self.item(term_id)
+        return None
+
+    @property
+    def items(self):
+        ''' all posting lists, in term ID order; this decodes the whole index'''
+        return [self.item(term_id) for term_id in range(len(self.terms))]
+
+    def sort(self):
+        ''' posting lists on disk are always sorted'''
+        pass
+
+    def norms(self):
+        ''' return the document norms'''
+        return self.docNorm
+
+    def maxWeights(self):
+        ''' return the highest normalized weight of each term'''
+        return self.maxWeight
+
+    def idf(self, term):
+        ''' compute the inverted document frequency for a given term'''
+        df = self.df[self.dictionary[term]]
+        if (self.nDocs/df) > 0:
+            idf = math.log(self.nDocs/df)
+        else:
+            idf = 0
+        return idf
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_convert(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Hello, World!')
+        doc2 = d.Document('2','temp','me','This is my sixth test.')
+        doc3 = d.Document('3','temp','me','Hello test, hello world.')
+        for doc in [doc1, doc2, doc3]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+
+        writeDiskIndex(inverted_index, 'output_test.idx')
+        disk_index = openIndex('output_test.idx')
+
+        assert isinstance(disk_index, DiskIndex)
+        assert disk_index.nDocs == inverted_index.nDocs
+        assert disk_index.docLength == inverted_index.docLength
+        assert list(disk_index.norms()) == list(inverted_index.norms())
+        assert list(disk_index.maxWeights()) == list(inverted_index.maxWeights())
+        assert disk_index.dictionary == inverted_index.dictionary
+        for item in inverted_index.items:
+            item_new = disk_index.find(item.term)
+            assert item_new.sorted_postings == item.sorted_postings
+            assert disk_index.idf(item.term) == inverted_index.idf(item.term)
+            for docID in item.sorted_postings:
+                assert item_new.posting[docID].positions == item.posting[docID].positions
+        assert disk_index.find('goodbye') is None
+
+        disk_index.close()
+        os.remove('output_test.idx')
+
+    def test_empty_index(self):
+        writeDiskIndex(inverted_ind.InvertedIndex(), 'output_test.idx')
+        disk_index = DiskIndex('output_test.idx')
+        assert disk_index.nDocs == 0
+        assert disk_index.find('hello') is None
+        disk_index.close()
+        os.remove('output_test.idx')
+
+
+if __name__ == '__main__':
+#    writeDiskIndex(openIndex('output.p'), 'output.idx')
+    writeDiskIndex(openIndex(sys.argv[1]), sys.argv[2])
@@ -4,8 +4,28 @@ The document class, containing information from the raw document and possibly ot
 
 The collection class holds a set of docuemnts, indexed by docID
 
+A collection either holds its documents in memory, or is a document store: the
+byte offset and length of each document in the collection file, recorded when
+the collection is indexed and saved alongside the index (see storeFilename).
+A document store memory maps the collection file and parses a document only
+when it is found, keeping the most recently found documents in a small LRU
+cache, so showing a page of results reads a few documents rather than the
+whole collection.
+
 '''
 
+import os
+import mmap
+import pickle
+import tempfile
+import unittest
+import numpy as np
+
+import cache
+
+STORE_FORMAT = 'docstore-1' # first record of a document store file
+
+
 class Document:
     def __init__(self, docid, title, author, body):
         self.docID = docid
@@ -17,18 +37,157 @@ class Document:
     # add more methods if needed
 
 
+def storeFilename(index_filename):
+    ''' return the name of the document store saved with an index'''
+    return index_filename + '.docs'
+
+
 class Collection:
     ''' a collection of documents'''
 
-    def __init__(self):
-        self.docs = {} # documents are indexed by docID
+    def __init__(self, cache_size=256):
+        self.docs = {} # documents held in memory, indexed by docID
+        self.doc_filename = None # collection file of the stored documents
+        self.docIDs = None # sorted docIDs of the stored documents
+        self.offsets = None # byte offset of each stored document, in docID order
+        self.lengths = None # byte length of each stored document, in docID order
+        self.data = None # memory map of the collection file
+        self.cache = cache.QueryCache(maxsize=cache_size)
+
+    def add(self, doc):
+        ''' add a document held in memory'''
+        self.docs[int(doc.docID)] = doc
 
     def find(self, docID):
-        ''' return a document object'''
-        if self.docs.has_key(docID):
-            return self.docs[docID]
-        else:
-            return None
+        ''' return a document object, or None if there is no such document'''
+        docID = int(docID)
+        doc = self.docs.get(docID)
+        if doc is not None or self.docIDs is None:
+            return doc
+
+        doc = self.cache.get(docID)
+        if doc is None:
+            i = np.searchsorted(self.docIDs, docID)
+            if i == len(self.docIDs) or self.docIDs[i] != docID:
+                return None
+            import cran
+            start = int(self.offsets[i])
+            doc = cran.parseDoc(self.data[start:start + int(self.lengths[i])])
+            self.cache.put(docID, doc)
+        return doc
+
+    def __contains__(self, docID):
+        docID = int(docID)
+        if docID in self.docs:
+            return True
+        if self.docIDs is None:
+            return False
+        i = np.searchsorted(self.docIDs, docID)
+        return i < len(self.docIDs) and self.docIDs[i] == docID
+
+    def __len__(self):
+        n_stored = 0 if self.docIDs is None else len(self.docIDs)
+        return len(self.docs) + n_stored
+
+    @classmethod
+    def fromFile(cls, doc_filename, cache_size=256):
+        ''' locate the documents of a Cranfield collection file, without
+        parsing them'''
+        import cran
+        entries = sorted((int(docid), offset, length) for docid, offset, length in cran.iter_offsets(doc_filename))
+        entries = np.array(entries, dtype=np.int64).reshape(-1, 3)
+        collection = cls(cache_size)
+        collection.openFile(doc_filename, entries[:, 0], entries[:, 1], entries[:, 2])
+        return collection
+
+    @classmethod
+    def load(cls, filename, cache_size=256):
+        ''' open a document store written by save'''
+        f = open(filename, 'rb')
+        data = pickle.load(f)
+        f.close()
+        if not isinstance(data, dict) or data.get('format') != STORE_FORMAT:
+            raise ValueError('%s is not a document store' % filename)
+
+        # Look next to the store if the collection file has been moved
+        doc_filename = data['doc_filename']
+        if not os.path.exists(doc_filename):
+            doc_filename = os.path.join(os.path.dirname(filename), os.path.basename(doc_filename))
+        if os.path.getsize(doc_filename) != data['size']:
+            raise ValueError('%s has changed since %s was written' % (doc_filename, filename))
+
+        collection = cls(cache_size)
+        collection.openFile(doc_filename, data['docIDs'], data['offsets'], data['lengths'])
+        return collection
+
+    def openFile(self, doc_filename, docIDs, offsets, lengths):
+        ''' read the given documents from doc_filename on demand'''
+        self.close()
+        self.doc_filename = os.path.abspath(doc_filename)
+        self.docIDs = docIDs
+        self.offsets = offsets
+        self.lengths = lengths
+        with open(doc_filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+        self.cache.clear()
+
+    def save(self, filename):
+        ''' save the locations of the stored documents'''
+        f = open(filename, 'wb')
+        pickle.dump({'format': STORE_FORMAT,
+                     'doc_filename': self.doc_filename,
+                     'size': len(self.data),
+                     'docIDs': self.docIDs,
+                     'offsets': self.offsets,
+                     'lengths': self.lengths}, f, -1)
+        f.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+
+
+def openCollection(index_filename, doc_filename='cran.all', cache_size=256):
+    ''' open the document store saved with an index, or if there is none
+    locate the documents of doc_filename'''
+    if os.path.exists(storeFilename(index_filename)):
+        return Collection.load(storeFilename(index_filename), cache_size)
+    return Collection.fromFile(doc_filename, cache_size)
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_store(self):
+        tmp_dir = tempfile.mkdtemp()
+        doc_filename = os.path.join(tmp_dir, 'docs.all')
+        with open(doc_filename, 'w') as f:
+            f.write('.I 3\n.T\nthird\n.A\nme\n.B\n.W\nthird body\n'
+                    '.I 1\n.T\nfirst\n.A\nyou\n.B\n.W\nfirst body\n')
+        collection = Collection.fromFile(doc_filename, cache_size=1)
+        collection.save(storeFilename(doc_filename))
+        collection.close()
 
-    # more methods if needed
+        collection = Collection.load(storeFilename(doc_filename), cache_size=1)
+        try:
+            assert len(collection) == 2
+            assert 1 in collection and '3' in collection and 2 not in collection
+            doc = collection.find('1')
+            assert (doc.docID, doc.title, doc.author, doc.body) == ('1', 'first\n', 'you\n', 'first body\n')
+            assert collection.find(3).body == 'third body\n'
+            assert collection.find(2) is None
+            assert collection.find(3) is collection.find(3)
+            assert collection.cache.stats()['evictions'] == 1
 
+            collection.add(Document('2', 'second', 'me', 'second body'))
+            assert collection.find(2).title == 'second'
+            assert len(collection) == 3
+        finally:
+            collection.close()
+            for filename in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, filename))
+            os.rmdir(tmp_dir)
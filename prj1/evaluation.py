@@ -0,0 +1,212 @@
+'''
+
+Vectorized evaluation of whole runs
+
+A run is the ranked results of many queries, held as a padded array of
+docIDs with one row per query, best first; rows shorter than the longest
+are padded with PAD. The relevance judgements of the same queries are held
+the same way: an array of the judged docIDs of each query, padded with PAD,
+and an array of their relevance grades, padded with 0.
+
+evaluate computes NDCG@k, P@k, recall and average precision for every query
+at once, with no Python loop over the queries: the grade of every retrieved
+document is gathered from a table of (query, docID) keys, or found by a
+single sorted search of the keys when the table would be too large.
+
+Relevance judgements are read from qrels files of lines "qid docID grade
+...". A document listed with a positive grade has that relevance; as the
+files shipped here list the relevant documents with grade 0, a grade of 0
+counts as relevance 1. Negative grades count as not relevant.
+
+'''
+
+import unittest
+import numpy as np
+
+PAD = -1 # docID padding the rows of runs and judgements
+DENSE_LIMIT = 2**24 # largest number of (query, docID) pairs looked up in a table
+
+
+def loadQrels(filename):
+    ''' return the relevance of the judged documents of each query, as
+    {qid: {docID: relevance}}'''
+    qrels = {}
+    f = open(filename, 'r')
+    for line in f:
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        grade = int(fields[2]) if len(fields) > 2 else 0
+        relevance = grade if grade > 0 else (1 if grade == 0 else 0)
+        qrels.setdefault(int(fields[0]), {})[int(fields[1])] = relevance
+    f.close()
+    return qrels
+
+
+def runArray(results, depth=None):
+    ''' return a padded array of the docIDs of a list of ranked results. A
+    result is a list of docIDs or of (docID, score) pairs, best first. Only
+    the first depth results of each query are kept, if depth is given'''
+    rows = []
+    for result in results:
+        if depth is not None:
+            result = result[:depth]
+        rows.append([int(item[0]) if isinstance(item, tuple) else int(item) for item in result])
+    width = max([len(row) for row in rows] + [0])
+    run = np.full((len(rows), width), PAD, dtype=np.int64)
+    for i, row in enumerate(rows):
+        run[i, :len(row)] = row
+    return run
+
+
+def qrelsArrays(qrels, qids):
+    ''' return padded arrays of the judged docIDs and of their grades for
+    each of qids, from {qid: {docID: relevance}}'''
+    judged = [qrels.get(qid, {}) for qid in qids]
+    width = max([len(docs) for docs in judged] + [0])
+    docIDs = np.full((len(qids), width), PAD, dtype=np.int64)
+    grades = np.zeros((len(qids), width))
+    for i, docs in enumerate(judged):
+        docIDs[i, :len(docs)] = list(docs.keys())
+        grades[i, :len(docs)] = list(docs.values())
+    return docIDs, grades
+
+
+def lookupGrades(run, docIDs, grades):
+    ''' return the grade of each document of the run, 0 for unjudged
+    documents and padding'''
+    n_queries = len(run)
+    if run.size == 0 or docIDs.size == 0:
+        return np.zeros(run.shape)
+
+    # Key each (query, docID) pair by query * stride + docID + 1, so padding
+    # gets a key of its own that is never judged
+    stride = int(max(run.max(), docIDs.max())) + 2
+    rows = np.arange(n_queries, dtype=np.int64)[:, None]
+    judged = docIDs != PAD
+    keys = (rows * stride + docIDs + 1)[judged]
+    values = grades[judged]
+    run_keys = rows * stride + run + 1
+
+    # A table of every key when it is small enough, otherwise one sorted
+    # search for all of the retrieved documents
+    if n_queries * stride <= DENSE_LIMIT:
+        table = np.zeros(n_queries * stride)
+        table[keys] = values
+        return table[run_keys]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = values[order]
+    positions = np.minimum(np.searchsorted(keys, run_keys), len(keys) - 1)
+    return np.where(keys[positions] == run_keys, values[positions], 0.0)
+
+
+def gainsOf(grades, gains):
+    if gains == 'exponential':
+        return 2 ** grades - 1
+    elif gains == 'linear':
+        return grades
+    raise ValueError('Invalid gains option.')
+
+
+def evaluate(run, docIDs, grades, k=10, gains='exponential'):
+    ''' return {metric: array of one value per query} for a run and the
+    judgements of the same queries (see runArray and qrelsArrays):
+
+        ndcg@k      NDCG of the first k results, with exponential (2^grade - 1)
+                    or linear gains
+        p@k         fraction of the first k results that are relevant
+        recall      fraction of the relevant documents retrieved in the run
+        ap          average precision over the whole run; its mean is MAP
+
+    Queries without relevant documents score 0'''
+    retrieved = lookupGrades(run, docIDs, grades)
+    relevant = retrieved > 0
+    n_relevant = (grades > 0).sum(axis=1)
+    n_queries = len(run)
+
+    # NDCG@k; the ideal ranking puts the highest grades first
+    discounts = 1 / np.log2(np.arange(k) + 2)
+    top = retrieved[:, :k]
+    dcg = gainsOf(top, gains) @ discounts[:top.shape[1]]
+    ideal = -np.sort(-grades, axis=1)[:, :k]
+    idcg = gainsOf(ideal, gains) @ discounts[:ideal.shape[1]]
+    ndcg = np.zeros(n_queries)
+    np.divide(dcg, idcg, out=ndcg, where=idcg > 0)
+
+    precision = relevant[:, :k].sum(axis=1) / k
+
+    recall = np.zeros(n_queries)
+    np.divide(relevant.sum(axis=1), n_relevant, out=recall, where=n_relevant > 0)
+
+    # Precision at the rank of each relevant document retrieved
+    ranks = np.arange(1, run.shape[1] + 1)
+    precisions = np.cumsum(relevant, axis=1) / ranks
+    ap = np.zeros(n_queries)
+    np.divide((precisions * relevant).sum(axis=1), n_relevant, out=ap, where=n_relevant > 0)
+
+    return {'ndcg@%d' % k: ndcg, 'p@%d' % k: precision, 'recall': recall, 'ap': ap}
+
+
+def summarize(scores):
+    ''' return the mean of each metric over the queries; the mean of 'ap'
+    is reported as 'map\''''
+    return {('map' if metric == 'ap' else metric): float(values.mean()) if len(values) > 0 else 0.0
+            for metric, values in scores.items()}
+
+
+def evaluateResults(results, qrels, qids, k=10, gains='exponential'):
+    ''' evaluate a list of ranked results, one per qid, against
+    {qid: {docID: relevance}}'''
+    docIDs, grades = qrelsArrays(qrels, qids)
+    return evaluate(runArray(results), docIDs, grades, k, gains)
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_lookup_grades(self):
+        run = runArray([[3, 1, 7], [(5, 0.9)], []])
+        assert run.tolist() == [[3, 1, 7], [5, PAD, PAD], [PAD, PAD, PAD]]
+        docIDs, grades = qrelsArrays({1: {1: 2, 7: 1}, 2: {3: 1}}, [1, 2, 3])
+        assert lookupGrades(run, docIDs, grades).tolist() == [[0, 2, 1], [0, 0, 0], [0, 0, 0]]
+        global DENSE_LIMIT
+        limit, DENSE_LIMIT = DENSE_LIMIT, 0
+        try:
+            assert lookupGrades(run, docIDs, grades).tolist() == [[0, 2, 1], [0, 0, 0], [0, 0, 0]]
+        finally:
+            DENSE_LIMIT = limit
+
+    def test_evaluate(self):
+        qrels = {1: {1: 1, 2: 1, 3: 1}, 2: {4: 3, 5: 1}, 3: {}}
+        scores = evaluateResults([[1, 9, 2], [5, 4], [1]], qrels, [1, 2, 3], k=2)
+        assert scores['p@2'].tolist() == [0.5, 1.0, 0.0]
+        assert np.allclose(scores['recall'], [2 / 3, 1.0, 0.0])
+        assert np.allclose(scores['ap'], [(1 + 2 / 3) / 3, 1.0, 0.0])
+        discount = 1 / np.log2(3)
+        assert np.allclose(scores['ndcg@2'], [1 / (1 + discount), (1 + 7 * discount) / (7 + discount), 0.0])
+        assert np.isclose(summarize(scores)['map'], scores['ap'].mean())
+
+        # A perfect ranking has an NDCG of 1, as with metrics.ndcg_score
+        scores = evaluateResults([[4, 5]], qrels, [2], k=10, gains='linear')
+        assert np.allclose(scores['ndcg@10'], [1.0])
+
+    def test_many_queries(self):
+        generator = np.random.default_rng(0)
+        n_queries, depth = 2000, 100
+        run = np.array([generator.choice(1400, depth, replace=False) + 1 for _ in range(n_queries)])
+        qrels = {qid: {int(docID): int(generator.integers(1, 4))
+                       for docID in generator.choice(1400, 10, replace=False) + 1}
+                 for qid in range(n_queries)}
+        docIDs, grades = qrelsArrays(qrels, list(range(n_queries)))
+        scores = evaluate(run, docIDs, grades, k=10)
+
+        # Against a plain Python computation of average precision
+        for i in range(0, n_queries, 97):
+            hits = 0
+            total = 0
+            for rank, docID in enumerate(run[i], 1):
+                if docID in qrels[i]:
+                    hits += 1
+                    total += hits / rank
+            assert np.isclose(scores['ap'][i], total / len(qrels[i]))
@@ -0,0 +1,310 @@
+'''
+
+Impact-ordered index for score-at-a-time vector queries
+
+An impact index stores, for each posting, the score it adds to its
+document: the tf-idf weight divided by the document norm, as vectorQuery
+computes it, or the BM25 weight of the term in the document. Scores are
+computed once when the index is written and quantized to 8 bits (levels
+1 to 255) on one scale for the whole index, so that a posting's
+contribution is its level times the scale times the query term weight.
+
+The postings of each term are sorted by impact, highest first, and stored
+as blocks of postings sharing the same level: one byte for the level of
+each block and the docIDs of its postings. A query processes the blocks of
+all of its terms in order of decreasing contribution, adding the same
+amount to every document of a block, and may stop after a budget of
+postings: the highest contributions are added first, so the ranking is
+close to the exhaustive one long before every posting is read, and the
+latency of a query is bounded by its budget rather than by the length of
+its posting lists.
+
+File layout (all integers little endian, sections 8 byte aligned):
+    header      magic, version, scoring, nDocs, nTerms, number of docID
+                slots, scale, number of blocks and postings and the file
+                offset of each of the following sections
+    terms       the terms in term ID order, utf-8 encoded and separated by newlines
+    df          the document frequency of each term, unsigned 32 bit integers
+    termBlocks  nTerms + 1 unsigned 64 bit indexes of the first block of each term
+    blockStarts nBlocks + 1 unsigned 64 bit indexes of the first posting of each block
+    levels      the quantized impact of each block, unsigned 8 bit integers
+    docIDs      the docIDs of the postings, unsigned 32 bit integers
+
+usage:
+    python impact.py output.p [--scoring bm25]
+
+    writes the impact index of an index file to output.p.impact, where
+    query.py finds it
+
+'''
+
+import os
+import mmap
+import math
+import struct
+import argparse
+import unittest
+import numpy as np
+
+import index as inverted_ind
+import diskindex
+import doc as d
+
+MAGIC = b'IRIM'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIIIdQQQQQQQQ')
+SCORINGS = ('tfidf', 'bm25')
+LEVELS = 255 # quantized impacts are 1 to LEVELS
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def impactFilename(index_filename):
+    ''' return the name of the impact index written for an index'''
+    return index_filename + '.impact'
+
+
+def termImpacts(inverted_index, scoring='tfidf', k1=BM25_K1, b=BM25_B):
+    ''' yield the term, document frequency, docIDs and impacts of each term
+    of an index, in term ID order. tfidf impacts are the normalized tf-idf
+    weights used by vector queries; bm25 impacts are the BM25 weights of the
+    term, with the document lengths of the index'''
+    if scoring not in SCORINGS:
+        raise ValueError('Invalid scoring option.')
+    n_docs = inverted_index.nDocs
+    if scoring == 'tfidf':
+        norms = inverted_index.norms()
+    else:
+        doc_lengths = inverted_index.docLength
+        lengths = np.zeros(max(doc_lengths, default=-1) + 1)
+        for docID, length in doc_lengths.items():
+            lengths[docID] = length
+        average_length = np.mean(list(doc_lengths.values())) if doc_lengths else 0
+
+    for item in inverted_index.items:
+        docIDs = np.asarray(item.docIDs(), dtype=np.intp)
+        tfs = np.asarray(item.termFreqs(), dtype=float)
+        df = len(docIDs)
+        if df == 0:
+            yield item.term, df, docIDs, tfs
+            continue
+        if scoring == 'tfidf':
+            impacts = np.zeros(df)
+            np.divide(tfs * inverted_index.idf(item.term), norms[docIDs], out=impacts, where=norms[docIDs] > 0)
+        else:
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            normalization = 1 - b + b * lengths[docIDs] / average_length if average_length > 0 else 1
+            impacts = idf * tfs * (k1 + 1) / (tfs + k1 * normalization)
+        yield item.term, df, docIDs, impacts
+
+
+def quantize(impacts, scale):
+    ''' return the levels of impacts on a scale; every positive impact gets
+    a level of at least 1'''
+    levels = np.rint(impacts / scale)
+    levels[impacts > 0] = np.maximum(levels[impacts > 0], 1)
+    return np.minimum(levels, LEVELS).astype(np.uint8)
+
+
+def writeImpactIndex(inverted_index, filename, scoring='tfidf', k1=BM25_K1, b=BM25_B):
+    ''' write the impact index of an index (in memory, on disk or segmented)
+    to filename'''
+    terms = []
+    dfs = []
+    postings = []
+    max_impact = 0
+    for term, df, docIDs, impacts in termImpacts(inverted_index, scoring, k1, b):
+        terms.append(term)
+        dfs.append(df)
+        postings.append((docIDs, impacts))
+        if len(impacts) > 0:
+            max_impact = max(max_impact, float(impacts.max()))
+    scale = max_impact / LEVELS if max_impact > 0 else 1.0
+
+    # Sort each posting list by level, highest first, then by docID, and
+    # cut it into blocks of equal level. Postings quantized to 0 add nothing
+    # to any score and are left out
+    term_blocks = [0]
+    block_starts = [0]
+    levels = []
+    doc_blocks = []
+    n_slots = 0
+    n_postings = 0
+    for docIDs, impacts in postings:
+        term_levels = quantize(impacts, scale)
+        kept = term_levels > 0
+        docIDs = docIDs[kept]
+        term_levels = term_levels[kept]
+        order = np.lexsort((docIDs, -term_levels.astype(np.int16)))
+        docIDs = docIDs[order]
+        term_levels = term_levels[order]
+        starts = np.flatnonzero(np.diff(term_levels.astype(np.int16), prepend=-1))
+        levels.extend(term_levels[starts])
+        if len(starts) > 0:
+            block_starts.extend(n_postings + np.append(starts[1:], len(docIDs)))
+        term_blocks.append(len(levels))
+        doc_blocks.append(docIDs.astype('<u4'))
+        n_postings += len(docIDs)
+        if len(docIDs) > 0:
+            n_slots = max(n_slots, int(docIDs.max()) + 1)
+
+    sections = ['\n'.join(terms).encode('utf-8'),
+                np.asarray(dfs, dtype='<u4').tobytes(),
+                np.asarray(term_blocks, dtype='<u8').tobytes(),
+                np.asarray(block_starts, dtype='<u8').tobytes(),
+                np.asarray(levels, dtype=np.uint8).tobytes(),
+                np.concatenate(doc_blocks + [np.zeros(0, dtype='<u4')]).tobytes()]
+
+    f = open(filename, 'wb')
+    f.write(b'\0' * HEADER.size)
+    offsets = []
+    for section in sections:
+        f.write(b'\0' * (-f.tell() % 8))
+        offsets.append(f.tell())
+        f.write(section)
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, VERSION, SCORINGS.index(scoring), inverted_index.nDocs, len(terms), n_slots,
+                        scale, len(levels), n_postings, *offsets))
+    f.close()
+
+
+def openImpactIndex(index_filename):
+    ''' open the impact index written for an index file, or return None if
+    there is none'''
+    if os.path.exists(impactFilename(index_filename)):
+        return ImpactIndex(impactFilename(index_filename))
+    return None
+
+
+class ImpactIndex:
+    ''' read-only impact index backed by a memory-mapped file'''
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.generation = inverted_ind.nextGeneration() # the index is never modified
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = struct.unpack_from('<4sI', self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not an impact index of version %d, write it again' % (filename, VERSION))
+        (magic, version, scoring, self.nDocs, nTerms, self.n_slots, self.scale, nBlocks, nPostings,
+         terms_offset, df_offset, term_blocks_offset, block_starts_offset, levels_offset,
+         docIDs_offset) = HEADER.unpack_from(self.mm, 0)
+        self.scoring = SCORINGS[scoring]
+
+        self.terms = []
+        if nTerms > 0:
+            self.terms = self.mm[terms_offset:df_offset].rstrip(b'\0').decode('utf-8').split('\n')
+        self.dictionary = {}
+        for term_id, term in enumerate(self.terms):
+            self.dictionary[term] = term_id
+
+        # The tables are small; the docIDs are left in the mapped file
+        self.df = np.frombuffer(self.mm, '<u4', nTerms, df_offset)
+        self.term_blocks = np.frombuffer(self.mm, '<u8', nTerms + 1, term_blocks_offset).astype(np.intp)
+        self.block_starts = np.frombuffer(self.mm, '<u8', nBlocks + 1, block_starts_offset).astype(np.intp)
+        self.levels = np.frombuffer(self.mm, np.uint8, nBlocks, levels_offset)
+        self.docIDs = np.frombuffer(self.mm, '<u4', nPostings, docIDs_offset)
+
+    def close(self):
+        self.df = self.term_blocks = self.block_starts = self.levels = self.docIDs = None
+        try:
+            self.mm.close()
+        except BufferError:
+            pass # arrays still view the mapped file, which is unmapped once they are gone
+        self.file.close()
+
+    def blocks(self, term):
+        ''' return the range of block indexes of a term, empty for unknown terms'''
+        term_id = self.dictionary.get(term)
+        if term_id is None:
+            return range(0)
+        return range(self.term_blocks[term_id], self.term_blocks[term_id + 1])
+
+    def postings(self, term):
+        ''' return the (docID, impact) pairs of a term, highest impact first'''
+        pairs = []
+        for block in self.blocks(term):
+            impact = float(self.levels[block]) * self.scale
+            for docID in self.docIDs[self.block_starts[block]:self.block_starts[block + 1]]:
+                pairs.append((int(docID), impact))
+        return pairs
+
+    def idf(self, term):
+        ''' compute the inverted document frequency for a given term'''
+        df = self.df[self.dictionary[term]]
+        # A term left without live documents, in a segmented index, weighs 0
+        if df > 0 and (self.nDocs/df) > 0:
+            idf = math.log(self.nDocs/df)
+        else:
+            idf = 0
+        return idf
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def setUp(self):
+        self.inverted_index = inverted_ind.InvertedIndex()
+        texts = ['wing flutter wing flow', 'flutter of the body flow', 'body wing wing wing heat flow',
+                 'heat transfer flow', 'wing flow']
+        for i, text in enumerate(texts):
+            self.inverted_index.indexDoc(d.Document(str(i + 1), 'temp', 'me', text))
+        self.inverted_index.sort()
+
+    def tearDown(self):
+        if os.path.exists('output_test.impact'):
+            os.remove('output_test.impact')
+
+    def test_write(self):
+        writeImpactIndex(self.inverted_index, 'output_test.impact')
+        impact_index = ImpactIndex('output_test.impact')
+        try:
+            assert impact_index.scoring == 'tfidf'
+            assert impact_index.nDocs == 5 and impact_index.n_slots == 6
+            assert impact_index.dictionary == self.inverted_index.dictionary
+            assert impact_index.idf('wing') == self.inverted_index.idf('wing')
+
+            # Every posting of a term, highest impact first, each within half
+            # a level of its normalized tf-idf weight
+            norms = self.inverted_index.norms()
+            for item in self.inverted_index.items:
+                postings = impact_index.postings(item.term)
+                idf = self.inverted_index.idf(item.term)
+                assert sorted(docID for docID, impact in postings) == (list(item.docIDs()) if idf > 0 else [])
+                assert [impact for docID, impact in postings] == sorted([impact for docID, impact in postings], reverse=True)
+                for docID, impact in postings:
+                    weight = item.posting[docID].term_freq(None) * idf / norms[docID]
+                    assert abs(impact - weight) <= impact_index.scale / 2 + 1e-12
+            assert max(impact for docID, impact in impact_index.postings('wing')) <= LEVELS * impact_index.scale
+            assert impact_index.postings('missing') == []
+
+            # 'flow' is in every document, so its idf and impacts are 0
+            assert impact_index.postings('flow') == [] and impact_index.df[impact_index.dictionary['flow']] == 5
+        finally:
+            impact_index.close()
+
+    def test_bm25(self):
+        writeImpactIndex(self.inverted_index, 'output_test.impact', 'bm25')
+        impact_index = ImpactIndex('output_test.impact')
+        try:
+            assert impact_index.scoring == 'bm25'
+
+            # The longer document 3 has a lower impact for 'heat' than 4
+            impacts = dict(impact_index.postings('heat'))
+            assert impacts[4] > impacts[3]
+            average_length = np.mean(list(self.inverted_index.docLength.values()))
+            idf = math.log(1 + (5 - 2 + 0.5) / (2 + 0.5))
+            weight = idf * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 3 / average_length))
+            assert abs(impacts[4] - weight) <= impact_index.scale / 2 + 1e-12
+        finally:
+            impact_index.close()
+        self.assertRaises(ValueError, writeImpactIndex, self.inverted_index, 'output_test.impact', 'tf')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='write the impact index of an index file')
+    parser.add_argument('index_filename')
+    parser.add_argument('--scoring', choices=SCORINGS, default='tfidf')
+    args = parser.parse_args()
+    writeImpactIndex(diskindex.openIndex(args.index_filename), impactFilename(args.index_filename), args.scoring)
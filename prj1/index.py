@@ -2,18 +2,32 @@
 
 Index structure:
     The Index class contains a list of IndexItems, stored in a dictionary type for easier access
+    the dictionary maps each term to its term ID, which is the position of its IndexItem in the list
     each IndexItem contains the term and a set of PostingItems
     each PostingItem contains a document ID and a list of positions that the term occurs
+    after sorting, the index may be frozen, replacing each IndexItem by a compact 
+    FrozenIndexItem (see postings.py) that can no longer be added to
     
 '''
 
 import util
 import doc as d
 import cran
+from postings import FrozenIndexItem
 import unittest
 import math
 import pickle
 import sys
+import os
+import heapq
+import operator
+import shutil
+import tempfile
+import argparse
+import concurrent.futures
+import itertools
+import collections
+import numpy as np
 import nltk
 
 class Posting:
@@ -32,8 +46,10 @@ class Posting:
         self.positions.extend(positions)
 
     def term_freq(self, doc_length):
-        ''' return the term frequency in the document'''
-#        return (len(self.positions)/doc_length)
+        ''' return the term frequency in the document, divided by the
+        document length if one is given'''
+        if doc_length:
+            return len(self.positions) / doc_length
         return len(self.positions)
 
 
@@ -51,61 +67,112 @@ class IndexItem:
 
     def sort(self):
         ''' sort by document ID for more efficient merging. For each document also sort the positions'''
-        for item in sorted(self.posting.keys()):
-            self.sorted_postings.append(item)
+        self.sorted_postings = sorted(self.posting.keys())
+
+    def docIDs(self):
+        ''' return the sorted docIDs'''
+        if len(self.sorted_postings) != len(self.posting):
+            return sorted(self.posting.keys())
+        return self.sorted_postings
+
+    def termFreqs(self):
+        ''' return the term frequency for each docID, in docID order'''
+        return [len(self.posting[docID].positions) for docID in self.docIDs()]
+
+    def positions(self, docIDs):
+        ''' return the positions of the term in each of the given docIDs'''
+        return [self.posting[docID].positions for docID in docIDs]
+
+
+class IndexUnpickler(pickle.Unpickler):
+    ''' index files written by running index.py as a script refer to
+    __main__.IndexItem and __main__.Posting; map them back to this module'''
+
+    def find_class(self, module, name):
+        if module == '__main__' and name in ('IndexItem', 'Posting'):
+            return globals()[name]
+        return super().find_class(module, name)
+
+
+_generations = itertools.count(1)
+
+def nextGeneration():
+    ''' return a new generation for an index. Generations are unique across
+    all indexes, including those built in other processes, so a cached
+    result computed from an index is only valid while the index keeps the
+    same generation'''
+    return (os.getpid(), next(_generations))
 
 
 class InvertedIndex:
 
     def __init__(self):
-        self.items = [] # list of IndexItems
+        self.generation = nextGeneration() # changes whenever the index is modified or loaded
+        self.items = [] # list of IndexItems, ordered by term ID
+        self.dictionary = {} # maps each term to its term ID
         self.nDocs = 0  # the number of indexed documents
-        self.docLength = {} # The length of each document
+        self.docLength = {} # The length of each document, by docID
+        self.docNorm = None # length of each document's tf-idf vector, by docID
+        self.maxWeight = None # highest normalized tf-idf weight of each term, by term ID
+
+    def termID(self, term):
+        ''' return the term ID for a term, adding a new IndexItem if the
+        term has not been seen before'''
+        term_id = self.dictionary.get(term)
+        if term_id is None:
+            term_id = len(self.items)
+            self.dictionary[term] = term_id
+            self.items.append(IndexItem(term))
+        return term_id
+
+    def rebuildDictionary(self):
+        ''' rebuild the term dictionary from the list of IndexItems'''
+        self.dictionary = {}
+        for term_id, item in enumerate(self.items):
+            self.dictionary[item.term] = term_id
 
     def indexDoc(self, doc): # indexing a Document object
-        ''' indexing a document, using the simple SPIMI algorithm, but no need 
-        to store blocks due to the small collection we are handling. 
-        Using save/load the whole index instead'''
+        ''' indexing a document, using the simple SPIMI algorithm. The whole
+        index is kept in memory and saved/loaded at once; use SPIMIIndexer
+        to store blocks on disk for collections that do not fit in memory.
+        Returns the number of tokens indexed'''
         
         # Tokenize document, remove stop words, normalize, and stem
-        tokens = util.preprocess(doc.body)
+        tokens = util.getAnalyzer().analyze(doc.body)
         
-        # Add tokens to dictionary 
+        # Add tokens to dictionary. New terms get a new IndexItem, existing
+        # terms have their posting updated to include the new document and
+        # position
+        docID = int(doc.docID)
         token_counter = 0
         for token in tokens:
-            found = False
-            for item in self.items:
-                if token == item.term:
-                    found = True
-                    break
-                    
-            # If token not stored in dictionary already, then add it and create
-            # a posting
-            if found == False:
-                item = IndexItem(token)
-                item.add(int(doc.docID), token_counter)
-                self.items.append(item)
-                
-            # If token is already in dictionary, update posting to include
-            # new document(s) and position(s)
-            else:
-                for index in self.items:
-                    if index.term == token:
-                        index.add(int(doc.docID), token_counter)
+            self.items[self.termID(token)].add(docID, token_counter)
             token_counter += 1
                         
         self.nDocs += 1
-        self.docLength.update({self.nDocs : len(doc.body.split())})
+        self.docLength.update({docID : len(doc.body.split())})
+        self.docNorm = None
+        self.maxWeight = None
+        self.generation = nextGeneration()
+        
+        return token_counter
         
     def sort(self):
         ''' sort all posting lists by docID'''
         for item in self.items:
             item.sort()
 
+    def freeze(self, compressed=False):
+        ''' replace every IndexItem by a read-only FrozenIndexItem, optionally
+        with varint compressed posting lists'''
+        for term_id, item in enumerate(self.items):
+            if not isinstance(item, FrozenIndexItem):
+                self.items[term_id] = FrozenIndexItem.fromIndexItem(item, compressed)
+
     def find(self, term):
-        for item in self.items:
-            if item.term == term:
-                return item
+        term_id = self.dictionary.get(term)
+        if term_id is not None:
+            return self.items[term_id]
         
         # If the term doesn't exist return an empty object
         return None
@@ -114,28 +181,287 @@ class InvertedIndex:
     def save(self, filename):
         ''' save to disk'''
         serial_data=open(filename, 'wb')
-        pickle.dump([self.items, self.nDocs, self.docLength], serial_data, -1)
+        pickle.dump([self.items, self.nDocs, self.docLength, self.dictionary, self.norms(),
+                     self.maxWeights()], serial_data, -1)
         serial_data.close()
 
     def load(self, filename):
         ''' load from disk'''
         serial_data= open(filename, 'rb')
-        data = pickle.load(serial_data)
+        data = IndexUnpickler(serial_data).load()
+        self.generation = nextGeneration()
+        
+        # Index files written by SPIMIIndexer are a stream of records
+        if isinstance(data, tuple) and data[0] == SPIMI_FORMAT:
+            self.loadStream(data, serial_data)
+            serial_data.close()
+            return
         serial_data.close()
         
         self.items = data[0]
         self.nDocs = data[1]
-        self.docLength = data[2]
+        
+        # Older index files were saved without the document lengths and/or
+        # the term dictionary
+        if len(data) > 2:
+            self.docLength = data[2]
+        else:
+            self.docLength = {}
+        if len(data) > 3:
+            self.dictionary = data[3]
+        else:
+            self.rebuildDictionary()
+        
+        # Document norms and term weights are computed on first use if they
+        # were not saved
+        if len(data) > 4:
+            self.docNorm = data[4]
+        else:
+            self.docNorm = None
+        if len(data) > 5:
+            self.maxWeight = data[5]
+        else:
+            self.maxWeight = None
+
+    def merge(self, other):
+        ''' merge another index into this one. The other index must hold
+        documents that come after the documents of this index, in docID
+        order'''
+        for item in other.items:
+            self.items[self.termID(item.term)].posting.update(item.posting)
+        self.nDocs += len(other.docLength)
+        self.docLength.update(other.docLength)
+        self.docNorm = None
+        self.maxWeight = None
+        self.generation = nextGeneration()
+
+    def loadStream(self, header, serial_data):
+        ''' load the records of an index file written by SPIMIIndexer: the
+        document lengths of each block followed by one IndexItem per term'''
+        self.items = []
+        self.nDocs = header[1]
+        self.docLength = {}
+        self.docNorm = None
+        self.maxWeight = None
+        while True:
+            try:
+                record = IndexUnpickler(serial_data).load()
+            except EOFError:
+                break
+            
+            if isinstance(record, dict):
+                self.docLength.update(record)
+            else:
+                self.items.append(record)
+        self.rebuildDictionary()
+
+    def norms(self):
+        ''' return the document norms, computing them if the index changed'''
+        if self.docNorm is None:
+            self.docNorm = computeNorms(self)
+        return self.docNorm
+
+    def maxWeights(self):
+        ''' return the highest weight of each term, see computeMaxWeights'''
+        if self.maxWeight is None:
+            self.maxWeight = computeMaxWeights(self)
+        return self.maxWeight
+
+    def idf(self, term):
+        ''' compute the inverted document frequency for a given term'''
+        df = len(self.find(term).docIDs())
+        if (self.nDocs/df) > 0:
+            idf = math.log(self.nDocs/df)
+        else:
+            idf = 0
+        return idf
+
+def computeNorms(inverted_index):
+    ''' compute the length of the tf-idf vector of every document, as an
+    array indexed by docID (0 for docIDs that are not in the index)'''
+    squares = {}
+    for item in inverted_index.items:
+        idf = inverted_index.idf(item.term)
+        for docID, tf in zip(item.docIDs(), item.termFreqs()):
+            squares[docID] = squares.get(docID, 0) + (tf * idf) ** 2
+    
+    norms = np.zeros(max(squares) + 1 if squares else 0)
+    for docID, square in squares.items():
+        norms[docID] = math.sqrt(square)
+    return norms
+
+
+def computeMaxWeights(inverted_index):
+    ''' compute the highest tf-idf weight of every term in any document, 
+    divided by the document norm, as an array indexed by term ID. This
+    bounds the score a term can add to a document in a vector query'''
+    norms = inverted_index.norms()
+    weights = np.zeros(len(inverted_index.items))
+    for term_id, item in enumerate(inverted_index.items):
+        docIDs = np.asarray(item.docIDs(), dtype=np.intp)
+        if len(docIDs) == 0:
+            continue
+        tfs = np.asarray(item.termFreqs(), dtype=float) * inverted_index.idf(item.term)
+        doc_weights = np.zeros(len(docIDs))
+        np.divide(tfs, norms[docIDs], out=doc_weights, where=norms[docIDs] > 0)
+        weights[term_id] = doc_weights.max()
+    return weights
+
+
+SPIMI_FORMAT = 'spimi'
+
+
+def readBlock(block_file):
+    ''' generator over the (term, posting) records of a block file, in
+    term order. The first record of a block holds its document lengths'''
+    f = open(block_file, 'rb')
+    try:
+        IndexUnpickler(f).load()
+        while True:
+            try:
+                yield IndexUnpickler(f).load()
+            except EOFError:
+                return
+    finally:
+        f.close()
+
+
+class SPIMIIndexer:
+    ''' single-pass in-memory indexing with a memory budget. Documents are
+    indexed into an in-memory block; when the estimated size of the block
+    reaches the budget, the block is written to a temporary file sorted by
+    term. write() then does a k-way merge of the blocks into the final
+    index file, so at most one block is held in memory at a time'''
+
+    # Rough per-object costs (bytes) used to estimate the size of a block
+    TERM_BYTES = 250
+    TOKEN_BYTES = 80
+    DOC_BYTES = 100
+
+    def __init__(self, memory_budget, tmp_dir=None):
+        ''' memory_budget is the estimated size of a block in bytes'''
+        self.memory_budget = memory_budget
+        self.tmp_dir = tempfile.mkdtemp(prefix='spimi', dir=tmp_dir)
+        self.blocks = [] # filenames of the blocks written so far
+        self.block = InvertedIndex()
+        self.block_bytes = 0
+
+    def indexDoc(self, doc):
+        ''' index a document into the current block, flushing the block to
+        disk once it reaches the memory budget'''
+        n_terms = len(self.block.items)
+        n_tokens = self.block.indexDoc(doc)
+        n_terms = len(self.block.items) - n_terms
+        
+        self.block_bytes += n_terms * self.TERM_BYTES + n_tokens * self.TOKEN_BYTES + self.DOC_BYTES
+        if self.block_bytes >= self.memory_budget:
+            self.flush()
+
+    def flush(self):
+        ''' write the current block to disk, sorted by term'''
+        if len(self.block.docLength) == 0:
+            return
+        
+        block_file = os.path.join(self.tmp_dir, 'block%d.p' % len(self.blocks))
+        f = open(block_file, 'wb')
+        pickle.dump(self.block.docLength, f, -1)
+        for item in sorted(self.block.items, key=operator.attrgetter('term')):
+            pickle.dump((item.term, item.posting), f, -1)
+        f.close()
+        self.blocks.append(block_file)
+        
+        # Start a new block, continuing the document count so that document
+        # lengths are numbered as if the whole collection were one block
+        nDocs = self.block.nDocs
+        self.block = InvertedIndex()
+        self.block.nDocs = nDocs
+        self.block_bytes = 0
+
+    def write(self, index_filename):
+        ''' merge all blocks into the final index file and remove them'''
+        self.flush()
+        
+        out = open(index_filename, 'wb')
+        pickle.dump((SPIMI_FORMAT, self.block.nDocs), out, -1)
+        
+        for block_file in self.blocks:
+            f = open(block_file, 'rb')
+            pickle.dump(IndexUnpickler(f).load(), out, -1)
+            f.close()
+        
+        # Blocks hold documents in increasing docID order, and merge is 
+        # stable, so postings of the same term arrive in docID order
+        blocks = [readBlock(block_file) for block_file in self.blocks]
+        item = None
+        for term, posting in heapq.merge(*blocks, key=operator.itemgetter(0)):
+            if item is None or item.term != term:
+                if item is not None:
+                    item.sort()
+                    pickle.dump(item, out, -1)
+                item = IndexItem(term)
+            item.posting.update(posting)
+        if item is not None:
+            item.sort()
+            pickle.dump(item, out, -1)
+        
+        out.close()
+        shutil.rmtree(self.tmp_dir)
+
+
+class StreamedIndex:
+    ''' read-only view of an index file written by SPIMIIndexer. Only the
+    document lengths and the document frequency of each term are held in
+    memory; the posting lists are read back from the file each time items
+    is iterated, one term at a time'''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.docLength = {}
+        self.df = {}
+        self.docNorm = None
+        for record in self.records():
+            if isinstance(record, dict):
+                self.docLength.update(record)
+            else:
+                self.df[record.term] = len(record.posting)
+
+    def records(self):
+        ''' generator over the records of the file that follow its header'''
+        f = open(self.filename, 'rb')
+        try:
+            header = IndexUnpickler(f).load()
+            if not (isinstance(header, tuple) and header[0] == SPIMI_FORMAT):
+                raise ValueError('%s was not written by SPIMIIndexer' % self.filename)
+            self.nDocs = header[1]
+            while True:
+                try:
+                    yield IndexUnpickler(f).load()
+                except EOFError:
+                    return
+        finally:
+            f.close()
+
+    @property
+    def items(self):
+        ''' the posting list of every term, in term order'''
+        return (record for record in self.records() if not isinstance(record, dict))
+
+    def norms(self):
+        ''' return the document norms, computing them on first use'''
+        if self.docNorm is None:
+            self.docNorm = computeNorms(self)
+        return self.docNorm
 
     def idf(self, term):
         ''' compute the inverted document frequency for a given term'''
-        index_item = self.find(term)
-        if (self.nDocs/len(index_item.sorted_postings)) > 0:
-            idf = math.log(self.nDocs/len(index_item.sorted_postings))
+        df = self.df[term]
+        if df > 0 and (self.nDocs/df) > 0:
+            idf = math.log(self.nDocs/df)
         else:
             idf = 0
         return idf
 
+
 class test(unittest.TestCase):
     ''' test your code thoroughly. put the testing cases here'''
 
@@ -156,6 +482,19 @@ class test(unittest.TestCase):
                 
         assert 'to' not in processed_tokens
         
+# Test that the analyzer gives the same tokens as the step by step pipeline
+    def test_analyzer(self):
+        text = "Dogs are friendly, but cats can be aloof."
+        analyzer = util.Analyzer()
+        expected = []
+        for token in util.tokenize(text):
+            if util.isStopWord(token) is False:
+                expected.append(util.stemming(token))
+        
+        assert analyzer.analyze(text) == expected
+        assert analyzer.analyze_many([text, 'Hello, World!']) == [expected, ['hello', 'world']]
+        assert analyzer.analyzeToken.cache_info().hits > 0
+        
 # Test that terms are added to the dictionary and their postings are updated as
 # expected
     def test_new_dictionary_terms(self):
@@ -173,6 +512,15 @@ class test(unittest.TestCase):
         
         assert inverted_index.items[0].posting[1].term_freq(inverted_index.docLength[1]) == (4/7)
 
+    # Test that document lengths are stored by docID, not by the order in
+    # which documents were indexed
+    def test_doc_length(self):
+        inverted_index = InvertedIndex()
+        inverted_index.indexDoc(d.Document('9','temp','me','Hello, World!'))
+        inverted_index.indexDoc(d.Document('5','temp','me','This is my sixth test.'))
+        assert inverted_index.docLength == {9: 2, 5: 5}
+        assert inverted_index.nDocs == 2
+
 # Test that sorting happens as expected
     def test_index_sorting(self):
         inverted_index = InvertedIndex()
@@ -202,25 +550,261 @@ class test(unittest.TestCase):
         inverted_index_new = InvertedIndex()
         inverted_index_new.load('output.p')
         assert inverted_index.items[0].term == inverted_index_new.items[0].term
+        assert inverted_index_new.find('test') is inverted_index_new.items[0]
 
-def indexingCranfield(doc_filename, index_filename):
-    
-    # Load cran.all and create a cran_file object to store the document info
-    cran_file = cran.CranFile(doc_filename)
+# Test that the term dictionary and the list of IndexItems agree
+    def test_find(self):
+        inverted_index = InvertedIndex()
+        doc1 = d.Document('1','temp','me','Hello, World!')
+        doc2 = d.Document('2','temp','me','Hello again.')
+        inverted_index.indexDoc(doc1)
+        inverted_index.indexDoc(doc2)
+        
+        assert len(inverted_index.dictionary) == len(inverted_index.items)
+        assert inverted_index.find('hello').term == 'hello'
+        assert inverted_index.find('hello') is inverted_index.items[inverted_index.dictionary['hello']]
+        assert sorted(inverted_index.find('hello').posting.keys()) == [1, 2]
+        assert inverted_index.find('goodbye') is None
+        
+    def test_load_old_format(self):
+        inverted_index = InvertedIndex()
+        doc = d.Document('1','temp','me','Hello, World!')
+        inverted_index.indexDoc(doc)
         
+        # Index files written before the term dictionary only held 3 items
+        serial_data = open('output_old.p', 'wb')
+        pickle.dump([inverted_index.items, inverted_index.nDocs, inverted_index.docLength], serial_data, -1)
+        serial_data.close()
+        
+        inverted_index_new = InvertedIndex()
+        inverted_index_new.load('output_old.p')
+        os.remove('output_old.p')
+        assert inverted_index_new.find('world').term == 'world'
+
+# Test that indexing with blocks on disk gives the same index as indexing in
+# memory
+    def test_spimi_blocks(self):
+        doc_list = [d.Document('1','temp','me','Hello, World!'),
+                    d.Document('2','temp','me','This is my sixth test.'),
+                    d.Document('3','temp','me','I hope you enjoy this test.'),
+                    d.Document('4','temp','me','Hello test, hello world.')]
+        
+        inverted_index = InvertedIndex()
+        spimi = SPIMIIndexer(1)
+        for doc in doc_list:
+            inverted_index.indexDoc(doc)
+            spimi.indexDoc(doc)
+        inverted_index.sort()
+        
+        assert len(spimi.blocks) == 4
+        spimi.write('output_spimi.p')
+        inverted_index_new = InvertedIndex()
+        inverted_index_new.load('output_spimi.p')
+        
+        assert inverted_index_new.nDocs == inverted_index.nDocs
+        assert inverted_index_new.docLength == inverted_index.docLength
+        assert sorted(inverted_index_new.dictionary) == sorted(inverted_index.dictionary)
+        for item in inverted_index.items:
+            item_new = inverted_index_new.find(item.term)
+            assert item_new.sorted_postings == item.sorted_postings
+            for docID in item.sorted_postings:
+                assert item_new.posting[docID].positions == item.posting[docID].positions
+        
+        # The same impact index is written from the file read as a stream
+        import impact
+        streamed = StreamedIndex('output_spimi.p')
+        assert streamed.nDocs == inverted_index.nDocs and streamed.docLength == inverted_index.docLength
+        assert np.allclose(streamed.norms(), inverted_index.norms())
+        for scoring in impact.SCORINGS:
+            impact.writeImpactIndex(inverted_index, 'output_spimi.impact', scoring)
+            impact.writeImpactIndex(streamed, 'output_spimi_streamed.impact', scoring)
+            expected = impact.ImpactIndex('output_spimi.impact')
+            impact_index = impact.ImpactIndex('output_spimi_streamed.impact')
+            assert sorted(impact_index.dictionary) == sorted(expected.dictionary)
+            for term in expected.dictionary:
+                assert impact_index.postings(term) == expected.postings(term)
+            impact_index.close()
+            expected.close()
+        os.remove('output_spimi.impact')
+        os.remove('output_spimi_streamed.impact')
+        os.remove('output_spimi.p')
+
+# Test that a frozen index holds the same postings and survives save and load
+    def test_freeze(self):
+        inverted_index = InvertedIndex()
+        doc1 = d.Document('1','temp','me','Hello, World!')
+        doc2 = d.Document('2','temp','me','Hello test, hello world.')
+        inverted_index.indexDoc(doc1)
+        inverted_index.indexDoc(doc2)
+        inverted_index.sort()
+        
+        inverted_index.freeze(compressed=True)
+        inverted_index.save('output_frozen.p')
+        inverted_index_new = InvertedIndex()
+        inverted_index_new.load('output_frozen.p')
+        os.remove('output_frozen.p')
+        
+        item = inverted_index_new.find('hello')
+        assert isinstance(item, FrozenIndexItem)
+        assert item.sorted_postings == [1, 2]
+        assert item.posting[2].positions == [0, 2]
+        assert inverted_index_new.idf('test') == math.log(2)
+
+# Test that document norms are the lengths of the tf-idf document vectors
+    def test_norms(self):
+        inverted_index = InvertedIndex()
+        doc1 = d.Document('1','temp','me','Hello, World!')
+        doc2 = d.Document('3','temp','me','Hello test, test world.')
+        doc3 = d.Document('4','temp','me','Goodbye.')
+        for doc in [doc1, doc2, doc3]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+        
+        idf = math.log(3/2)
+        norms = inverted_index.norms()
+        assert len(norms) == 5
+        assert norms[2] == 0
+        assert abs(norms[1] - math.sqrt(2 * idf**2)) < 1e-12
+        assert abs(norms[3] - math.sqrt(2 * idf**2 + (2 * math.log(3))**2)) < 1e-12
+        
+        weights = inverted_index.maxWeights()
+        assert abs(weights[inverted_index.dictionary['test']] - 2 * math.log(3) / norms[3]) < 1e-12
+        assert abs(weights[inverted_index.dictionary['hello']] - idf / norms[1]) < 1e-12
+        
+        inverted_index.indexDoc(d.Document('5','temp','me','Hello.'))
+        assert len(inverted_index.norms()) == 6
+        assert inverted_index.maxWeight is None
+
+# Test that building the index in parallel gives the same index as building it
+# serially
+    def test_parallel_build(self):
+        doc_list = [d.Document('1','temp','me','Hello, World!'),
+                    d.Document('2','temp','me','This is my sixth test.'),
+                    d.Document('3','temp','me','I hope you enjoy this test.'),
+                    d.Document('4','temp','me','Hello test, hello world.'),
+                    d.Document('5','temp','me','Goodbye.')]
+        
+        inverted_index = buildIndex(doc_list)
+        inverted_index_new = buildIndex(iter(doc_list), workers=2, batch_size=1)
+        
+        assert inverted_index_new.nDocs == inverted_index.nDocs
+        assert inverted_index_new.docLength == inverted_index.docLength
+        assert inverted_index_new.dictionary == inverted_index.dictionary
+        for item, item_new in zip(inverted_index.items, inverted_index_new.items):
+            assert item_new.term == item.term
+            assert list(item_new.posting) == list(item.posting)
+            for docID in item.posting:
+                assert item_new.posting[docID].positions == item.posting[docID].positions
+
+def indexBatch(batch):
+    ''' build a partial index for a batch of documents. batch is a tuple of
+    the documents and the number of documents that come before them'''
+    docs, nDocs = batch
     inverted_index = InvertedIndex()
-    for doc in cran_file.docs:
+    inverted_index.nDocs = nDocs
+    for doc in docs:
         inverted_index.indexDoc(doc)
+    return inverted_index
+
+
+def buildIndex(docs, workers=1, batch_size=100):
+    ''' index an iterable of Documents, such as cran.iter_docs. With more
+    than one worker, batches of documents are indexed in a process pool and
+    the partial indexes are merged in document order, which gives the same
+    index as indexing the documents one at a time. At most two batches per
+    worker are read ahead, so the documents are never all held in memory'''
+    inverted_index = InvertedIndex()
+    if workers <= 1:
+        for doc in docs:
+            inverted_index.indexDoc(doc)
+        return inverted_index
+
+    docs = iter(docs)
+    pending = collections.deque() # futures of the submitted batches, in order
+    nDocs = 0
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        while True:
+            batch = list(itertools.islice(docs, batch_size))
+            if len(batch) > 0:
+                pending.append(executor.submit(indexBatch, (batch, nDocs)))
+                nDocs += len(batch)
+            if len(pending) == 0:
+                break
+            if len(batch) == 0 or len(pending) >= 2 * workers:
+                inverted_index.merge(pending.popleft().result())
+    return inverted_index
+
+
+def saveDocumentStore(doc_filename, index_filename):
+    ''' save the location of each document of the collection next to the
+    index, so that queries can read documents without parsing the whole
+    collection'''
+    collection = d.Collection.fromFile(doc_filename)
+    collection.save(d.storeFilename(index_filename))
+    collection.close()
+
+
+def indexingCranfield(doc_filename, index_filename, memory_budget=None, workers=1, freeze=False, compressed=False,
+                      impact_scoring=None):
+    ''' index the collection; if a memory_budget (in bytes) is given, use 
+    SPIMIIndexer to keep blocks on disk instead of building in memory.
+    Otherwise the index is built in memory using the given number of worker
+    processes, and optionally frozen into compact posting lists. With an
+    impact_scoring ('tfidf' or 'bm25'), the impact index of impact.py is
+    written next to the index'''
+    
+    # Stream the documents of cran.all one at a time
+    docs = cran.iter_docs(doc_filename)
+
+    if memory_budget is not None:
+        spimi = SPIMIIndexer(memory_budget)
+        for doc in docs:
+            spimi.indexDoc(doc)
+        spimi.write(index_filename)
+        saveDocumentStore(doc_filename, index_filename)
+        if impact_scoring is not None:
+            import impact
+            impact.writeImpactIndex(StreamedIndex(index_filename), impact.impactFilename(index_filename),
+                                    impact_scoring)
+        print('Done')
+        return
+        
+    inverted_index = buildIndex(docs, workers)
          
     # Sort the index by docID
     inverted_index.sort()
+    inverted_index.norms()
+    inverted_index.maxWeights()
+    if freeze:
+        inverted_index.freeze(compressed)
     
     # Save the index
     inverted_index.save(index_filename)
+    saveDocumentStore(doc_filename, index_filename)
+    if impact_scoring is not None:
+        import impact
+        impact.writeImpactIndex(inverted_index, impact.impactFilename(index_filename), impact_scoring)
 
     print('Done')
 
 if __name__ == '__main__':
 #    unittest.main()
 #    indexingCranfield('cran.all', 'output.p')
-    indexingCranfield(sys.argv[1], sys.argv[2])
\ No newline at end of file
+#    indexingCranfield('cran.all', 'output.p', 64 * 2**20) # 64MB blocks
+#    indexingCranfield('cran.all', 'output.p', workers=4)
+    parser = argparse.ArgumentParser(description='index the Cranfield collection')
+    parser.add_argument('doc_filename')
+    parser.add_argument('index_filename')
+    parser.add_argument('--budget', type=int, help='SPIMI block size in MB')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--freeze', action='store_true', help='store compact posting lists')
+    parser.add_argument('--compress', action='store_true', help='varint compress frozen posting lists')
+    parser.add_argument('--impact', choices=['tfidf', 'bm25'],
+                        help='also write an impact-ordered index with these scores, see impact.py')
+    args = parser.parse_args()
+    
+    memory_budget = None
+    if args.budget is not None:
+        memory_budget = args.budget * 2**20
+    indexingCranfield(args.doc_filename, args.index_filename, memory_budget, args.workers,
+                      args.freeze or args.compress, args.compress, args.impact)
\ No newline at end of file
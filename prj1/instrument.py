@@ -0,0 +1,288 @@
+'''
+
+Query instrumentation
+
+QueryStats holds the time spent in each stage of one query, in nanoseconds
+measured with time.perf_counter_ns, and counters such as the number of
+terms corrected, postings touched and candidates scored. Stage names are
+dotted, and a stage includes the time of the stages named after it, e.g.
+'preprocess' includes 'preprocess.spelling'. 'total' is the whole query.
+
+A QueryProcessor created with instrumented=True leaves the QueryStats of its
+last query in its stats attribute; otherwise stats is NULL_STATS, which
+records nothing and costs next to nothing. StatsAggregator summarizes the
+stats of many queries, per mode, with latency percentiles per stage.
+
+SlowQueryProfiler is an opt-in hook: it runs every query under cProfile, and
+optionally tracemalloc, and keeps a report of the queries slower than a
+threshold. Profiling slows the queries down, so only enable it to find out
+why some queries are slow.
+
+'''
+
+import io
+import json
+import time
+import heapq
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+import unittest
+from collections import Counter
+import numpy as np
+
+
+class QueryStats:
+    ''' stage timings and counters of one query'''
+
+    enabled = True
+
+    def __init__(self, mode=None, query=None):
+        self.mode = mode
+        self.query = query
+        self.timings = {} # nanoseconds spent in each stage, in the order the stages were first entered
+        self.counters = Counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        ''' add the time spent in the with block to the stage'''
+        self.timings.setdefault(name, 0)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter_ns() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def toDict(self):
+        return {'mode': self.mode,
+                'query': self.query,
+                'timings_us': {name: ns / 1000 for name, ns in self.timings.items()},
+                'counters': dict(self.counters)}
+
+    def toJSON(self):
+        return json.dumps(self.toDict())
+
+
+class NullStats:
+    ''' stands in for QueryStats when queries are not instrumented'''
+
+    enabled = False
+    _null = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._null
+
+    def count(self, name, n=1):
+        pass
+
+    def toDict(self):
+        return {}
+
+    def toJSON(self):
+        return '{}'
+
+NULL_STATS = NullStats()
+
+
+class StatsAggregator:
+    ''' collects the QueryStats of many queries and summarizes them per mode'''
+
+    def __init__(self):
+        self.n_queries = Counter()
+        self.timings = {} # mode -> stage -> list of nanoseconds
+        self.counters = {} # mode -> Counter
+
+    def add(self, stats):
+        if not stats.enabled:
+            return
+        self.n_queries[stats.mode] += 1
+        timings = self.timings.setdefault(stats.mode, {})
+        for name, ns in stats.timings.items():
+            timings.setdefault(name, []).append(ns)
+        self.counters.setdefault(stats.mode, Counter()).update(stats.counters)
+
+    def merge(self, other):
+        ''' add the queries collected by another aggregator'''
+        self.n_queries.update(other.n_queries)
+        for mode, timings in other.timings.items():
+            for name, samples in timings.items():
+                self.timings.setdefault(mode, {}).setdefault(name, []).extend(samples)
+        for mode, counters in other.counters.items():
+            self.counters.setdefault(mode, Counter()).update(counters)
+
+    def summary(self):
+        ''' return, per mode, the number of queries, the time spent in each
+        stage by the queries that went through it, and the totals and means
+        per query of the counters'''
+        summary = {}
+        for mode, n in self.n_queries.items():
+            stages = {}
+            for name, samples in self.timings[mode].items():
+                samples = np.asarray(samples, dtype=np.float64) / 1000
+                stages[name] = {'count': len(samples),
+                                'total_ms': float(samples.sum() / 1000),
+                                'mean_us': float(samples.mean()),
+                                'p50_us': float(np.percentile(samples, 50)),
+                                'p90_us': float(np.percentile(samples, 90)),
+                                'p99_us': float(np.percentile(samples, 99)),
+                                'max_us': float(samples.max())}
+            counters = {name: {'total': total, 'mean': total / n}
+                        for name, total in sorted(self.counters[mode].items())}
+            summary[mode] = {'queries': n, 'stages': stages, 'counters': counters}
+        return summary
+
+    def toJSON(self, indent=None):
+        return json.dumps(self.summary(), indent=indent)
+
+
+class SlowQueryProfiler:
+    ''' profiles queries and keeps reports of the slowest ones taking at
+    least threshold_ms'''
+
+    def __init__(self, threshold_ms, memory=False, max_reports=20, top=25):
+        ''' memory also traces memory allocations with tracemalloc; at most
+        max_reports reports are kept, each listing the top functions by
+        cumulative time and, with memory, the top allocation sites'''
+        self.threshold_ms = threshold_ms
+        self.memory = memory
+        self.max_reports = max_reports
+        self.top = top
+        self.heap = [] # (elapsed ns, sequence number, report) of the slowest queries
+        self.n_profiled = 0
+        self.n_kept = 0
+
+    @contextlib.contextmanager
+    def profile(self, mode, query, stats=NULL_STATS):
+        ''' profile the with block, a query; stats, if instrumented, are
+        added to the report'''
+        profiler = cProfile.Profile()
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot() if self.memory else None
+        if self.memory:
+            tracemalloc.reset_peak()
+        try:
+            profiler.enable()
+        except ValueError: # another profiler is active in this thread
+            profiler = None
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            if profiler is not None:
+                profiler.disable()
+            self.n_profiled += 1
+            if elapsed >= self.threshold_ms * 1e6:
+                self.keep(elapsed, self.report(mode, query, stats, elapsed, profiler, before))
+            if tracing:
+                tracemalloc.stop()
+
+    def report(self, mode, query, stats, elapsed, profiler, before):
+        report = {'mode': mode, 'query': query, 'elapsed_ms': elapsed / 1e6}
+        if stats.enabled:
+            report['stats'] = stats.toDict()
+        if profiler is not None:
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(self.top)
+            report['profile'] = text.getvalue()
+        if before is not None:
+            after = tracemalloc.take_snapshot()
+            report['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            report['allocations'] = [str(diff) for diff in after.compare_to(before, 'lineno')[:self.top]]
+        return report
+
+    def keep(self, elapsed, report):
+        self.n_kept += 1
+        entry = (elapsed, self.n_kept, report)
+        if len(self.heap) < self.max_reports:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def spawn(self):
+        ''' return an empty profiler with the same settings, e.g. for a
+        worker process'''
+        return SlowQueryProfiler(self.threshold_ms, self.memory, self.max_reports, self.top)
+
+    def merge(self, other):
+        ''' add the reports kept by another profiler'''
+        self.n_profiled += other.n_profiled
+        for elapsed, _, report in other.heap:
+            self.keep(elapsed, report)
+
+    def reports(self):
+        ''' return the reports kept, slowest first'''
+        return [report for elapsed, _, report in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+def dump(filename, stats=None, profiler=None):
+    ''' write the summary of a StatsAggregator and the reports of a
+    SlowQueryProfiler to a JSON file'''
+    data = {}
+    if stats is not None:
+        data['stats'] = stats.summary()
+    if profiler is not None:
+        data['profiled_queries'] = profiler.n_profiled
+        data['slow_queries'] = profiler.reports()
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_stats(self):
+        stats = QueryStats('vector', 'wing')
+        with stats.stage('preprocess'):
+            with stats.stage('preprocess.spelling'):
+                pass
+        with stats.stage('preprocess'):
+            pass
+        stats.count('postings', 3)
+        stats.count('postings', 2)
+        assert list(stats.timings) == ['preprocess', 'preprocess.spelling']
+        assert stats.timings['preprocess'] >= stats.timings['preprocess.spelling']
+        assert json.loads(stats.toJSON())['counters'] == {'postings': 5}
+
+        with NULL_STATS.stage('preprocess'):
+            NULL_STATS.count('postings')
+        assert NULL_STATS.toDict() == {}
+
+    def test_aggregator(self):
+        aggregator = StatsAggregator()
+        for n in [1, 3]:
+            stats = QueryStats('boolean')
+            stats.timings['total'] = n * 1000
+            stats.count('postings', n)
+            aggregator.add(stats)
+        aggregator.add(NULL_STATS)
+        other = StatsAggregator()
+        other.merge(aggregator)
+        summary = other.summary()['boolean']
+        assert summary['queries'] == 2
+        assert summary['stages']['total']['mean_us'] == 2.0
+        assert summary['counters']['postings'] == {'total': 4, 'mean': 2.0}
+
+    def test_profiler(self):
+        profiler = SlowQueryProfiler(threshold_ms=0, memory=True, max_reports=2)
+        for i in range(3):
+            with profiler.profile('vector', 'query %d' % i):
+                [str(j) for j in range(1000 * (i + 1))]
+        reports = profiler.reports()
+        assert profiler.n_profiled == 3
+        assert len(reports) == 2
+        assert reports[0]['elapsed_ms'] >= reports[1]['elapsed_ms']
+        assert 'function calls' in reports[0]['profile']
+        assert 'peak_memory_bytes' in reports[0]
+        assert not tracemalloc.is_tracing()
+
+        fast = SlowQueryProfiler(threshold_ms=1e6)
+        with fast.profile('vector', 'query'):
+            pass
+        assert fast.reports() == []
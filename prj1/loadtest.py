@@ -0,0 +1,131 @@
+'''
+
+Load test for the search service of server.py
+
+Sends the Cranfield queries, over and over, from a number of concurrent
+keep-alive connections and reports the throughput and the latency
+percentiles of the responses.
+
+usage:
+    python loadtest.py [--port 8080] [--requests 1000] [--concurrency 8]
+                       [--mode vector] [--k 10] [--queries query.text] [--json]
+
+'''
+
+import asyncio
+import json
+import time
+import argparse
+import numpy as np
+from urllib.parse import quote
+
+import cranqry
+
+
+class Connection:
+    ''' a keep-alive HTTP/1.1 connection to the search service'''
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, payload=None):
+        ''' send a request, with payload as a JSON body, and return the
+        status and the decoded JSON response'''
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b''
+        if payload is not None:
+            body = json.dumps(payload).encode('utf-8')
+        head = ('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n'
+                'Content-Length: %d\r\n\r\n' % (method, path, self.host, len(body)))
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        response = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, json.loads(response.decode('utf-8'))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+
+
+async def loadTest(host, port, queries, n_requests, concurrency, mode, k):
+    ''' send n_requests search requests from concurrency connections and
+    return a summary of the latencies'''
+    latencies = []
+    statuses = {}
+    next_request = [0]
+
+    async def client():
+        connection = Connection(host, port)
+        try:
+            while next_request[0] < n_requests:
+                text = queries[next_request[0] % len(queries)]
+                next_request[0] += 1
+                path = '/search?q=%s&mode=%s&k=%d' % (quote(text), mode, k)
+                start = time.perf_counter()
+                try:
+                    status, response = await connection.request('GET', path)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    status = 0
+                    await connection.close()
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {'requests': len(latencies),
+            'concurrency': concurrency,
+            'mode': mode,
+            'errors': sum(count for status, count in statuses.items() if status != 200),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'elapsed_s': elapsed,
+            'throughput_rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p90_ms': float(np.percentile(latencies, 90)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='measure the throughput and latency of server.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--queries', default='query.text')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', default='vector', choices=['boolean', 'vector'])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    queries = [query.text.strip() for query in cranqry.loadCranQry(args.queries).values()]
+    summary = asyncio.run(loadTest(args.host, args.port, queries, args.requests, args.concurrency,
+                                   args.mode, args.k))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print('%d requests (%d errors) in %.2f s: %.1f requests/s' % (summary['requests'], summary['errors'],
+                                                                     summary['elapsed_s'], summary['throughput_rps']))
+        print('latency mean %.2f ms, p50 %.2f ms, p90 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+            summary['mean_ms'], summary['p50_ms'], summary['p90_ms'], summary['p99_ms'], summary['max_ms']))
@@ -2,21 +2,111 @@
 
 Peter Norvig's python implementation of Spelling Corrector
 
+The word counts are loaded on the first call to correction() (or the first
+use of WORDS), from a model file written by the build step below. If there is
+no model file they are counted from big.txt and cran.all instead.
+
+usage:
+    python norvig_spell.py [index_file]
+
+    writes the model file, from big.txt and cran.all or, if given, from the
+    vocabulary of an index file
+
 '''
 
 import re
+import os
+import sys
+import struct
+import unittest
+from array import array
 from collections import Counter
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(BASE_DIR, 'spelling.model')
+TEXT_FILES = [os.path.join(BASE_DIR, 'big.txt'), os.path.join(BASE_DIR, 'cran.all')]
+
+MAGIC = b'SPEL'
+HEADER = struct.Struct('<4sII')
+
 def words(text): return re.findall(r'\w+', text.lower())
 
-# Supplemented the text used for spellchecking with the cran file to account 
-# for highly specific technical terms.
-WORDS = Counter(words(open('big.txt').read()))
-WORDS.update(Counter(words(open('cran.all').read())))
+def countWords(filenames=TEXT_FILES):
+    ''' count the words of the given text files'''
+    counts = Counter()
+    for filename in filenames:
+        f = open(filename)
+        counts.update(words(f.read()))
+        f.close()
+    return counts
+
+def countIndexTerms(inverted_index):
+    ''' count each term of an index by its number of occurrences. Note that
+    index terms are stemmed'''
+    counts = Counter()
+    for item in inverted_index.items:
+        counts[item.term] = sum(len(posting.positions) for posting in item.posting.values())
+    return counts
+
+def saveModel(counts, filename=MODEL_FILE):
+    ''' write word counts as a header, the newline separated words and an
+    array of their counts'''
+    text = '\n'.join(counts.keys()).encode('utf-8')
+    f = open(filename, 'wb')
+    f.write(HEADER.pack(MAGIC, len(counts), len(text)))
+    f.write(text)
+    array('I', counts.values()).tofile(f)
+    f.close()
+
+def loadModel(filename=MODEL_FILE):
+    ''' read word counts written by saveModel'''
+    f = open(filename, 'rb')
+    magic, n_words, text_length = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('%s is not a spelling model' % filename)
+    text = f.read(text_length).decode('utf-8')
+    counts = array('I')
+    counts.fromfile(f, n_words)
+    f.close()
+    if n_words == 0:
+        return Counter()
+    return Counter(dict(zip(text.split('\n'), counts)))
+
+_words = None
+_total = None
+generation = 0 # changed by setWords, so cached corrections can be dropped
+
+def getWords():
+    ''' return the word counts, loading them on first use'''
+    global _words, _total
+    if _words is None:
+        # Supplemented the text used for spellchecking with the cran file to
+        # account for highly specific technical terms.
+        if os.path.exists(MODEL_FILE):
+            _words = loadModel(MODEL_FILE)
+        else:
+            _words = countWords(TEXT_FILES)
+        _total = sum(_words.values())
+    return _words
 
-def P(word, N=sum(WORDS.values())):
+def setWords(counts):
+    ''' replace the word counts, e.g. with counts from countIndexTerms. The
+    symspell corrector switches to the new counts too'''
+    global _words, _total, generation
+    _words = counts
+    _total = sum(counts.values())
+    generation += 1
+
+def __getattr__(name):
+    # WORDS is loaded lazily
+    if name == 'WORDS':
+        return getWords()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def P(word, N=None):
     "Probability of `word`."
-    return WORDS[word] / N
+    WORDS = getWords()
+    return WORDS[word] / (N or _total)
 
 def correction(word):
     "Most probable spelling correction for word."
@@ -28,6 +118,7 @@ def candidates(word):
 
 def known(words):
     "The subset of `words` that appear in the dictionary of WORDS."
+    WORDS = getWords()
     return set(w for w in words if w in WORDS)
 
 def edits1(word):
@@ -43,3 +134,43 @@ def edits1(word):
 def edits2(word):
     "All edits that are two edits away from `word`."
     return (e2 for e1 in edits1(word) for e2 in edits1(e1))
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_save_and_load_model(self):
+        counts = Counter({'wing': 5, 'flow': 3, 'aerodynamic': 1})
+        saveModel(counts, 'test.model')
+        counts_new = loadModel('test.model')
+        os.remove('test.model')
+        assert counts_new == counts
+
+        saveModel(Counter(), 'test.model')
+        assert loadModel('test.model') == Counter()
+        os.remove('test.model')
+
+    def test_set_words(self):
+        global _words, _total
+        old_words, old_total = _words, _total
+        import symspell
+        symspell.getSymSpell()
+        setWords(Counter({'wing': 5, 'wind': 2}))
+        try:
+            assert correction('wnig') == 'wing'
+            assert correction('wimd') == 'wind'
+            assert P('wing') == 5/7
+
+            # symspell follows the new dictionary
+            for word in ['wnig', 'wimd', 'wingg', 'zzz']:
+                assert symspell.correction(word) == correction(word)
+        finally:
+            _words, _total = old_words, old_total
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        import diskindex
+        saveModel(countIndexTerms(diskindex.openIndex(sys.argv[1])))
+    else:
+        saveModel(countWords(TEXT_FILES))
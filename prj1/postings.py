@@ -0,0 +1,247 @@
+'''
+
+Compact, read-only posting lists
+
+A frozen posting list stores, for one term, the sorted docIDs, the term
+frequency in each document and the positions of the term in each document
+in contiguous arrays instead of a dict of Posting objects. DocIDs are stored
+as gaps between consecutive docIDs and positions as gaps within each
+document, which keeps the numbers small enough to be varint compressed into
+a bytes buffer if wanted.
+
+'''
+
+from array import array
+from itertools import accumulate
+from collections.abc import Mapping
+import bisect
+import pickle
+import unittest
+
+def encodeVarint(values):
+    ''' encode unsigned integers using 7 bits per byte, with the high bit
+    set on every byte but the last of each number'''
+    buf = bytearray()
+    for value in values:
+        while value >= 0x80:
+            buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buf.append(value)
+    return bytes(buf)
+
+def decodeVarint(buf):
+    ''' decode a buffer written by encodeVarint into an array'''
+    values = array('I')
+    value = 0
+    shift = 0
+    for byte in buf:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+def deltaEncode(values):
+    ''' return the gaps between consecutive values of a sorted sequence'''
+    gaps = array('I', values)
+    for i in range(len(gaps) - 1, 0, -1):
+        gaps[i] -= gaps[i - 1]
+    return gaps
+
+
+class FrozenPosting:
+    ''' the positions of a term in one document of a frozen posting list'''
+    __slots__ = ('docID', 'positions')
+
+    def __init__(self, docID, positions):
+        self.docID = docID
+        self.positions = positions
+
+    def term_freq(self, doc_length):
+        ''' return the term frequency in the document, divided by the
+        document length if one is given'''
+        if doc_length:
+            return len(self.positions) / doc_length
+        return len(self.positions)
+
+
+class FrozenPostings(Mapping):
+    ''' read-only view of a frozen posting list as a dict of docID to
+    FrozenPosting, for code written against IndexItem.posting'''
+
+    def __init__(self, item):
+        self.docIDs = item.docIDs()
+        self.offsets = array('I', [0])
+        self.offsets.extend(accumulate(item.termFreqs()))
+        self.position_gaps = item.positionGaps()
+
+    def __getitem__(self, docID):
+        i = bisect.bisect_left(self.docIDs, docID)
+        if i == len(self.docIDs) or self.docIDs[i] != docID:
+            raise KeyError(docID)
+        gaps = self.position_gaps[self.offsets[i]:self.offsets[i + 1]]
+        return FrozenPosting(docID, list(accumulate(gaps)))
+
+    def __contains__(self, docID):
+        i = bisect.bisect_left(self.docIDs, docID)
+        return i < len(self.docIDs) and self.docIDs[i] == docID
+
+    def __iter__(self):
+        return iter(self.docIDs)
+
+    def __len__(self):
+        return len(self.docIDs)
+
+
+class FrozenIndexItem:
+    ''' read-optimized replacement for an IndexItem, see the module
+    docstring. Frozen items cannot be added to. The docIDs and term
+    frequencies are decoded on first use and kept, as sorted_postings,
+    posting and positions all need them; they are not saved with the item'''
+    __slots__ = ('term', 'compressed', 'doc_gaps', 'freqs', 'position_gaps', 'decoded_docIDs', 'decoded_freqs')
+    SAVED = ('term', 'compressed', 'doc_gaps', 'freqs', 'position_gaps')
+
+    def __init__(self, term, docIDs, positions, compressed=False):
+        ''' docIDs is the sorted list of docIDs containing the term and
+        positions holds the sorted list of positions for each docID'''
+        self.term = term
+        self.compressed = compressed
+
+        freqs = array('I')
+        position_gaps = array('I')
+        for doc_positions in positions:
+            freqs.append(len(doc_positions))
+            position_gaps.extend(deltaEncode(doc_positions))
+
+        self.doc_gaps = self.pack(deltaEncode(docIDs))
+        self.freqs = self.pack(freqs)
+        self.position_gaps = self.pack(position_gaps)
+        self.decoded_docIDs = None
+        self.decoded_freqs = None
+
+    @classmethod
+    def fromBuffers(cls, term, doc_gaps, freqs, position_gaps, compressed=True):
+        ''' create a frozen item from already encoded posting lists'''
+        item = cls.__new__(cls)
+        item.term = term
+        item.compressed = compressed
+        item.doc_gaps = doc_gaps
+        item.freqs = freqs
+        item.position_gaps = position_gaps
+        item.decoded_docIDs = None
+        item.decoded_freqs = None
+        return item
+
+    def __getstate__(self):
+        return (None, {name: getattr(self, name) for name in self.SAVED})
+
+    def __setstate__(self, state):
+        for name, value in state[1].items():
+            setattr(self, name, value)
+        self.decoded_docIDs = None
+        self.decoded_freqs = None
+
+    @classmethod
+    def fromIndexItem(cls, item, compressed=False):
+        ''' freeze an IndexItem'''
+        docIDs = sorted(item.posting.keys())
+        positions = [sorted(item.posting[docID].positions) for docID in docIDs]
+        return cls(item.term, docIDs, positions, compressed)
+
+    def pack(self, values):
+        if self.compressed:
+            return encodeVarint(values)
+        return values
+
+    def unpack(self, data):
+        if self.compressed:
+            return decodeVarint(data)
+        return data
+
+    def docIDs(self):
+        ''' return the sorted docIDs as an array, which must not be modified'''
+        if self.decoded_docIDs is None:
+            self.decoded_docIDs = array('I', accumulate(self.unpack(self.doc_gaps)))
+        return self.decoded_docIDs
+
+    def termFreqs(self):
+        ''' return the term frequency for each docID as an array, which must
+        not be modified'''
+        if self.decoded_freqs is None:
+            self.decoded_freqs = self.unpack(self.freqs)
+        return self.decoded_freqs
+
+    def positionGaps(self):
+        ''' return the delta-encoded positions of all documents as an array'''
+        return self.unpack(self.position_gaps)
+
+    def positions(self, docIDs):
+        ''' return the positions of the term in each of the given sorted
+        docIDs, decoding the position gaps once'''
+        all_docIDs = self.docIDs()
+        offsets = list(accumulate(self.termFreqs(), initial=0))
+        gaps = self.positionGaps()
+        result = []
+        i = 0
+        for docID in docIDs:
+            i = bisect.bisect_left(all_docIDs, docID, i)
+            if i == len(all_docIDs) or all_docIDs[i] != docID:
+                raise KeyError(docID)
+            result.append(list(accumulate(gaps[offsets[i]:offsets[i + 1]])))
+        return result
+
+    @property
+    def sorted_postings(self):
+        return list(self.docIDs())
+
+    @property
+    def posting(self):
+        return FrozenPostings(self)
+
+    def add(self, docid, pos):
+        raise ValueError('cannot add to the frozen posting list of %r' % self.term)
+
+    def sort(self):
+        ''' frozen posting lists are always sorted'''
+        pass
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_varint(self):
+        values = [0, 1, 127, 128, 300, 2**20, 2**31]
+        assert list(decodeVarint(encodeVarint(values))) == values
+        assert len(encodeVarint([1, 127])) == 2
+        assert len(encodeVarint([128])) == 2
+
+    def test_delta_encode(self):
+        assert list(deltaEncode([3, 5, 6, 10])) == [3, 2, 1, 4]
+        assert list(accumulate(deltaEncode([3, 5, 6, 10]))) == [3, 5, 6, 10]
+
+    def test_frozen_item(self):
+        for compressed in (False, True):
+            item = FrozenIndexItem('test', [2, 7, 300], [[1, 5], [0], [3, 200, 201]], compressed)
+
+            assert item.sorted_postings == [2, 7, 300]
+            assert list(item.termFreqs()) == [2, 1, 3]
+            assert 7 in item.posting
+            assert 8 not in item.posting
+            assert list(item.posting) == [2, 7, 300]
+            assert item.posting[300].positions == [3, 200, 201]
+            assert item.posting[2].term_freq(None) == 2
+            assert item.posting[2].term_freq(10) == 2 / 10
+            self.assertRaises(KeyError, item.posting.__getitem__, 8)
+            self.assertRaises(ValueError, item.add, 1, 0)
+            assert item.positions([2, 300]) == [[1, 5], [3, 200, 201]]
+            assert item.positions([7]) == [[0]]
+            self.assertRaises(KeyError, item.positions, [7, 8])
+
+            # Decoded posting lists are kept, but not pickled
+            assert item.docIDs() is item.docIDs() and item.termFreqs() is item.termFreqs()
+            copy = pickle.loads(pickle.dumps(item, -1))
+            assert copy.decoded_docIDs is None and copy.decoded_freqs is None
+            assert copy.sorted_postings == [2, 7, 300] and copy.positions([300]) == [[3, 200, 201]]
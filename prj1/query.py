@@ -4,48 +4,138 @@ query processing
 '''
 import util
 import norvig_spell
+import symspell
 import cran
 import index as inverted_ind
+import diskindex
 from index import IndexItem
 from index import Posting
 import unittest
 import cranqry
 import doc as d
 import numpy as np
+from scipy import sparse
 from sklearn.metrics.pairwise import cosine_similarity
-import operator
+from collections import Counter
 import sys
+import os
 import random
+import bisect
+import heapq
 import batch_eval
+import boolean
+import cache
+import instrument
+import impact
+import contextlib
+import re
+import math
+import multiprocessing
+import concurrent.futures
+import argparse
+
+# Shared by all QueryProcessors: results by (mode, preprocessed query, k)
+# for the current index generation, and preprocessed query strings
+RESULT_CACHE = cache.QueryCache(maxsize=1024)
+PREPROCESS_CACHE = cache.QueryCache(maxsize=4096)
+
+BOOLEAN_OPERATOR = re.compile(r'(\(|\)|"|\bAND\b|\bOR\b|\bNOT\b|\bNEAR/\d+)')
 
 class QueryProcessor:
 
-    def __init__(self, query, index, collection):
-        ''' index is the inverted index; collection is the document collection'''
+    SPELLERS = {'norvig': norvig_spell.correction, 'symspell': symspell.correction}
+
+    def __init__(self, query, index, collection, speller='norvig', result_cache=RESULT_CACHE,
+                 instrumented=False, profiler=None, impact_index=None, preprocess_cache=PREPROCESS_CACHE):
+        ''' index is the inverted index; collection is the document collection;
+        speller is the spelling corrector, 'norvig' or 'symspell';
+        result_cache is a cache.QueryCache for query results, or None to
+        always compute them, and preprocess_cache the same for preprocessed
+        query strings. If instrumented, the stage timings and counters
+        of the last query are left in stats (see instrument.py); profiler
+        is an optional instrument.SlowQueryProfiler run around each query;
+        impact_index is an impact.ImpactIndex of the index, for impactQuery'''
         self.raw_query = query
         self.index = index
         self.docs = collection
+        self.speller = speller
+        self.correction = self.SPELLERS[speller]
+        self.result_cache = result_cache
+        self.preprocess_cache = preprocess_cache
+        self.instrumented = instrumented
+        self.profiler = profiler
+        self.impact_index = impact_index
+        self.stats = instrument.NULL_STATS # stats of the last query
+        self.doc_matrix = None # built by the first batch query
+        self.doc_matrix_generation = None # generation of the index doc_matrix was built from
+        self.pruning_stats = None # documents scored and skipped by the last maxScoreQuery
+        self.universe = None # sorted docIDs of every indexed document
+        self.universe_generation = None # generation of the index universe was built from
+
+    @contextlib.contextmanager
+    def measure(self, mode):
+        ''' collect the stats of the query run in the with block, and
+        profile it if there is a profiler'''
+        if self.instrumented:
+            self.stats = instrument.QueryStats(mode, self.raw_query)
+        else:
+            self.stats = instrument.NULL_STATS
+        if self.profiler is None:
+            with self.stats.stage('total'):
+                yield
+        else:
+            with self.profiler.profile(mode, self.raw_query, self.stats), self.stats.stage('total'):
+                yield
 
     def preprocessing(self):
         ''' apply the same preprocessing steps used by indexing,
             also use the provided spelling corrector. Note that
             spelling corrector should be applied before stopword
             removal and stemming (why?)'''
+        with self.measure('preprocessing'):
+            return self.preprocessText(self.raw_query)
+
+    def preprocessText(self, text):
+        ''' spell check, remove stopwords from and stem the words of text.
+        The result for each text is cached, as spell checking is slow, until
+        the spelling dictionary is replaced'''
+        key = (self.speller, text)
+        with self.stats.stage('preprocess'):
+            if self.preprocess_cache is None:
+                processed_words = self.preprocessTextUncached(text)
+            else:
+                processed_words = self.preprocess_cache.get(key, norvig_spell.generation)
+                if processed_words is None:
+                    processed_words = self.preprocessTextUncached(text)
+                    self.preprocess_cache.put(key, tuple(processed_words), norvig_spell.generation)
+                else:
+                    self.stats.count('preprocess_cache_hits')
+        self.stats.count('terms', len(processed_words))
+        return list(processed_words)
+
+    def preprocessTextUncached(self, text):
         
+        with self.stats.stage('preprocess.tokenize'):
+            words = util.tokenize(text)
+
         # Spell check words in the query
         spell_checked_words = []
-        words = util.tokenize(self.raw_query)
-        for word in words:
-            spell_checked_words.append(norvig_spell.correction(word))
+        with self.stats.stage('preprocess.spelling'):
+            for word in words:
+                corrected_word = self.correction(word)
+                if corrected_word != word:
+                    self.stats.count('words_corrected')
+                spell_checked_words.append(corrected_word)
+        self.stats.count('words', len(words))
             
         # Now remove stopwords and stem
+        analyzer = util.getAnalyzer()
         processed_words = []
-        for word in spell_checked_words:
-            if util.isStopWord(word) is True:
-                continue
-            else:
-                stemmed_word = util.stemming(word)
-                processed_words.append(stemmed_word)
+        with self.stats.stage('preprocess.analyze'):
+            for word in spell_checked_words:
+                stemmed_word = analyzer.analyzeToken(word)
+                if stemmed_word is not None:
+                    processed_words.append(stemmed_word)
                 
         return processed_words
 
@@ -53,113 +143,488 @@ class QueryProcessor:
     def booleanQuery(self):
         ''' boolean query processing; note that a query like "A B C" is 
         transformed to "A AND B AND C" for retrieving posting lists and merge 
-        them'''
-        query_terms = self.preprocessing()
-        docs = []
-        docs_empty = True
-        for word in query_terms:
-            index_item = self.index.find(word)
-            
-            if(index_item != None):
-                postings = index_item.sorted_postings
-                
-                if postings != []:
-                    # If this is the first word being checked in the index we add
-                    # all of the docIDs to our list of relevant documents
-                    if docs_empty is True:
-                        docs = postings
-                        
-                        docs_empty = False
-                     
-                    # If this is not the first word being checked in the index,
-                    # we need to compare lists and store a list of docIDs that 
-                    # appear in both the current posting and the existing list of
-                    # docIDs. This creates our intersection of relevant docIDs
-                    # for the tokens from the query
-                    else:
-                        if docs != []:
-                            docs = set(docs).intersection(set(postings))
-                         
-                        # No more shared documents exist, return
-                        else:
-                            return []
-                        
-            # If the term doesn't exist in the document collection, then
-            # there won't be a list of shared relevant documents.
-            else:
-                return []
-                    
-        # Sort docs if they exist
-        if list(docs) != []:
-            list(docs).sort()
-                    
-        return list(docs)              
+        them. The operators AND, OR and NOT and parentheses can be used as
+        well, e.g. "(wing OR body) AND NOT flutter". Operators must be upper
+        case, lower case "and", "or" and "not" are stopwords. Phrases between
+        double quotes and "A NEAR/k B" are matched with the term positions
+        stored in the index; since positions are counted after stopword
+        removal, "flow of air" matches "flow past air" but not "flow and
+        hot air"'''
+        with self.measure('boolean'):
+            tokens = []
+            for chunk in BOOLEAN_OPERATOR.split(self.raw_query):
+                operator = chunk.strip()
+                if operator in boolean.OPERATORS or boolean.nearDistance(operator) is not None:
+                    tokens.append(operator)
+                else:
+                    tokens.extend(self.preprocessText(chunk))
+            return self.cachedResult(('boolean', tuple(tokens)), lambda: self.evaluateBoolean(tokens))
+
+    def evaluateBoolean(self, tokens):
+        ''' return the sorted docIDs matching a list of preprocessed terms
+        and operators'''
+        with self.stats.stage('boolean.parse'):
+            node = boolean.parse(tokens)
+
+        def lookup(term):
+            with self.stats.stage('boolean.lookup'):
+                index_item = self.index.find(term)
+                if index_item is None:
+                    return []
+                docIDs = index_item.docIDs()
+            self.stats.count('postings_touched', len(docIDs))
+            return docIDs
+
+        def positions(term, docIDs):
+            with self.stats.stage('boolean.positions'):
+                positions = self.index.find(term).positions(docIDs)
+            self.stats.count('positions_read', len(docIDs))
+            return positions
+
+        with self.stats.stage('boolean.evaluate'):
+            docIDs = [int(docID) for docID in boolean.evaluate(node, lookup, self.indexedDocIDs, positions)]
+        self.stats.count('results', len(docIDs))
+        return docIDs
+
+    def indexedDocIDs(self):
+        ''' return the sorted docIDs of every indexed document, the universe
+        of NOT queries. Document norms can't be used, as a document whose
+        terms are all in every document has a norm of 0'''
+        if self.universe_generation != self.index.generation:
+            docIDs = set(self.index.docLength)
+            if len(docIDs) == 0:
+                # Older index files were saved without the document lengths
+                for item in self.index.items:
+                    docIDs.update(item.docIDs())
+            self.universe = sorted(int(docID) for docID in docIDs)
+            self.universe_generation = self.index.generation
+        return self.universe
+
+    def cachedResult(self, key, compute, generation=None):
+        ''' return the result cached for key and the current index, or the
+        given generation of another index, calling compute() and caching its
+        result if there is none'''
+        if self.result_cache is None:
+            return compute()
+        if generation is None:
+            generation = self.index.generation
+        result = self.result_cache.get(key, generation)
+        if result is None:
+            result = compute()
+            self.result_cache.put(key, tuple(result), generation)
+        else:
+            self.stats.count('result_cache_hits')
+        return list(result)
+
+    def queryVector(self, query_terms):
+        ''' return the query terms that occur in the index, and their tf-idf
+        weights in the query. The index itself is not modified'''
+        terms = []
+        weights = []
+        for word, count in Counter(query_terms).items():
+            if self.index.find(word) != None:
+                terms.append(word)
+                weights.append(count * self.index.idf(word))
+        return terms, weights
 
     def vectorQuery(self, k):
-        ''' vector query processing, using the cosine similarity. '''
-        query_terms = self.preprocessing()
-        relevant_docs = []
-        
-        # Add the query to the inverted_index as a document
-        n = self.index.nDocs + 1
-        query_doc = d.Document(str(n),'temp','me', self.raw_query)
-        self.index.indexDoc(query_doc)
-        self.index.sort()
-        
-        # Start by creating a comprehensive list of all the possible relevant
-        # documents in the collection
-        for word in query_terms:
+        ''' vector query processing, using the cosine similarity. The dot
+        products of the query with every document are accumulated term at a
+        time over the posting lists of the query terms, and divided by the
+        document norms precomputed by the index'''
+        with self.measure('vector'):
+            query_terms = self.preprocessText(self.raw_query)
+            return self.cachedResult(('vector', tuple(sorted(query_terms)), k), lambda: self.scoreVector(query_terms, k))
+
+    def scoreVector(self, query_terms, k):
+        ''' return the top k (docID, score) pairs for a list of preprocessed
+        query terms'''
+        with self.stats.stage('vector.lookup'):
+            query_terms, query_vector = self.queryVector(query_terms)
+            norms = self.index.norms()
+        scores = np.zeros(len(norms))
+        candidates = np.zeros(len(norms), dtype=bool)
+        
+        with self.stats.stage('vector.accumulate'):
+            for word, weight in zip(query_terms, query_vector):
+                index_item = self.index.find(word)
+                docIDs = np.asarray(index_item.docIDs(), dtype=np.intp)
+                tfs = np.asarray(index_item.termFreqs(), dtype=float)
+                scores[docIDs] += tfs * (self.index.idf(word) * weight)
+                candidates[docIDs] = True
+                self.stats.count('postings_touched', len(docIDs))
+        
+        # Only documents containing a query term are candidates
+        with self.stats.stage('vector.normalize'):
+            docIDs = np.flatnonzero(candidates)
+            norm = np.linalg.norm(query_vector) * norms[docIDs]
+            similarities = np.zeros(len(docIDs))
+            np.divide(scores[docIDs], norm, out=similarities, where=norm > 0)
+        self.stats.count('candidates_scored', len(docIDs))
+        
+        with self.stats.stage('vector.topk'):
+            return topK(docIDs, similarities, k)
+
+    def maxScoreQuery(self, k):
+        ''' top k vector query processing, document at a time with MaxScore
+        pruning. Each query term can add at most its highest weight (stored
+        in the index) times its query weight to a document's score. Terms
+        are ordered by that bound; once the k-th best score is at least the
+        sum of the bounds of the lowest terms, documents that only contain
+        those terms are skipped, and every other document is dropped as soon
+        as its score plus the bounds of its unscored terms falls to the k-th
+        best score. Returns the same results as vectorQuery, and leaves the
+        number of documents scored, pruned and skipped in pruning_stats'''
+        with self.measure('maxscore'):
+            query_terms = self.preprocessText(self.raw_query)
+            with self.stats.stage('maxscore.score'):
+                results = self.scoreMaxScore(query_terms, k)
+            for name, value in self.pruning_stats.items():
+                self.stats.count(name if name == 'candidates' else 'candidates_' + name, value)
+            return results
+
+    def scoreMaxScore(self, query_terms, k):
+        ''' return the top k (docID, score) pairs for a list of preprocessed
+        query terms, see maxScoreQuery'''
+        query_terms, query_vector = self.queryVector(query_terms)
+        query_norm = np.linalg.norm(query_vector)
+        norms = self.index.norms()
+        max_weights = self.index.maxWeights()
+        
+        postings = []
+        for word, weight in zip(query_terms, query_vector):
             index_item = self.index.find(word)
+            term_weight = self.index.idf(word) * weight
+            bound = max_weights[self.index.dictionary[word]] * weight / query_norm if query_norm > 0 else 0
+            postings.append((list(index_item.docIDs()), list(index_item.termFreqs()), term_weight, bound))
+        
+        n_candidates = 0
+        if len(postings) > 0:
+            n_candidates = len(np.unique(np.concatenate([np.asarray(docIDs, dtype=np.intp) for docIDs, tfs, term_weight, bound in postings])))
+        
+        # Terms from the lowest to the highest bound, and the sum of the
+        # bounds up to each term
+        order = sorted(range(len(postings)), key=lambda i: postings[i][3])
+        bounds = [postings[i][3] for i in order]
+        cumulative = list(np.cumsum(bounds))
+        cursors = [0] * len(postings)
+        
+        # A slightly raised bound makes sure rounding never prunes a document
+        # that scores at least the k-th best
+        slack = 1 + 1e-9
+        heap = [] # the best (score, -docID) so far, worst first
+        threshold = -1
+        essential = 0 # order[essential:] are the terms a new document must contain
+        scored = 0
+        pruned = 0
+        
+        while k > 0:
+            # The next document is the lowest docID left in an essential list
+            doc = None
+            for i in order[essential:]:
+                docIDs = postings[i][0]
+                if cursors[i] < len(docIDs) and (doc is None or docIDs[cursors[i]] < doc):
+                    doc = docIDs[cursors[i]]
+            if doc is None:
+                break
             
-            if index_item != None:
-                postings = index_item.posting
-                
-                for doc in postings:
-                    if doc not in relevant_docs:
-                        relevant_docs.append(doc)
-        
-        relevant_docs.sort()
-                        
-        # Calculate the weight of each term for each possible relevant document
-        tf_idf_matrix = np.empty((len(query_terms),len(relevant_docs)))
-        row = 0
-        for word in query_terms:
-            tf_idf = []
-            index_item = self.index.find(word)
+            tfs = {}
+            score = 0
+            for i in order[essential:]:
+                docIDs, doc_tfs, term_weight, bound = postings[i]
+                if cursors[i] < len(docIDs) and docIDs[cursors[i]] == doc:
+                    tfs[i] = doc_tfs[cursors[i]]
+                    score += tfs[i] * term_weight
+                    cursors[i] += 1
             
-            if index_item != None:
-                postings = index_item.posting
-                for doc in relevant_docs:
-                    if doc in postings:
-                        score = postings[doc].term_freq(self.index.docLength[doc]) * self.index.idf(word)
-                    else:
-                        score = 0
-                        
-                    tf_idf.append(score)  
-                    
+            norm = query_norm * norms[doc]
+            if norm > 0:
+                score /= norm
             else:
-                for doc in relevant_docs:
-                    score = 0
-                    tf_idf.append(score)
-                    
-            tf_idf_matrix[row] = tf_idf
-            row += 1
-                    
-        # Calculate the similarity between each document and the query document
-        similarities = {}
-        for i in range(len(tf_idf_matrix[0])-1):         
-            similarity = cosine_similarity([tf_idf_matrix[:,i]], [tf_idf_matrix[:,-1]])
-            similarities.update({relevant_docs[i] : similarity[0][0]})
+                score = 0
             
-        # Sort the dictionary by values
-        sorted_similarities = sorted(similarities.items(), key=operator.itemgetter(1), reverse=True)
+            # Add the non-essential terms, highest bound first, while the
+            # document can still make it into the top k
+            for j in range(essential - 1, -1, -1):
+                if len(heap) == k and (score + cumulative[j]) * slack <= threshold:
+                    break
+                i = order[j]
+                docIDs, doc_tfs, term_weight, bound = postings[i]
+                cursors[i] = bisect.bisect_left(docIDs, doc, cursors[i])
+                if cursors[i] < len(docIDs) and docIDs[cursors[i]] == doc:
+                    tfs[i] = doc_tfs[cursors[i]]
+                    if norm > 0:
+                        score += tfs[i] * term_weight / norm
+            else:
+                # Recompute the score in query term order, as vectorQuery does
+                score = 0
+                for i in sorted(tfs):
+                    score += tfs[i] * postings[i][2]
+                score = score / norm if norm > 0 else 0
+                scored += 1
+                
+                # A later document with the same score has a higher docID 
+                # and so ranks lower
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -doc))
+                elif (score, -doc) > heap[0]:
+                    heapq.heapreplace(heap, (score, -doc))
+                if len(heap) == k:
+                    threshold = heap[0][0]
+                    while essential < len(order) and cumulative[essential] * slack <= threshold:
+                        essential += 1
+                continue
+            pruned += 1
         
-        # Retrieve k results and return
-        k_pairs = []
-        for x in range(k):
-            k_pairs.append(sorted_similarities[x])
+        self.pruning_stats = {'candidates': n_candidates, 'scored': scored, 'pruned': pruned,
+                              'skipped': n_candidates - scored - pruned}
+        results = sorted((-score, -doc) for score, doc in heap)
+        return [(doc, -score) for score, doc in results]
+
+    def impactQuery(self, k, budget=None):
+        ''' vector query processing score at a time, over the impact index.
+        The blocks of postings of the query terms are added to the document
+        scores in order of decreasing contribution, and processing stops
+        after budget postings if one is given. With tf-idf impacts and no
+        budget, the results are those of vectorQuery up to the quantization
+        of the impacts; as with batchVectorQuery, documents scoring 0 are
+        left out'''
+        with self.measure('impact'):
+            query_terms = self.preprocessText(self.raw_query)
+            return self.cachedResult(('impact', tuple(sorted(query_terms)), k, budget),
+                                     lambda: self.scoreImpact(query_terms, k, budget),
+                                     self.impact_index.generation)
+
+    def scoreImpact(self, query_terms, k, budget=None):
+        ''' return the top k (docID, score) pairs for a list of preprocessed
+        query terms, see impactQuery'''
+        impact_index = self.impact_index
+        with self.stats.stage('impact.lookup'):
+            # Query terms are weighted by tf-idf for tf-idf impacts, which
+            # already hold the document weights, and by tf for BM25 impacts
+            words = []
+            weights = []
+            for word, count in Counter(query_terms).items():
+                if word in impact_index.dictionary:
+                    words.append(word)
+                    weights.append(count * impact_index.idf(word) if impact_index.scoring == 'tfidf' else count)
+            norm = np.linalg.norm(weights) if impact_index.scoring == 'tfidf' else 1
             
-        return k_pairs
+            # The contribution of every block of every query term, highest first
+            blocks = [np.zeros(0, dtype=np.intp)]
+            contributions = [np.zeros(0)]
+            for word, weight in zip(words, weights):
+                term_blocks = impact_index.blocks(word)
+                blocks.append(np.arange(term_blocks.start, term_blocks.stop))
+                contributions.append(impact_index.levels[term_blocks.start:term_blocks.stop] *
+                                     (weight * impact_index.scale / norm if norm > 0 else 0))
+            blocks = np.concatenate(blocks)
+            contributions = np.concatenate(contributions)
+            order = np.argsort(-contributions, kind='stable')
+        
+        with self.stats.stage('impact.accumulate'):
+            # The blocks processed before the budget runs out; the last one
+            # may be cut short
+            order = order[contributions[order] > 0]
+            starts = impact_index.block_starts[blocks[order]]
+            lengths = impact_index.block_starts[blocks[order] + 1] - starts
+            ends = np.cumsum(lengths)
+            if budget is not None and len(ends) > 0 and ends[-1] > budget:
+                n_blocks = np.searchsorted(ends, budget) + 1
+                order = order[:n_blocks]
+                starts = starts[:n_blocks]
+                lengths = lengths[:n_blocks]
+                lengths[-1] -= ends[n_blocks - 1] - budget
+                ends = ends[:n_blocks]
+                ends[-1] = budget
+                self.stats.count('budget_exhausted')
+            
+            # Gather the postings of all of these blocks at once, and add up
+            # their contributions in block order
+            n_postings = int(ends[-1]) if len(ends) > 0 else 0
+            postings = np.repeat(starts - (ends - lengths), lengths) + np.arange(n_postings)
+            docIDs = impact_index.docIDs[postings]
+            scores = np.bincount(docIDs, np.repeat(contributions[order], lengths), impact_index.n_slots)
+            self.stats.count('blocks_processed', len(order))
+            self.stats.count('postings_touched', n_postings)
+        
+        with self.stats.stage('impact.topk'):
+            docIDs = np.flatnonzero(scores)
+            self.stats.count('candidates_scored', len(docIDs))
+            return topK(docIDs, scores[docIDs], k)
+
+    def documentMatrix(self):
+        ''' return the document matrix of the index, see tfidfMatrix'''
+        if self.doc_matrix is None or self.doc_matrix_generation != self.index.generation:
+            self.doc_matrix = tfidfMatrix(self.index)
+            self.doc_matrix_generation = self.index.generation
+        return self.doc_matrix
+
+    def queryMatrix(self, queries):
+        ''' return a sparse matrix holding the tf-idf vector of each of the
+        preprocessed queries (lists of terms), divided by its norm. Rows are
+        queries and columns term IDs'''
+        rows = []
+        cols = []
+        data = []
+        for row, query_terms in enumerate(queries):
+            query_terms, query_vector = self.queryVector(query_terms)
+            norm = np.linalg.norm(query_vector)
+            if norm == 0:
+                continue
+            for word, weight in zip(query_terms, query_vector):
+                rows.append(row)
+                cols.append(self.index.dictionary[word])
+                data.append(weight / norm)
+        return sparse.csr_matrix((data, (rows, cols)), shape=(len(queries), len(self.index.dictionary)))
+
+    def batchVectorQuery(self, queries, k):
+        ''' vector query processing for a list of raw queries. All queries
+        are scored at once by multiplying the query matrix by the document
+        matrix. Returns the top k (docID, score) pairs of each query; unlike
+        vectorQuery, documents scoring 0 are left out'''
+        with self.measure('batch_vector'):
+            preprocessed = [self.preprocessText(query) for query in queries]
+            self.stats.count('queries', len(queries))
+
+            with self.stats.stage('batch.document_matrix'):
+                doc_matrix = self.documentMatrix()
+            with self.stats.stage('batch.query_matrix'):
+                query_matrix = self.queryMatrix(preprocessed)
+            with self.stats.stage('batch.similarity'):
+                scores = (query_matrix @ doc_matrix.T).tocsr()
+            self.stats.count('candidates_scored', scores.nnz)
+
+            results = []
+            with self.stats.stage('batch.topk'):
+                for row in range(len(queries)):
+                    start = scores.indptr[row]
+                    end = scores.indptr[row + 1]
+                    results.append(topK(scores.indices[start:end], scores.data[start:end], k))
+            return results
+
+
+def tfidfMatrix(index):
+    ''' return a sparse matrix holding the tf-idf vector of every document,
+    divided by its norm. Rows are docIDs and columns term IDs'''
+    norms = index.norms()
+    rows = []
+    cols = []
+    data = []
+    for term_id, item in enumerate(index.items):
+        docIDs = np.asarray(item.docIDs(), dtype=np.intp)
+        tfs = np.asarray(item.termFreqs(), dtype=float) * index.idf(item.term)
+        weights = np.zeros(len(docIDs))
+        np.divide(tfs, norms[docIDs], out=weights, where=norms[docIDs] > 0)
+        rows.append(docIDs)
+        cols.append(np.full(len(docIDs), term_id, dtype=np.intp))
+        data.append(weights)
+    
+    if len(data) == 0:
+        return sparse.csr_matrix((len(norms), 0))
+    return sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(len(norms), len(index.items)))
+
+
+def topK(docIDs, scores, k):
+    ''' return the (docID, score) pairs of the k highest scores, best first
+    and ties broken by docID, without sorting all of the scores'''
+    if k <= 0 or len(scores) == 0:
+        return []
+    
+    # Keep every score at least as high as the k-th highest score, so that
+    # ties at the cut off are broken by docID too
+    if k < len(scores):
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+        selected = np.flatnonzero(scores >= kth_score)
+        docIDs = docIDs[selected]
+        scores = scores[selected]
+    
+    order = np.lexsort((docIDs, -scores))[:k]
+    return [(int(docIDs[i]), float(scores[i])) for i in order]
+
+
+# The QueryProcessor of a worker process of run_batch
+_worker_processor = None
+
+def initWorker(index, speller, cached=True):
+    ''' set up a worker process of run_batch. index is an index file name,
+    opened once per worker, or an index inherited from the parent'''
+    global _worker_processor
+    if isinstance(index, str):
+        index = diskindex.openIndex(index)
+    _worker_processor = batchProcessor(index, speller, cached)
+
+def batchProcessor(index, speller, cached=True, instrumented=False, profiler=None):
+    ''' return a QueryProcessor for run_batch, which uses no result or
+    preprocessing cache unless cached'''
+    if cached:
+        return QueryProcessor('', index, None, speller, instrumented=instrumented, profiler=profiler)
+    return QueryProcessor('', index, None, speller, result_cache=None, instrumented=instrumented,
+                          profiler=profiler, preprocess_cache=None)
+
+def runQueries(query_processor, queries, mode, k, stats=None):
+    ''' run each of queries with a QueryProcessor, in order. mode 0 is the
+    boolean model and mode 1 the vector model. The stats of each query are
+    added to stats, an instrument.StatsAggregator, if given'''
+    results = []
+    for query in queries:
+        query_processor.raw_query = query
+        if mode == 0:
+            results.append(query_processor.booleanQuery())
+        else:
+            results.append(query_processor.vectorQuery(k))
+        if stats is not None:
+            stats.add(query_processor.stats)
+    return results
+
+def runWorkerQueries(chunk):
+    queries, mode, k, instrumented, profiler = chunk
+    stats = instrument.StatsAggregator() if instrumented else None
+    _worker_processor.instrumented = instrumented
+    _worker_processor.profiler = profiler
+    return runQueries(_worker_processor, queries, mode, k, stats), stats, profiler
+
+def run_batch(index, queries, mode, k=3, workers=1, chunk_size=None, speller='norvig', stats=None,
+              profiler=None, cached=True):
+    ''' run a list of raw queries with the boolean (mode 0) or vector (mode
+    1, top k) model and return their results in input order. With more than
+    one worker, queries are sent in chunks to a process pool. index is an
+    index file name or a loaded index; a file written by diskindex.py is
+    mapped by every worker and so shares its pages, a loaded index is shared
+    by forking the worker processes where the platform allows it. The stats
+    of every query are added to stats, an instrument.StatsAggregator, and
+    slow queries are reported to profiler, an instrument.SlowQueryProfiler,
+    whichever process ran them. Unless cached, every query is preprocessed
+    and scored in full, with no result or preprocessing cache'''
+    if mode not in (0, 1):
+        raise ValueError('mode must be 0 (boolean) or 1 (vector), not %r' % mode)
+    if workers <= 1 or len(queries) <= 1:
+        if isinstance(index, str):
+            index = diskindex.openIndex(index)
+        query_processor = batchProcessor(index, speller, cached, stats is not None, profiler)
+        return runQueries(query_processor, queries, mode, k, stats)
+
+    # A few chunks per worker keeps the workers busy to the end
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(queries) / (workers * 4)))
+    chunks = [(queries[i:i + chunk_size], mode, k, stats is not None,
+               profiler.spawn() if profiler is not None else None)
+              for i in range(0, len(queries), chunk_size)]
+
+    context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context, initializer=initWorker,
+                                                initargs=(index, speller, cached)) as executor:
+        for chunk_results, chunk_stats, chunk_profiler in executor.map(runWorkerQueries, chunks):
+            results.extend(chunk_results)
+            if stats is not None:
+                stats.merge(chunk_stats)
+            if profiler is not None:
+                profiler.merge(chunk_profiler)
+    return results
 
 
 class test(unittest.TestCase):
@@ -174,6 +639,10 @@ class test(unittest.TestCase):
         word = 'magntohydodynamic'
         assert norvig_spell.correction(word) == 'magnetohydrodynamic'
         
+    def test_spellcheck_symspell(self):
+        query_processor = QueryProcessor('retangulor magntohydodynamic', None, [], speller='symspell')
+        assert query_processor.preprocessing() == ['rectangular', 'magnetohydrodynam']
+        
     # Test boolean query model
     def test_boolean_query_with_results(self):
         inverted_index = inverted_ind.InvertedIndex()
@@ -206,9 +675,76 @@ class test(unittest.TestCase):
         query = "dogs and cats"
         query_processor = QueryProcessor(query, inverted_index, doc_list)
         relevant_docs = query_processor.booleanQuery()
-        
+
         assert relevant_docs == []
-        
+
+    def test_boolean_query_operators(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly.')
+        doc2 = d.Document('2','temp','me','Cats are friendly.')
+        doc3 = d.Document('3','temp','me','Cats and dogs play.')
+        doc_list = [doc1, doc2, doc3]
+
+        for doc in doc_list:
+            inverted_index.indexDoc(doc)
+
+        inverted_index.sort()
+
+        def run(query):
+            return QueryProcessor(query, inverted_index, doc_list).booleanQuery()
+
+        assert run("dogs OR cats") == [1,2,3]
+        assert run("friendly AND NOT dogs") == [2]
+        assert run("NOT friendly") == [3]
+        assert run("(dogs OR cats) play") == [3]
+        assert run("cats NOT (friendly OR play)") == []
+
+    # Test that NOT queries include documents whose terms all have an idf
+    # of 0, and so a norm of 0
+    def test_boolean_query_not_zero_norm(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        for docID, text in [('1', 'wing flow'), ('2', 'flow'), ('3', 'heat flow')]:
+            inverted_index.indexDoc(d.Document(docID, 'temp', 'me', text))
+        inverted_index.sort()
+        assert inverted_index.norms()[2] == 0
+
+        def run(query):
+            return QueryProcessor(query, inverted_index, [], result_cache=None).booleanQuery()
+
+        assert run("NOT wing") == [2, 3]
+        assert run("NOT heat") == [1, 2]
+        assert run("flow AND NOT (wing OR heat)") == [2]
+
+        inverted_index.indexDoc(d.Document('4', 'temp', 'me', 'shock'))
+        inverted_index.sort()
+        assert run("NOT wing") == [2, 3, 4]
+
+    def test_boolean_query_positional(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly people.')
+        doc2 = d.Document('2','temp','me','Friendly dogs and cats.')
+        doc3 = d.Document('3','temp','me','Cats play with dogs.')
+        doc_list = [doc1, doc2, doc3]
+
+        for doc in doc_list:
+            inverted_index.indexDoc(doc)
+
+        inverted_index.sort()
+
+        def run(query):
+            return QueryProcessor(query, inverted_index, doc_list).booleanQuery()
+
+        for frozen in [False, True]:
+            if frozen:
+                inverted_index.freeze(compressed=True)
+            assert run('"friendly dogs"') == [2]
+            assert run('"dogs are friendly"') == [1]
+            assert run('dogs NEAR/1 friendly') == [1, 2]
+            assert run('cats NEAR/1 dogs') == [2]
+            assert run('cats NEAR/2 dogs') == [2, 3]
+            assert run('"dogs friendly" OR play') == [1, 3]
+            assert run('dogs NOT "friendly people"') == [2, 3]
+
     # Test vector query model
     def test_vector_query_1(self):
         inverted_index = inverted_ind.InvertedIndex()
@@ -246,7 +782,289 @@ class test(unittest.TestCase):
         relevant_docs = query_processor.vectorQuery(3)
         
         assert relevant_docs[0][0] == 3
-        assert relevant_docs[1][1] == relevant_docs[2][1]
+        
+        # Docs 1 and 2 each match one query term with the same weight, so the
+        # shorter doc 1 is more similar
+        assert relevant_docs[1][0] == 1
+        assert relevant_docs[1][1] > relevant_docs[2][1]
+        
+    # Test that vector queries leave the index unchanged and give the same
+    # results when repeated
+    def test_vector_query_repeated(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly and social.')
+        doc2 = d.Document('2','temp','me','Cats can be friendly, but are often aloof.')
+        for doc in [doc1, doc2]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+        n_terms = len(inverted_index.items)
+        
+        query_processor = QueryProcessor("Are dogs friendly?", inverted_index, [doc1, doc2])
+        relevant_docs = query_processor.vectorQuery(5)
+        
+        assert query_processor.vectorQuery(5) == relevant_docs
+        assert len(relevant_docs) == 2
+        assert inverted_index.nDocs == 2
+        assert len(inverted_index.items) == n_terms
+        assert inverted_index.find('friend').sorted_postings == [1, 2]
+        
+    # Test that vector query scores are the cosine similarity of the tf-idf
+    # vectors of the query and the whole document
+    def test_vector_query_scores(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly and social.')
+        doc2 = d.Document('2','temp','me','Cats can be friendly, but are often aloof.')
+        doc3 = d.Document('3','temp','me','Owners should consider which type of personality will fit their own personality the best.')
+        doc_list = [doc1, doc2, doc3]
+        for doc in doc_list:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+        
+        query_processor = QueryProcessor("friendly dogs", inverted_index, doc_list)
+        relevant_docs = query_processor.vectorQuery(3)
+        
+        terms = [item.term for item in inverted_index.items]
+        query_vector = [0] * len(terms)
+        doc_vector = [0] * len(terms)
+        for i, term in enumerate(terms):
+            posting = inverted_index.find(term).posting
+            if term in ['friend', 'dog']:
+                query_vector[i] = inverted_index.idf(term)
+            if 1 in posting:
+                doc_vector[i] = posting[1].term_freq(None) * inverted_index.idf(term)
+        
+        assert [doc for doc, score in relevant_docs] == [1, 2]
+        assert abs(relevant_docs[0][1] - cosine_similarity([doc_vector], [query_vector])[0][0]) < 1e-12
+        
+    # Test that batch vector queries give the same results as one at a time
+    def test_batch_vector_query(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly and social.')
+        doc2 = d.Document('2','temp','me','Cats can be friendly, but are often aloof.')
+        doc3 = d.Document('3','temp','me','Owners should consider which type of personality will fit their own personality best when choosing whether to own a cat or dog.')
+        doc_list = [doc1, doc2, doc3]
+        for doc in doc_list:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+        
+        queries = ["Are dogs friendly?", "How do owners decide whether to own a cat or a dog?",
+                   "personality", "unicorns"]
+        query_processor = QueryProcessor('', inverted_index, doc_list)
+        results = query_processor.batchVectorQuery(queries, 2)
+        
+        assert len(results) == 4
+        assert results[3] == []
+        for query, result in zip(queries, results):
+            query_processor.raw_query = query
+            expected = query_processor.vectorQuery(2)
+            assert [doc for doc, score in result] == [doc for doc, score in expected]
+            for (doc, score), (doc_expected, score_expected) in zip(result, expected):
+                assert abs(score - score_expected) < 1e-12
+        
+    # Test that repeated queries are answered from the cache until the
+    # index changes
+    def test_result_cache(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly and social.')
+        doc2 = d.Document('2','temp','me','Cats can be friendly, but are often aloof.')
+        for doc in [doc1, doc2]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+
+        result_cache = cache.QueryCache(maxsize=10)
+        query_processor = QueryProcessor("friendly dogs", inverted_index, [], result_cache=result_cache)
+        expected = query_processor.vectorQuery(2)
+        assert QueryProcessor("dogs friendly", inverted_index, [], result_cache=result_cache).vectorQuery(2) == expected
+        assert query_processor.booleanQuery() == [1]
+        assert query_processor.booleanQuery() == [1]
+        assert result_cache.stats()['hits'] == 2
+        assert result_cache.stats()['misses'] == 2
+
+        inverted_index.indexDoc(d.Document('3','temp','me','Friendly dogs everywhere.'))
+        inverted_index.sort()
+        assert query_processor.booleanQuery() == [1, 3]
+        assert result_cache.stats()['invalidations'] == 1
+        assert QueryProcessor("friendly dogs", inverted_index, [], result_cache=None).vectorQuery(3) == query_processor.vectorQuery(3)
+
+    def test_preprocess_cache_set_words(self):
+        words = norvig_spell.getWords()
+        try:
+            for speller in ['norvig', 'symspell']:
+                query_processor = QueryProcessor('', inverted_ind.InvertedIndex(), [], speller, result_cache=None)
+                norvig_spell.setWords(Counter({'wind': 2, 'wing': 1}))
+                assert query_processor.preprocessText('wimd') == ['wind']
+                norvig_spell.setWords(Counter({'wild': 3, 'wing': 1}))
+                assert query_processor.preprocessText('wimd') == ['wild']
+        finally:
+            norvig_spell.setWords(words)
+
+    # Test that queries run in worker processes give the serial results, in
+    # input order
+    def test_run_batch(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly and social.')
+        doc2 = d.Document('2','temp','me','Cats can be friendly, but are often aloof.')
+        doc3 = d.Document('3','temp','me','Owners should consider which type of personality will fit their own personality best.')
+        for doc in [doc1, doc2, doc3]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+        diskindex.writeDiskIndex(inverted_index, 'output_test.idx')
+
+        queries = ["friendly dogs", "cats", "personality", "unicorns", "friendly", "aloof cats"]
+        for mode in [0, 1]:
+            expected = run_batch(inverted_index, queries, mode, 2)
+            assert len(expected) == len(queries)
+            assert run_batch(inverted_index, queries, mode, 2, workers=2) == expected
+            assert run_batch('output_test.idx', queries, mode, 2, workers=2, chunk_size=4) == expected
+        assert run_batch(inverted_index, queries, 0)[0] == [1]
+        self.assertRaises(ValueError, run_batch, inverted_index, queries, 2)
+        os.remove('output_test.idx')
+
+    # Test that instrumented queries report their stages and counters, also
+    # from worker processes, and that slow queries are profiled
+    def test_instrumentation(self):
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','temp','me','Dogs are friendly and social.')
+        doc2 = d.Document('2','temp','me','Cats can be friendly, but are often aloof.')
+        for doc in [doc1, doc2]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+
+        query_processor = QueryProcessor('friendly dogs', inverted_index, None, result_cache=None)
+        query_processor.vectorQuery(2)
+        assert query_processor.stats.toDict() == {}
+
+        query_processor.instrumented = True
+        assert query_processor.vectorQuery(2)[0][0] == 1
+        stats = query_processor.stats
+        assert stats.mode == 'vector'
+        assert {'total', 'preprocess', 'vector.accumulate', 'vector.topk'} <= set(stats.timings)
+        assert stats.counters['terms'] == 2
+        assert stats.counters['postings_touched'] == 3
+        assert stats.counters['candidates_scored'] == 2
+
+        query_processor.raw_query = 'friendly AND NOT dogs'
+        assert query_processor.booleanQuery() == [2]
+        assert query_processor.stats.mode == 'boolean'
+        assert query_processor.stats.counters['results'] == 1
+
+        aggregator = instrument.StatsAggregator()
+        profiler = instrument.SlowQueryProfiler(threshold_ms=0, max_reports=3)
+        queries = ['friendly', 'cats', 'aloof dogs', 'social']
+        run_batch(inverted_index, queries, 1, 2, workers=2, chunk_size=1, stats=aggregator, profiler=profiler)
+        summary = aggregator.summary()['vector']
+        assert summary['queries'] == 4
+        assert summary['stages']['total']['count'] == 4
+        assert profiler.n_profiled == 4
+        assert len(profiler.reports()) == 3
+        assert profiler.reports()[0]['stats']['mode'] == 'vector'
+
+        # Timed queries are spell checked and scored in full by both models,
+        # in this process or in workers, whatever is already cached
+        result_cache = cache.QueryCache(maxsize=10)
+        query_processor = QueryProcessor('', inverted_index, None, result_cache=result_cache)
+        timed = [cranqry.CranQry(str(qid), text) for qid, text in enumerate(queries, 1)]
+        for workers in [1, 2]:
+            aggregator = instrument.StatsAggregator()
+            batch_eval.time_evaluation(timed, query_processor, workers, 2, query_stats=aggregator)
+            batch_eval.time_evaluation(timed, query_processor, workers, 2, query_stats=aggregator)
+            for mode in ['boolean', 'vector']:
+                summary = aggregator.summary()[mode]
+                assert summary['queries'] == 8
+                assert summary['stages']['preprocess.spelling']['count'] == 8
+                assert 'result_cache_hits' not in summary['counters']
+        assert query_processor.result_cache is result_cache and query_processor.preprocess_cache is PREPROCESS_CACHE
+
+    # Test that MaxScore pruning gives the same results as scoring every
+    # document, while skipping some documents
+    def test_max_score_query(self):
+        words = ['wing', 'flow', 'pressure', 'heat', 'shock', 'layer', 'boundary',
+                 'surface', 'speed', 'plate', 'jet', 'cylinder']
+        generator = random.Random(7)
+        inverted_index = inverted_ind.InvertedIndex()
+        for docID in range(1, 61):
+            text = ' '.join(generator.choice(words[:generator.randint(2, 12)]) for _ in range(generator.randint(1, 15)))
+            inverted_index.indexDoc(d.Document(str(docID),'temp','me', text))
+        inverted_index.sort()
+        
+        query_processor = QueryProcessor('', inverted_index, [])
+        n_pruned = 0
+        for query in ['wing flow', 'shock layer boundary jet', 'cylinder plate speed wing heat', 'jet jet flow']:
+            query_processor.raw_query = query
+            for k in [1, 3, 10, 100]:
+                assert query_processor.maxScoreQuery(k) == query_processor.vectorQuery(k)
+                stats = query_processor.pruning_stats
+                assert stats['scored'] + stats['pruned'] + stats['skipped'] == stats['candidates']
+                assert stats['scored'] >= min(k, stats['candidates'])
+                n_pruned += stats['pruned'] + stats['skipped']
+        assert n_pruned > 0
+
+    # Test that exhaustive impact queries score documents as vector queries
+    # do, up to the quantization of the impacts, and that budgets are kept
+    def test_impact_query(self):
+        words = ['wing', 'flow', 'pressure', 'heat', 'shock', 'layer', 'boundary',
+                 'surface', 'speed', 'plate', 'jet', 'cylinder']
+        generator = random.Random(7)
+        inverted_index = inverted_ind.InvertedIndex()
+        for docID in range(1, 61):
+            text = ' '.join(generator.choice(words[:generator.randint(2, 12)]) for _ in range(generator.randint(1, 15)))
+            inverted_index.indexDoc(d.Document(str(docID),'temp','me', text))
+        inverted_index.sort()
+        impact.writeImpactIndex(inverted_index, 'output_test.impact')
+        impact_index = impact.ImpactIndex('output_test.impact')
+
+        try:
+            query_processor = QueryProcessor('', inverted_index, [], result_cache=None, instrumented=True,
+                                             impact_index=impact_index)
+            for query in ['wing flow', 'shock layer boundary jet', 'cylinder plate speed wing heat', 'jet jet flow']:
+                query_processor.raw_query = query
+                expected = dict(query_processor.vectorQuery(100))
+                results = query_processor.impactQuery(100)
+                assert sorted(doc for doc, score in results) == sorted(doc for doc, score in expected.items() if score > 0)
+                for doc, score in results:
+                    assert abs(score - expected[doc]) <= impact_index.scale * len(query.split())
+                n_postings = query_processor.stats.counters['postings_touched']
+
+                results = query_processor.impactQuery(100, budget=5)
+                assert query_processor.stats.counters['postings_touched'] == min(5, n_postings)
+                assert len(results) <= 5
+        finally:
+            impact_index.close()
+            os.remove('output_test.impact')
+
+        # A term whose documents were all deleted from a segmented index is
+        # still in the dictionary, with no documents
+        import segments
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            segmented = segments.SegmentedIndex(directory, background=False)
+            for docID, text in enumerate(['wing flow', 'heat flow', 'shock wave', 'wing heat'], 1):
+                segmented.indexDoc(d.Document(str(docID), 'temp', 'me', text))
+            segmented.deleteDocument('3')
+            impact.writeImpactIndex(segmented, 'output_test.impact')
+            impact_index = impact.ImpactIndex('output_test.impact')
+            assert impact_index.idf('shock') == 0
+            query_processor = QueryProcessor('wing shock', segmented, [], result_cache=None,
+                                             impact_index=impact_index)
+            expected = query_processor.vectorQuery(10)
+            results = query_processor.impactQuery(10)
+            assert sorted(doc for doc, score in results) == [1, 4]
+            assert sorted(doc for doc, score in results) == sorted(doc for doc, score in expected if score > 0)
+        finally:
+            impact_index.close()
+            os.remove('output_test.impact')
+            shutil.rmtree(directory)
+
+    def test_top_k(self):
+        docIDs = np.array([1, 2, 3, 4, 5])
+        scores = np.array([0.5, 0.9, 0.5, 0.1, 0.5])
+        
+        assert topK(docIDs, scores, 2) == [(2, 0.9), (1, 0.5)]
+        assert topK(docIDs, scores, 3) == [(2, 0.9), (1, 0.5), (3, 0.5)]
+        assert topK(docIDs, scores, 10) == [(2, 0.9), (1, 0.5), (3, 0.5), (5, 0.5), (4, 0.1)]
+        assert topK(docIDs, scores, 0) == []
         
     # Test the accuracy of the cosine similarity calculations
     def test_cosine_similarity_same_vectors(self):
@@ -273,15 +1091,16 @@ class test(unittest.TestCase):
         
         assert similarity[0][0] == 0
         
-def query(index_filename, mode, query_filename, qid_or_n):
-    ''' the main query processing program, using QueryProcessor'''
+def query(index_filename, mode, query_filename, qid_or_n, workers=1, budget=None):
+    ''' the main query processing program, using QueryProcessor. Batch
+    evaluation (mode 2) runs the queries in the given number of worker
+    processes. Impact queries (mode 3) read the impact index written for
+    the index file by impact.py, and stop after budget postings if given'''
     
     # Load document collection, inverted_index file, and the query file
-    filename = 'cran.all'
-    collection = cran.CranFile(filename)
+    collection = d.openCollection(index_filename, 'cran.all')
     
-    inverted_index = inverted_ind.InvertedIndex()
-    inverted_index.load(index_filename)
+    inverted_index = diskindex.openIndex(index_filename)
     
     queries = cranqry.loadCranQry(query_filename)
     
@@ -301,14 +1120,35 @@ def query(index_filename, mode, query_filename, qid_or_n):
     elif mode == 2:
         n_queries = random.sample(list(queries.values()), int(qid_or_n))
         query_processor = QueryProcessor('', inverted_index, collection)
-        b_time, v_time = batch_eval.time_evaluation(n_queries, query_processor)
+        b_time, v_time = batch_eval.time_evaluation(n_queries, query_processor, workers)
+        b_time /= len(n_queries)
+        v_time /= len(n_queries)
         
         print('Avg Boolean Query Processing Time: %4.4f Avg Vector Query Processing Time: %4.4f' % (b_time, v_time))
         
+    # Impact-ordered vector query
+    elif mode == 3:
+        query = queries[qid_or_n]
+        impact_index = impact.openImpactIndex(index_filename)
+        if impact_index is None:
+            sys.exit('no impact index for %s, write it with impact.py' % index_filename)
+        query_processor = QueryProcessor(query.text, inverted_index, collection, impact_index=impact_index)
+        print(query_processor.impactQuery(3, budget))
+        
 if __name__ == '__main__':
 #    unittest.main()
 #    query('output.p', 0, 'query.text', '201') # Boolean
 #    query('output.p', 1, 'query.text', '201') # Vector
 #    query('output.p', 2, 'query.text', 20) # Batch Eval
     
-    query(sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4])
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='run queries against an index')
+    parser.add_argument('index_filename')
+    parser.add_argument('mode', type=int, help='0 boolean, 1 vector, 2 batch evaluation, 3 impact-ordered vector')
+    parser.add_argument('query_filename')
+    parser.add_argument('qid_or_n', help='the query ID, or the number of queries to evaluate')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes for batch evaluation')
+    parser.add_argument('--budget', type=int,
+                        help='number of postings after which impact queries stop')
+    args = parser.parse_args()
+    query(args.index_filename, args.mode, args.query_filename, args.qid_or_n, args.workers, args.budget)
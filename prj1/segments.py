@@ -0,0 +1,664 @@
+'''
+
+Segmented index for incremental updates
+
+A SegmentedIndex is a directory of small immutable segments, each an index
+file in the format of diskindex.py, and a manifest listing the segments and
+their deleted documents:
+
+    new documents are indexed into an in-memory buffer, which is written out
+        as a new segment once it holds max_buffer_docs documents (or on
+        flush/commit)
+    deleting a document only records its docID as a tombstone of the segment
+        holding it; indexing a docID that is already in the index replaces
+        the old document
+    queries search every segment. Each term's posting lists are merged
+        across segments leaving out deleted documents, and document
+        frequencies, norms and term weights are computed over the live
+        documents of all segments, so results are the same as those of an
+        index built from scratch
+    a merge policy rewrites groups of segments of about the same size (and
+        segments with more deleted than live documents) into one segment,
+        dropping deleted documents. Merges run in a background thread
+
+Documents should be added and deleted from one thread; queries may run in
+other threads while segments are merged.
+
+usage:
+    python segments.py index_dir add cran.all
+    python segments.py index_dir delete docID [docID ...]
+    python segments.py index_dir merge
+
+    the directory can be used as an index file by query.py, batch_eval.py
+    and server.py
+
+'''
+
+import os
+import sys
+import json
+import math
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy as np
+from scipy import sparse
+
+import index as inverted_ind
+import diskindex
+import doc as d
+import cran
+from postings import FrozenIndexItem, FrozenPosting
+
+MANIFEST = 'segments.json'
+
+
+class Segment:
+    ''' one index of a SegmentedIndex and the docIDs deleted from it'''
+
+    def __init__(self, name, index, deleted=frozenset()):
+        self.name = name # file name, None for the in-memory buffer
+        self.index = index
+        self.deleted = frozenset(deleted) # replaced, never changed, so readers need no lock
+        self.term_matrix = None
+        self.term_matrix_generation = None
+
+    def docCount(self):
+        return len(self.index.docLength)
+
+    def liveCount(self):
+        return self.docCount() - len(self.deleted)
+
+    def contains(self, docID):
+        ''' whether a live document of the segment has this docID'''
+        return docID in self.index.docLength and docID not in self.deleted
+
+    def termMatrix(self, dictionary):
+        ''' return the sorted docIDs of the segment, a sparse matrix of the
+        term frequencies (rows are those docIDs, columns the segment's term
+        IDs) and the term ID in dictionary of each column'''
+        if self.term_matrix is None or self.term_matrix_generation != self.index.generation:
+            docIDs = np.array(sorted(self.index.docLength), dtype=np.intp)
+            rows = []
+            cols = []
+            data = []
+            term_map = np.zeros(len(self.index.items), dtype=np.intp)
+            for term_id, item in enumerate(self.index.items):
+                term_map[term_id] = dictionary[item.term]
+                item_docIDs = np.asarray(item.docIDs(), dtype=np.intp)
+                rows.append(np.searchsorted(docIDs, item_docIDs))
+                cols.append(np.full(len(item_docIDs), term_id, dtype=np.intp))
+                data.append(np.asarray(item.termFreqs(), dtype=float))
+            if len(rows) > 0:
+                rows = np.concatenate(rows)
+                cols = np.concatenate(cols)
+                data = np.concatenate(data)
+            tfs = sparse.csr_matrix((data, (rows, cols)), shape=(len(docIDs), len(self.index.items)))
+            self.term_matrix = (docIDs, tfs, term_map)
+            self.term_matrix_generation = self.index.generation
+        return self.term_matrix
+
+    def liveItem(self, term):
+        ''' return the docIDs, term frequencies and item of a term, leaving
+        out deleted documents, or None if no live document has the term'''
+        item = self.index.find(term)
+        if item is None:
+            return None
+        docIDs = np.asarray(item.docIDs(), dtype=np.intp)
+        tfs = np.asarray(item.termFreqs(), dtype=np.intp)
+        if len(self.deleted) > 0:
+            live = ~np.isin(docIDs, list(self.deleted))
+            docIDs = docIDs[live]
+            tfs = tfs[live]
+        if len(docIDs) == 0:
+            return None
+        return docIDs, tfs, item
+
+
+class SegmentedItem:
+    ''' the posting list of a term across segments, offering the read
+    methods of IndexItem used by query processing'''
+
+    def __init__(self, term, parts):
+        ''' parts are the (docIDs, term frequencies, item) of the term in
+        each segment holding it, as returned by Segment.liveItem'''
+        self.term = term
+        self.parts = parts
+        if len(parts) == 0:
+            self.doc_ids = np.zeros(0, dtype=np.intp)
+            self.freqs = np.zeros(0, dtype=np.intp)
+            self.part_of = np.zeros(0, dtype=np.intp)
+            return
+        docIDs = np.concatenate([part[0] for part in parts])
+        order = np.argsort(docIDs, kind='stable')
+        self.doc_ids = docIDs[order]
+        self.freqs = np.concatenate([part[1] for part in parts])[order]
+        self.part_of = np.concatenate([np.full(len(part[0]), i, dtype=np.intp)
+                                       for i, part in enumerate(parts)])[order]
+
+    def docIDs(self):
+        ''' return the sorted docIDs'''
+        return self.doc_ids
+
+    def termFreqs(self):
+        ''' return the term frequency for each docID, in docID order'''
+        return self.freqs
+
+    def positions(self, docIDs):
+        ''' return the positions of the term in each of the given sorted
+        docIDs, reading each segment's positions once'''
+        docIDs = np.asarray(docIDs, dtype=np.intp)
+        found = np.searchsorted(self.doc_ids, docIDs)
+        if len(docIDs) > 0 and (found.max() >= len(self.doc_ids) or np.any(self.doc_ids[found] != docIDs)):
+            raise KeyError(self.term)
+        result = [None] * len(docIDs)
+        parts = self.part_of[found]
+        for i, part in enumerate(self.parts):
+            selected = np.flatnonzero(parts == i)
+            if len(selected) == 0:
+                continue
+            for j, doc_positions in zip(selected, part[2].positions([int(docID) for docID in docIDs[selected]])):
+                result[j] = doc_positions
+        return result
+
+    @property
+    def sorted_postings(self):
+        return [int(docID) for docID in self.doc_ids]
+
+    @property
+    def posting(self):
+        docIDs = self.sorted_postings
+        return {docID: FrozenPosting(docID, positions) for docID, positions in zip(docIDs, self.positions(docIDs))}
+
+    def sort(self):
+        pass
+
+
+class SegmentedIndex:
+    ''' an index stored as segments in a directory, see the module
+    docstring. Offers the lookup methods of InvertedIndex used by query
+    processing'''
+
+    def __init__(self, directory, max_buffer_docs=1000, merge_factor=4, background=True):
+        ''' open the segmented index in directory, creating it if needed.
+        merge_factor segments of about the same size are merged into one;
+        with background False merges run in the calling thread'''
+        self.directory = directory
+        self.max_buffer_docs = max_buffer_docs
+        self.merge_factor = merge_factor
+        self.background = background
+        self.lock = threading.RLock()
+        self.merging = set() # names of the segments being merged
+        self.merge_thread = None
+        self.merge_error = None
+
+        self.dictionary = {} # maps each term of any segment to a term ID
+        self.terms = []
+        self.segments = []
+        self.next_segment = 0
+        os.makedirs(directory, exist_ok=True)
+        manifest = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest):
+            f = open(manifest)
+            data = json.load(f)
+            f.close()
+            self.next_segment = data['next_segment']
+            for entry in data['segments']:
+                segment = Segment(entry['name'], diskindex.DiskIndex(os.path.join(directory, entry['name'])),
+                                  entry['deleted'])
+                self.addTerms(segment.index)
+                self.segments.append(segment)
+        self.buffer = Segment(None, inverted_ind.InvertedIndex())
+
+        self.generation = inverted_ind.nextGeneration()
+        self.statistics = None
+        self.statistics_generation = None
+        self.item_cache = {}
+        self.item_cache_generation = None
+
+    def addTerms(self, index):
+        for item in index.items:
+            if item.term not in self.dictionary:
+                self.dictionary[item.term] = len(self.terms)
+                self.terms.append(item.term)
+
+    def changed(self):
+        self.generation = inverted_ind.nextGeneration()
+
+    # Updates
+
+    def indexDoc(self, doc):
+        ''' index a Document into the buffer, replacing any document with
+        the same docID. Returns the number of tokens indexed'''
+        docID = int(doc.docID)
+        with self.lock:
+            if docID in self.buffer.index.docLength:
+                self.flush()
+            self.deleteDocument(docID)
+            n_terms = len(self.buffer.index.items)
+            n_tokens = self.buffer.index.indexDoc(doc)
+            for item in self.buffer.index.items[n_terms:]:
+                if item.term not in self.dictionary:
+                    self.dictionary[item.term] = len(self.terms)
+                    self.terms.append(item.term)
+            self.changed()
+            if self.buffer.docCount() >= self.max_buffer_docs:
+                self.flush()
+        return n_tokens
+
+    def deleteDocument(self, docID):
+        ''' delete a document; returns whether there was one'''
+        docID = int(docID)
+        deleted = False
+        with self.lock:
+            for segment in self.segments + [self.buffer]:
+                if segment.contains(docID):
+                    segment.deleted = segment.deleted | {docID}
+                    deleted = True
+            if deleted:
+                self.changed()
+        return deleted
+
+    def flush(self):
+        ''' write the buffered documents to a new segment'''
+        with self.lock:
+            if self.buffer.docCount() == 0:
+                return
+            name = self.newSegmentName()
+            self.buffer.index.sort()
+            diskindex.writeDiskIndex(self.buffer.index, os.path.join(self.directory, name))
+            segment = Segment(name, diskindex.DiskIndex(os.path.join(self.directory, name)), self.buffer.deleted)
+            self.segments = self.segments + [segment]
+            self.buffer = Segment(None, inverted_ind.InvertedIndex())
+            self.changed()
+            self.writeManifest()
+        self.maybeMerge()
+
+    def commit(self):
+        ''' flush the buffer and save the deletions'''
+        with self.lock:
+            self.flush()
+            self.writeManifest()
+
+    def close(self):
+        ''' commit, wait for merges and close the segment files'''
+        self.commit()
+        self.waitForMerges()
+        for segment in self.segments:
+            segment.index.close()
+
+    def newSegmentName(self):
+        name = 'segment%06d.idx' % self.next_segment
+        self.next_segment += 1
+        return name
+
+    def writeManifest(self):
+        data = {'next_segment': self.next_segment,
+                'segments': [{'name': segment.name, 'deleted': sorted(segment.deleted)}
+                             for segment in self.segments]}
+        manifest = os.path.join(self.directory, MANIFEST)
+        f = open(manifest + '.tmp', 'w')
+        json.dump(data, f)
+        f.close()
+        os.replace(manifest + '.tmp', manifest)
+
+    # Merging
+
+    def selectMerge(self):
+        ''' return the segments to merge next, or None. Segments are grouped
+        in tiers by the logarithm of their number of live documents; the
+        smallest merge_factor segments of a full tier are merged, otherwise
+        a segment with more deleted than live documents is rewritten'''
+        candidates = [segment for segment in self.segments if segment.name not in self.merging]
+        tiers = {}
+        for segment in sorted(candidates, key=Segment.liveCount):
+            size = max(segment.liveCount(), 1) / max(self.max_buffer_docs, 1)
+            tier = int(math.log(size, self.merge_factor)) if size > 1 else 0
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        for segment in candidates:
+            if len(segment.deleted) > segment.liveCount():
+                return [segment]
+        return None
+
+    def maybeMerge(self):
+        ''' start a merge if the merge policy selects one'''
+        with self.lock:
+            if self.merge_thread is not None and self.merge_thread.is_alive():
+                return
+            sources = self.selectMerge()
+            if sources is None:
+                return
+            self.merging.update(segment.name for segment in sources)
+            if self.background:
+                self.merge_thread = threading.Thread(target=self.runMerge, args=(sources,), daemon=True)
+                self.merge_thread.start()
+                return
+        self.runMerge(sources)
+
+    def runMerge(self, sources):
+        ''' merge sources, then keep merging while the merge policy selects
+        more segments. A background merge thread only stops once there is
+        nothing left to merge, so merges follow on from each other'''
+        while sources is not None:
+            try:
+                self.mergeSegments(sources)
+            except Exception as e:
+                self.merge_error = e
+                with self.lock:
+                    self.merging.difference_update(segment.name for segment in sources)
+                    if self.merge_thread is threading.current_thread():
+                        self.merge_thread = None
+                return
+            with self.lock:
+                sources = self.selectMerge()
+                if sources is not None:
+                    self.merging.update(segment.name for segment in sources)
+                elif self.merge_thread is threading.current_thread():
+                    # Let the next flush start a new merge thread
+                    self.merge_thread = None
+
+    def waitForMerges(self):
+        ''' wait until no merge is running. Raises the error of a failed
+        background merge'''
+        while True:
+            thread = self.merge_thread
+            if thread is None or not thread.is_alive():
+                break
+            thread.join()
+        if self.merge_error is not None:
+            error = self.merge_error
+            self.merge_error = None
+            raise error
+
+    def forceMerge(self):
+        ''' merge all segments into one'''
+        self.commit()
+        self.waitForMerges()
+        with self.lock:
+            sources = list(self.segments)
+            if len(sources) == 0 or (len(sources) == 1 and len(sources[0].deleted) == 0):
+                return
+            self.merging.update(segment.name for segment in sources)
+        self.mergeSegments(sources)
+
+    def mergeSegments(self, sources):
+        ''' write the live documents of sources to a new segment and replace
+        them by it. Documents deleted while merging are deleted from the
+        new segment'''
+        deleted = [segment.deleted for segment in sources]
+        merged = inverted_ind.InvertedIndex()
+        for segment, segment_deleted in zip(sources, deleted):
+            for docID, length in segment.index.docLength.items():
+                if docID not in segment_deleted:
+                    merged.docLength[docID] = length
+        merged.nDocs = len(merged.docLength)
+
+        terms = []
+        seen = set()
+        for segment in sources:
+            for term in segment.index.dictionary:
+                if term not in seen:
+                    seen.add(term)
+                    terms.append(term)
+        for term in terms:
+            docIDs = []
+            positions = []
+            for segment, segment_deleted in zip(sources, deleted):
+                item = segment.index.find(term)
+                if item is None:
+                    continue
+                live = [docID for docID in item.docIDs() if docID not in segment_deleted]
+                docIDs.extend(live)
+                positions.extend(item.positions(live))
+            if len(docIDs) == 0:
+                continue
+            order = sorted(range(len(docIDs)), key=docIDs.__getitem__)
+            merged.dictionary[term] = len(merged.items)
+            merged.items.append(FrozenIndexItem(term, [docIDs[i] for i in order], [positions[i] for i in order]))
+
+        with self.lock:
+            name = self.newSegmentName()
+        diskindex.writeDiskIndex(merged, os.path.join(self.directory, name))
+
+        with self.lock:
+            since = set()
+            for segment, segment_deleted in zip(sources, deleted):
+                since.update(segment.deleted - segment_deleted)
+            segment = Segment(name, diskindex.DiskIndex(os.path.join(self.directory, name)), since)
+            names = set(source.name for source in sources)
+            self.segments = [s for s in self.segments if s.name not in names] + [segment]
+            self.merging.difference_update(names)
+            self.changed()
+            self.writeManifest()
+
+        # Readers may still use the old segments; they are closed when no
+        # longer referenced, and their files can be removed while mapped
+        for source in sources:
+            os.remove(os.path.join(self.directory, source.name))
+
+    # Queries
+
+    def liveSegments(self):
+        segments = self.segments
+        if self.buffer.docCount() > 0:
+            segments = segments + [self.buffer]
+        return segments
+
+    def computeStatistics(self):
+        ''' return the number of live documents, the idf of each term, the
+        document norms by docID and the highest weight of each term,
+        computed as by InvertedIndex over the live documents'''
+        if self.statistics_generation == self.generation:
+            return self.statistics
+        generation = self.generation
+        segments = self.liveSegments()
+        n_terms = len(self.terms)
+
+        matrices = []
+        df = np.zeros(n_terms)
+        nDocs = 0
+        max_docID = -1
+        for segment in segments:
+            docIDs, tfs, term_map = segment.termMatrix(self.dictionary)
+            live = np.ones(len(docIDs), dtype=bool)
+            if len(segment.deleted) > 0:
+                live = ~np.isin(docIDs, list(segment.deleted))
+            docIDs = docIDs[live]
+            tfs = tfs[live]
+            matrices.append((docIDs, tfs, term_map))
+            nDocs += len(docIDs)
+            np.add.at(df, term_map, np.diff(tfs.tocsc().indptr))
+            if len(docIDs) > 0:
+                max_docID = max(max_docID, int(docIDs[-1]))
+
+        ratio = np.ones(n_terms)
+        np.divide(nDocs, df, out=ratio, where=df > 0)
+        idf = np.log(ratio)
+        norms = np.zeros(max_docID + 1)
+        max_weights = np.zeros(n_terms)
+        for docIDs, tfs, term_map in matrices:
+            weights = tfs.multiply(idf[term_map].reshape(1, -1)).tocsr()
+            doc_norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+            norms[docIDs] = doc_norms
+            scale = np.zeros(len(doc_norms))
+            np.divide(1, doc_norms, out=scale, where=doc_norms > 0)
+            normalized = weights.multiply(scale.reshape(-1, 1)).tocsc()
+            if normalized.shape[0] > 0:
+                np.maximum.at(max_weights, term_map, normalized.max(axis=0).toarray().ravel())
+
+        self.statistics = (nDocs, idf, norms, max_weights)
+        self.statistics_generation = generation
+        return self.statistics
+
+    @property
+    def nDocs(self):
+        return self.computeStatistics()[0]
+
+    @property
+    def docLength(self):
+        lengths = {}
+        for segment in self.liveSegments():
+            for docID, length in segment.index.docLength.items():
+                if docID not in segment.deleted:
+                    lengths[docID] = length
+        return lengths
+
+    def find(self, term):
+        ''' return the SegmentedItem of a term, or None if no live document
+        has it'''
+        if self.item_cache_generation != self.generation:
+            self.item_cache = {}
+            self.item_cache_generation = self.generation
+        if term in self.item_cache:
+            return self.item_cache[term]
+        item = None
+        if term in self.dictionary:
+            parts = [part for part in (segment.liveItem(term) for segment in self.liveSegments())
+                     if part is not None]
+            if len(parts) > 0:
+                item = SegmentedItem(term, parts)
+        if len(self.item_cache) < 4096:
+            self.item_cache[term] = item
+        return item
+
+    @property
+    def items(self):
+        ''' the posting list of every term, in term ID order'''
+        return [self.find(term) or SegmentedItem(term, []) for term in self.terms]
+
+    def sort(self):
+        pass
+
+    def norms(self):
+        ''' return the document norms'''
+        return self.computeStatistics()[2]
+
+    def maxWeights(self):
+        ''' return the highest normalized weight of each term'''
+        return self.computeStatistics()[3]
+
+    def idf(self, term):
+        ''' compute the inverted document frequency for a given term'''
+        return float(self.computeStatistics()[1][self.dictionary[term]])
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def documents(self):
+        return [d.Document('1','temp','me','Dogs are friendly and social.'),
+                d.Document('2','temp','me','Cats can be friendly, but are often aloof.'),
+                d.Document('3','temp','me','Owners should consider which personality fits their own personality.'),
+                d.Document('4','temp','me','Friendly dogs and cats play together.'),
+                d.Document('5','temp','me','Aloof owners rarely play with cats.')]
+
+    def assertSameIndex(self, segmented, docs):
+        ''' compare with an index built from scratch'''
+        expected = inverted_ind.InvertedIndex()
+        for doc in sorted(docs, key=lambda doc: int(doc.docID)):
+            expected.indexDoc(doc)
+        expected.sort()
+        assert segmented.nDocs == expected.nDocs
+        assert segmented.docLength == expected.docLength
+        norms = np.zeros((2, max(len(segmented.norms()), len(expected.norms()))))
+        norms[0, :len(segmented.norms())] = segmented.norms()
+        norms[1, :len(expected.norms())] = expected.norms()
+        assert np.allclose(norms[0], norms[1])
+        for item in expected.items:
+            segmented_item = segmented.find(item.term)
+            assert segmented_item.sorted_postings == item.sorted_postings
+            assert list(segmented_item.termFreqs()) == list(item.termFreqs())
+            assert segmented_item.positions(item.sorted_postings) == item.positions(item.sorted_postings)
+            assert abs(segmented.idf(item.term) - expected.idf(item.term)) < 1e-12
+            assert abs(segmented.maxWeights()[segmented.dictionary[item.term]] -
+                       expected.maxWeights()[expected.dictionary[item.term]]) < 1e-12
+        for term in segmented.dictionary:
+            if term not in expected.dictionary:
+                assert segmented.find(term) is None
+
+    def test_incremental(self):
+        docs = self.documents()
+        segmented = SegmentedIndex(self.directory, max_buffer_docs=2, merge_factor=10, background=False)
+        for doc in docs:
+            segmented.indexDoc(doc)
+        assert len(segmented.segments) == 2
+        assert segmented.buffer.docCount() == 1
+        self.assertSameIndex(segmented, docs)
+
+    def test_delete_and_replace(self):
+        docs = self.documents()
+        segmented = SegmentedIndex(self.directory, max_buffer_docs=2, merge_factor=10, background=False)
+        for doc in docs:
+            segmented.indexDoc(doc)
+        generation = segmented.generation
+        assert segmented.deleteDocument(2)
+        assert not segmented.deleteDocument(2)
+        assert segmented.generation != generation
+        replacement = d.Document('4','temp','me','Hypersonic wings.')
+        segmented.indexDoc(replacement)
+        self.assertSameIndex(segmented, [docs[0], docs[2], replacement, docs[4]])
+
+        # Deletions and segments are kept by commit
+        segmented.commit()
+        reopened = SegmentedIndex(self.directory, background=False)
+        self.assertSameIndex(reopened, [docs[0], docs[2], replacement, docs[4]])
+
+    def test_merge(self):
+        docs = self.documents()
+        segmented = SegmentedIndex(self.directory, max_buffer_docs=1, merge_factor=2, background=True)
+        for doc in docs:
+            segmented.indexDoc(doc)
+        segmented.deleteDocument(3)
+        segmented.commit()
+        segmented.waitForMerges()
+        assert len(segmented.segments) < len(docs)
+        assert segmented.selectMerge() is None
+        self.assertSameIndex(segmented, [docs[0], docs[1], docs[3], docs[4]])
+
+        segmented.forceMerge()
+        assert len(segmented.segments) == 1
+        assert len(segmented.segments[0].deleted) == 0
+        assert sorted(os.listdir(self.directory)) == sorted([MANIFEST, segmented.segments[0].name])
+        self.assertSameIndex(segmented, [docs[0], docs[1], docs[3], docs[4]])
+
+    def test_queries(self):
+        import query
+        docs = self.documents()
+        segmented = SegmentedIndex(self.directory, max_buffer_docs=2, background=False)
+        expected = inverted_ind.InvertedIndex()
+        for doc in docs:
+            segmented.indexDoc(doc)
+            expected.indexDoc(doc)
+        expected.sort()
+        for text in ['friendly dogs', 'aloof cats', 'personality']:
+            result = query.QueryProcessor(text, segmented, None).vectorQuery(3)
+            result_expected = query.QueryProcessor(text, expected, None).vectorQuery(3)
+            assert [doc for doc, score in result] == [doc for doc, score in result_expected]
+            assert np.allclose([score for doc, score in result], [score for doc, score in result_expected])
+            assert query.QueryProcessor(text, segmented, None).booleanQuery() == \
+                query.QueryProcessor(text, expected, None).booleanQuery()
+        assert query.QueryProcessor('"friendly dogs"', segmented, None).booleanQuery() == [4]
+
+
+if __name__ == '__main__':
+    segmented = SegmentedIndex(sys.argv[1], background=False)
+    if sys.argv[2] == 'add':
+        for doc in cran.iter_docs(sys.argv[3]):
+            segmented.indexDoc(doc)
+    elif sys.argv[2] == 'delete':
+        for docID in sys.argv[3:]:
+            segmented.deleteDocument(docID)
+    elif sys.argv[2] == 'merge':
+        segmented.forceMerge()
+    segmented.close()
+    print('%d documents in %d segments' % (segmented.nDocs, len(segmented.segments)))
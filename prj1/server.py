@@ -0,0 +1,338 @@
+'''
+
+Search service
+
+Loads an index, and optionally the document store, once and answers
+boolean and vector queries over HTTP with JSON responses:
+
+    GET  /search?q=...&mode=vector&k=10
+    POST /search        with a JSON body {"query": ..., "mode": ..., "k": ...}
+    GET  /health
+    GET  /stats
+
+mode is 'boolean' or 'vector' (the default). Vector queries return the top k
+documents with their scores; boolean queries return the total number of
+matching documents and the first k of them.
+
+Connections are handled by asyncio and queries are run in a thread pool, so
+the event loop keeps serving other requests while a query is scored. At most
+max_concurrent queries run at once and at most max_pending more wait for
+their turn; further queries get a 503 response until the backlog drains.
+
+usage:
+    python server.py index_file [--collection cran.all] [--port 8080]
+
+    titles are read from the document store saved with the index (see
+    doc.py), or located in the --collection file
+
+    see python server.py --help for the other options, and loadtest.py for
+    measuring the service
+
+'''
+
+import os
+import asyncio
+import json
+import time
+import argparse
+import unittest
+import concurrent.futures
+from collections import Counter, deque
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+
+import query as q
+import diskindex
+import norvig_spell
+import index as inverted_ind
+import doc as d
+
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+          413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+MODES = ('boolean', 'vector')
+MAX_BODY = 2**16
+
+
+class HTTPError(Exception):
+    ''' an error answered with the given HTTP status'''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SearchService:
+    ''' an HTTP/JSON front end for QueryProcessor over a resident index'''
+
+    def __init__(self, index, collection=None, threads=4, max_concurrent=8, max_pending=64,
+                 max_k=100, speller='norvig'):
+        ''' index is a loaded index; collection, if given, is a
+        doc.Collection whose titles are added to the results'''
+        self.index = index
+        self.collection = collection
+        self.speller = speller
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.max_k = max_k
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.slots = None # semaphore of running queries, created by start
+        self.server = None
+
+        self.started = time.time()
+        self.running = 0
+        self.pending = 0
+        self.responses = Counter() # number of responses by status
+        self.latencies = deque(maxlen=10000) # seconds taken by the latest queries
+
+    def warm(self):
+        ''' load everything that query processing loads lazily, so that the
+        first requests are not slow and the threads do not race to load it'''
+        norvig_spell.getWords()
+        self.index.norms()
+        self.search('flow', 'vector', 1)
+
+    def search(self, text, mode, k):
+        ''' run a query; called in a worker thread'''
+        query_processor = q.QueryProcessor(text, self.index, None, self.speller)
+        if mode == 'boolean':
+            docIDs = query_processor.booleanQuery()
+            results = [{'docID': docID} for docID in docIDs[:k]]
+            total = len(docIDs)
+        else:
+            results = [{'docID': docID, 'score': score} for docID, score in query_processor.vectorQuery(k)]
+            total = len(results)
+        if self.collection is not None:
+            for result in results:
+                doc = self.collection.find(result['docID'])
+                if doc is not None:
+                    result['title'] = doc.title.strip()
+        return {'query': text, 'mode': mode, 'k': k, 'total': total, 'results': results}
+
+    async def handleSearch(self, params):
+        text = params.get('query', params.get('q'))
+        mode = params.get('mode', 'vector')
+        k = params.get('k', 10)
+        if not isinstance(text, str) or text.strip() == '':
+            raise HTTPError(400, 'missing query')
+        if mode not in MODES:
+            raise HTTPError(400, 'mode must be one of %s' % ', '.join(MODES))
+        try:
+            k = int(k)
+        except (TypeError, ValueError):
+            raise HTTPError(400, 'k must be an integer')
+        if k < 1 or k > self.max_k:
+            raise HTTPError(400, 'k must be between 1 and %d' % self.max_k)
+
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, 'too many pending queries')
+        self.pending += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.pending -= 1
+        self.running += 1
+        try:
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, self.search, text, mode, k)
+            self.latencies.append(time.perf_counter() - start)
+            return result
+        finally:
+            self.running -= 1
+            self.slots.release()
+
+    def stats(self):
+        ''' return the service counters, query latencies and cache counters'''
+        latencies = np.array(self.latencies) * 1000
+        latency = {'count': len(latencies)}
+        if len(latencies) > 0:
+            latency.update({'mean_ms': float(latencies.mean()),
+                            'p50_ms': float(np.percentile(latencies, 50)),
+                            'p99_ms': float(np.percentile(latencies, 99)),
+                            'max_ms': float(latencies.max())})
+        return {'uptime_s': time.time() - self.started,
+                'running': self.running,
+                'pending': self.pending,
+                'responses': {str(status): count for status, count in sorted(self.responses.items())},
+                'latency': latency,
+                'result_cache': q.RESULT_CACHE.stats(),
+                'preprocess_cache': q.PREPROCESS_CACHE.stats()}
+
+    async def route(self, method, target, body):
+        ''' return the JSON response to a request'''
+        url = urlsplit(target)
+        if url.path == '/health':
+            return {'status': 'ok', 'nDocs': self.index.nDocs, 'nTerms': len(self.index.dictionary)}
+        if url.path == '/stats':
+            return self.stats()
+        if url.path != '/search':
+            raise HTTPError(404, 'no such path: %s' % url.path)
+
+        if method == 'GET':
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        elif method == 'POST':
+            try:
+                params = json.loads(body.decode('utf-8'))
+            except (UnicodeDecodeError, ValueError):
+                raise HTTPError(400, 'the request body is not valid JSON')
+            if not isinstance(params, dict):
+                raise HTTPError(400, 'the request body must be a JSON object')
+        else:
+            raise HTTPError(405, 'use GET or POST')
+        return await self.handleSearch(params)
+
+    async def handle(self, reader, writer):
+        ''' serve the requests of one connection, keeping it open between
+        requests unless the client asks otherwise'''
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 413, {'error': 'request header too large'}, False)
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                request = lines[0].split()
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                if len(request) != 3:
+                    await self.respond(writer, 400, {'error': 'malformed request line'}, False)
+                    break
+                method, target, version = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY:
+                    await self.respond(writer, 413 if length > MAX_BODY else 400, {'error': 'bad content length'}, False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b''
+
+                try:
+                    status, payload = 200, await self.route(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': '%s: %s' % (type(e).__name__, e)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def respond(self, writer, status, payload, keep_alive):
+        self.responses[status] += 1
+        body = json.dumps(payload).encode('utf-8')
+        head = ('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                'Connection: %s\r\n\r\n' % (status, STATUS[status], len(body), 'keep-alive' if keep_alive else 'close'))
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        ''' start listening, and return the port (useful with port 0)'''
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown()
+
+
+async def serve(service, host, port):
+    ''' run the service until interrupted'''
+    port = await service.start(host, port)
+    print('Serving %d documents on http://%s:%d/' % (service.index.nDocs, host, port))
+    async with service.server:
+        await service.server.serve_forever()
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_service(self):
+        import loadtest
+
+        inverted_index = inverted_ind.InvertedIndex()
+        doc1 = d.Document('1','Dogs','me','Dogs are friendly.')
+        doc2 = d.Document('2','Cats','me','Cats are friendly.')
+        for doc in [doc1, doc2]:
+            inverted_index.indexDoc(doc)
+        inverted_index.sort()
+        collection = d.Collection()
+        for doc in [doc1, doc2]:
+            collection.add(doc)
+        service = SearchService(inverted_index, collection, threads=2)
+        service.warm()
+
+        async def run():
+            port = await service.start('127.0.0.1', 0)
+            connection = loadtest.Connection('127.0.0.1', port)
+            try:
+                status, health = await connection.request('GET', '/health')
+                assert status == 200 and health['nDocs'] == 2
+                status, result = await connection.request('GET', '/search?q=friendly&mode=boolean')
+                assert status == 200
+                assert result['total'] == 2
+                assert [r['docID'] for r in result['results']] == [1, 2]
+                status, result = await connection.request('POST', '/search', {'query': 'dogs', 'k': 1})
+                assert status == 200
+                assert result['results'][0]['docID'] == 1
+                assert result['results'][0]['title'] == 'Dogs'
+                status, result = await connection.request('GET', '/search?q=dogs&mode=fuzzy')
+                assert status == 400
+                status, result = await connection.request('GET', '/search?q=dogs&k=0')
+                assert status == 400
+                status, result = await connection.request('GET', '/nowhere')
+                assert status == 404
+                status, stats = await connection.request('GET', '/stats')
+                assert stats['responses']['200'] == 3
+                assert stats['latency']['count'] == 2
+            finally:
+                await connection.close()
+                await service.close()
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='serve boolean and vector queries over HTTP')
+    parser.add_argument('index_filename')
+    parser.add_argument('--collection', default=None,
+                        help='cran.all, to add titles to the results if the index has no document store')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=4, help='threads running queries')
+    parser.add_argument('--max-concurrent', type=int, default=8, help='queries run at once')
+    parser.add_argument('--max-pending', type=int, default=64, help='queries waiting before requests are refused')
+    parser.add_argument('--speller', default='norvig', choices=sorted(q.QueryProcessor.SPELLERS))
+    args = parser.parse_args()
+
+    collection = None
+    if os.path.exists(d.storeFilename(args.index_filename)):
+        collection = d.Collection.load(d.storeFilename(args.index_filename))
+    elif args.collection is not None:
+        collection = d.Collection.fromFile(args.collection)
+    service = SearchService(diskindex.openIndex(args.index_filename), collection, args.threads,
+                            args.max_concurrent, args.max_pending, speller=args.speller)
+    service.warm()
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
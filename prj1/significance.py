@@ -0,0 +1,142 @@
+'''
+
+Significance tests and confidence intervals over per-query scores
+
+permutationTest is a paired randomization test of two systems scored on the
+same queries: under the null hypothesis the sign of each per-query
+difference is arbitrary, so the p-value is the fraction of random sign
+flips whose mean difference is at least as extreme as the observed one.
+bootstrapCI gives percentile bootstrap confidence intervals of mean scores,
+resampling the queries with replacement.
+
+Both draw thousands of resamples as NumPy matrices, one chunk of resamples
+at a time so that a chunk holds at most CHUNK_ELEMENTS numbers. Each chunk
+has its own random generator, spawned from the seed, so a seed gives the
+same results whether the chunks are computed in this process or in a pool
+of worker processes.
+
+'''
+
+import concurrent.futures
+import unittest
+import numpy as np
+
+CHUNK_ELEMENTS = 2**22 # largest resample matrix, in elements
+
+
+def chunkSizes(n_resamples, n, chunk_size=None):
+    ''' return the number of resamples of each chunk, resampling n scores'''
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // max(n, 1))
+    sizes = [chunk_size] * (n_resamples // chunk_size)
+    if n_resamples % chunk_size:
+        sizes.append(n_resamples % chunk_size)
+    return sizes
+
+
+def permutationChunk(chunk):
+    ''' return the mean of the differences with random signs, for each of
+    the resamples of a chunk'''
+    differences, size, seed = chunk
+    generator = np.random.default_rng(seed)
+    signs = generator.integers(0, 2, (size, len(differences)), dtype=np.int8) * 2 - 1
+    return signs @ differences / len(differences)
+
+
+def bootstrapChunk(chunk):
+    ''' return the mean scores of each system over queries drawn with
+    replacement, for each of the resamples of a chunk'''
+    scores, size, seed = chunk
+    generator = np.random.default_rng(seed)
+    n = scores.shape[1]
+    samples = generator.integers(0, n, (size, n))
+
+    # Count how often each query is drawn by each resample, so the means are
+    # a single matrix product
+    samples += np.arange(size)[:, None] * n
+    counts = np.bincount(samples.ravel(), minlength=size * n).reshape(size, n)
+    return counts @ scores.T / n
+
+
+def resample(function, data, n_resamples, seed=None, chunk_size=None, workers=1):
+    ''' return the statistics of n_resamples resamples of data, computed
+    by function a chunk at a time'''
+    sizes = chunkSizes(n_resamples, data.shape[-1], chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [(data, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    if workers <= 1 or len(chunks) <= 1:
+        return np.concatenate([function(chunk) for chunk in chunks])
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        return np.concatenate(list(executor.map(function, chunks)))
+
+
+def permutationTest(a, b, n_resamples=10000, seed=None, chunk_size=None, workers=1):
+    ''' paired, two-sided randomization test of the per-query scores a and
+    b of two systems. Returns the mean difference a - b and its p-value'''
+    differences = np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)
+    if len(differences) == 0:
+        return 0.0, 1.0
+    observed = differences.mean()
+    means = resample(permutationChunk, differences, n_resamples, seed, chunk_size, workers)
+
+    # Allow for rounding, as the observed difference is one of the resamples
+    extreme = np.count_nonzero(np.abs(means) >= abs(observed) - 1e-12)
+    return float(observed), float((extreme + 1) / (n_resamples + 1))
+
+
+def bootstrapCI(scores, n_resamples=10000, confidence=0.95, seed=None, chunk_size=None, workers=1):
+    ''' percentile bootstrap confidence interval of the mean of per-query
+    scores. scores is an array of the scores of one system, or a 2D array
+    of one row per system scored on the same queries, which are then
+    resampled together. Returns (mean, low, high), with arrays of one value
+    per system for a 2D array'''
+    scores = np.asarray(scores, dtype=np.float64)
+    rows = np.atleast_2d(scores)
+    if rows.shape[1] == 0:
+        means = low = high = np.zeros(len(rows))
+    else:
+        resampled = resample(bootstrapChunk, rows, n_resamples, seed, chunk_size, workers)
+        alpha = (1 - confidence) / 2
+        low, high = np.percentile(resampled, [100 * alpha, 100 * (1 - alpha)], axis=0)
+        means = rows.mean(axis=1)
+    if scores.ndim == 1:
+        return float(means[0]), float(low[0]), float(high[0])
+    return means, low, high
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_permutation(self):
+        generator = np.random.default_rng(0)
+        a = generator.random(50)
+        difference, p = permutationTest(a, a, n_resamples=999, seed=1)
+        assert difference == 0 and p == 1.0
+        difference, p = permutationTest(a + 0.2, a - 0.1, n_resamples=999, seed=1)
+        assert np.isclose(difference, 0.3) and p == 1 / 1000
+
+        # Against every sign flip of a few queries
+        a, b = generator.random(10), generator.random(10)
+        signs = np.array(np.meshgrid(*[[-1, 1]] * 10)).reshape(10, -1).T
+        exact = np.mean(np.abs(signs @ (a - b)) >= abs((a - b).sum()) - 1e-12)
+        difference, p = permutationTest(a, b, n_resamples=20000, seed=2, chunk_size=3000)
+        assert abs(p - exact) < 0.02
+
+    def test_reproducible(self):
+        scores = np.random.default_rng(0).random((2, 40))
+        serial = permutationTest(scores[0], scores[1], n_resamples=2000, seed=3, chunk_size=500)
+        parallel = permutationTest(scores[0], scores[1], n_resamples=2000, seed=3, chunk_size=500, workers=2)
+        assert serial == parallel
+        serial = bootstrapCI(scores, n_resamples=2000, seed=3, chunk_size=500)
+        parallel = bootstrapCI(scores, n_resamples=2000, seed=3, chunk_size=500, workers=2)
+        assert all(np.array_equal(x, y) for x, y in zip(serial, parallel))
+
+    def test_bootstrap(self):
+        scores = np.random.default_rng(0).normal(0.5, 0.1, 400)
+        mean, low, high = bootstrapCI(scores, n_resamples=2000, seed=4)
+        assert low < mean < high
+        # About 1.96 standard errors either side of the mean
+        assert np.isclose(high - low, 2 * 1.96 * scores.std() / 20, rtol=0.15)
+        means, lows, highs = bootstrapCI(np.vstack([scores, scores + 1]), n_resamples=2000, seed=4)
+        assert np.allclose(highs - lows, high - low)
+        assert chunkSizes(10, 4, 3) == [3, 3, 3, 1]
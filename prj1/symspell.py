@@ -0,0 +1,157 @@
+'''
+
+SymSpell-style spelling corrector
+
+A drop-in alternative to norvig_spell.correction. Instead of generating every
+string within two edits of a word, every dictionary word is indexed under the
+strings obtained by deleting up to two of its characters. A misspelled word
+is then looked up under its own deletes, and the few dictionary words found
+are checked with an exact edit distance. The candidates, and so the
+corrections, are the same as the Norvig implementation's.
+
+'''
+
+import unittest
+from collections import Counter
+
+import norvig_spell
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+def deletes(word, max_distance):
+    ''' all strings obtained by deleting up to max_distance characters from
+    word, including word itself'''
+    result = {word}
+    edits = {word}
+    for _ in range(max_distance):
+        edits = set(e[:i] + e[i + 1:] for e in edits for i in range(len(e)))
+        result.update(edits)
+    return result
+
+def distance(source, target):
+    ''' the least number of edits turning source into target, where an edit
+    deletes a character, transposes two adjacent characters, or replaces or
+    inserts a letter (the edits of norvig_spell.edits1). This is the
+    Damerau-Levenshtein distance, computed with the Lowrance-Wagner
+    algorithm'''
+    n = len(source)
+    m = len(target)
+    infinity = n + m + 1
+
+    # Cost of inserting (or replacing by) each character of target, only
+    # letters can be inserted
+    insert = [1 if c in LETTERS else infinity for c in target]
+
+    d = [[infinity] * (m + 2) for _ in range(n + 2)]
+    d[1][1] = 0
+    for i in range(1, n + 1):
+        d[i + 1][1] = i
+    for j in range(1, m + 1):
+        d[1][j + 1] = d[1][j] + insert[j - 1]
+
+    last_row = {}
+    for i in range(1, n + 1):
+        last_col = 0
+        for j in range(1, m + 1):
+            k = last_row.get(target[j - 1], 0)
+            l = last_col
+            if source[i - 1] == target[j - 1]:
+                cost = 0
+                last_col = j
+            else:
+                cost = insert[j - 1]
+            transpose = d[k][l] + (i - k - 1) + 1 + sum(insert[l:j - 1])
+            d[i + 1][j + 1] = min(d[i][j] + cost, d[i + 1][j] + insert[j - 1],
+                                  d[i][j + 1] + 1, transpose)
+        last_row[source[i - 1]] = i
+    return d[n + 1][m + 1]
+
+
+class SymSpell:
+    ''' symmetric delete spelling corrector over a Counter of word counts'''
+
+    def __init__(self, words, max_distance=2):
+        self.words = words
+        self.total = sum(words.values())
+        self.max_distance = max_distance
+        self.deletes = {} # maps each delete to the words it comes from
+        for word in words:
+            for delete in deletes(word, max_distance):
+                self.deletes.setdefault(delete, []).append(word)
+
+    def P(self, word):
+        "Probability of `word`."
+        return self.words[word] / self.total
+
+    def correction(self, word):
+        "Most probable spelling correction for word."
+        return max(sorted(self.candidates(word)), key=self.P)
+
+    def candidates(self, word):
+        "Generate possible spelling corrections for word."
+        if word in self.words:
+            return {word}
+
+        # Words one edit away are cheap to generate directly
+        known = set(w for w in norvig_spell.edits1(word) if w in self.words)
+        if known:
+            return known
+
+        suggestions = set()
+        for delete in deletes(word, self.max_distance):
+            suggestions.update(self.deletes.get(delete, ()))
+        known = set(w for w in suggestions if distance(word, w) <= self.max_distance)
+        return known or {word}
+
+
+_symspell = None
+
+def getSymSpell():
+    ''' return a SymSpell over the dictionary of norvig_spell, built again
+    whenever norvig_spell's dictionary is replaced (see setWords)'''
+    global _symspell
+    words = norvig_spell.getWords()
+    if _symspell is None or _symspell.words is not words:
+        _symspell = SymSpell(words)
+    return _symspell
+
+def correction(word):
+    "Most probable spelling correction for word."
+    return getSymSpell().correction(word)
+
+
+class test(unittest.TestCase):
+    ''' test your code thoroughly. put the testing cases here'''
+
+    def test_deletes(self):
+        assert deletes('abc', 1) == {'abc', 'ab', 'ac', 'bc'}
+        assert '' not in deletes('abc', 2)
+        assert 'a' in deletes('abc', 2)
+
+    def test_distance(self):
+        assert distance('wing', 'wing') == 0
+        assert distance('wnig', 'wing') == 1
+        assert distance('wng', 'wing') == 1
+        assert distance('wings', 'wing') == 1
+        assert distance('ca', 'abc') == 2
+        assert distance('retangulor', 'rectangular') == 2
+        assert distance('flow', 'flux') == 2
+        assert distance('abc', 'ab1') > 2
+
+    def test_small_dictionary(self):
+        spell = SymSpell(Counter({'wing': 5, 'wind': 2, 'flow': 3, 'flux': 1}))
+        assert spell.correction('wing') == 'wing'
+        assert spell.correction('wnig') == 'wing'
+        assert spell.correction('wixd') == 'wind'
+        assert spell.correction('flxx') == 'flux'
+        assert spell.correction('zzzzzz') == 'zzzzzz'
+
+    # Compare with the Norvig implementation on its own dictionary
+    def test_norvig_parity(self):
+        words = ['retangulor', 'magntohydodynamic', 'aerodinamic', 'slipstreem',
+                 'boundary', 'laminr', 'turbulnt', 'presure', 'hypersnic',
+                 'ogiv', 'wng', 'hieght', 'ffect', 'xq', '.', 'speling']
+        spell = getSymSpell()
+        for word in words:
+            assert spell.candidates(word) == set(norvig_spell.candidates(word))
+            assert norvig_spell.P(spell.correction(word)) == norvig_spell.P(norvig_spell.correction(word))
@@ -2,59 +2,88 @@
    utility functions for processing terms
 
    shared by both indexing and query processing
-    
+
 '''
+import os
 import string
+import functools
 import nltk
 from nltk.corpus import stopwords
 from nltk.stem import SnowballStemmer
 from nltk.tokenize import word_tokenize
-    
+
+STOPWORD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stopwords')
+
+
+class Analyzer:
+    ''' the tokenize, stopword removal and stemming pipeline. The stopword
+    list and the stemmer are loaded once, and the result for each distinct
+    token is memoized in a bounded LRU cache'''
+
+    def __init__(self, stopword_file=STOPWORD_FILE, cache_size=2**16):
+        f = open(stopword_file, 'r')
+        self.stop_words = f.read()
+        f.close()
+        self.stemmer = SnowballStemmer('english')
+        self.analyzeToken = functools.lru_cache(maxsize=cache_size)(self.analyzeTokenUncached)
+
+    def isStopWord(self, word):
+        ''' return true/false'''
+        # Words are matched against the text of the stopword file, so any
+        # substring of it (e.g. 'use' from 'because') counts as a stopword.
+        # Kept as is so that existing indexes stay valid
+        if word not in self.stop_words and word not in string.punctuation:
+            return False
+        else:
+            return True
+
+    def stemming(self, word):
+        ''' return the stem'''
+        return self.stemmer.stem(word)
+
+    def analyzeTokenUncached(self, token):
+        ''' return the stem of a token, or None for a stopword'''
+        if self.isStopWord(token):
+            return None
+        return self.stemming(token)
+
+    def analyze(self, doc):
+        ''' return the list of stemmed tokens of doc, without stopwords'''
+        analyzed = map(self.analyzeToken, tokenize(doc))
+        return [token for token in analyzed if token is not None]
+
+    def analyze_many(self, docs):
+        ''' analyze each of the given texts, returning a list of token lists'''
+        analyze = self.analyze
+        return [analyze(doc) for doc in docs]
+
+
+_analyzer = None
+
+def getAnalyzer():
+    ''' return the Analyzer shared by indexing and query processing'''
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = Analyzer()
+    return _analyzer
+
 def isStopWord(word):
-    ''' using the NLTK functions, return true/false'''    
-    
-    f = open('stopwords', 'r')
-    stop_words = f.read()
-    f.close()
-    
-#    translation = word.maketrans('','',string.punctuation) # For edge cases where whole word is punctuation
-#    if word not in stop_words and word not in string.punctuation and word.translate(translation) != '':
-	
-    if word not in stop_words and word not in string.punctuation:
-        return False
-    else:
-        return True
+    ''' using the NLTK functions, return true/false'''
+    return getAnalyzer().isStopWord(word)
 
 
 def stemming(word):
-    ''' return the stem, using a NLTK stemmer. check the project description 
-    for installing and using it'''    
-    stemmer = SnowballStemmer('english')
-    return stemmer.stem(word)
+    ''' return the stem, using a NLTK stemmer. check the project description
+    for installing and using it'''
+    return getAnalyzer().stemming(word)
 
 def tokenize(doc):
     '''tokenizes the document'''
     tokens = word_tokenize((doc).lower())
-    
+
     return tokens
 
 def preprocess(doc):
-    '''returns list of tokens that has been stemmed and stopwords have been 
-    removed'''       
-    
-    # Tokenize the documents, then filter stop-words and stem tokens
-    tokens = tokenize(doc)
-    processed_tokens = []
-        
-    # Strip the '' off of each token so we can compare with stopword list
-    for token in tokens:
-        token = token[1:-1]
-        
-    for token in tokens:
-        if isStopWord(token) is True:
-            continue
-        else:
-            stemmed_token = stemming(token)
-            processed_tokens.append(stemmed_token)
-        
-    return processed_tokens
\ No newline at end of file
+    '''returns list of tokens that has been stemmed and stopwords have been
+    removed'''
+    return getAnalyzer().analyze(doc)